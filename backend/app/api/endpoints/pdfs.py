@@ -1,25 +1,135 @@
+import asyncio
+import hmac
 import os
-import tempfile
-import shutil
-from typing import List
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Form
-from fastapi.responses import JSONResponse
-import aiofiles
+import zipfile
+from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Form, Query, Header
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from ...core.config import settings
-from ...models.schemas import PDFResult, ProcessingResponse, SendRequest, SendResponse
-from ...processing.pdf_processor import process_pdf
-from ...processing.soap_service import enviar_dados_soap
+from ...core.metrics import FILA_EXECUTOR
+from ...core.profiling import FORMATOS, amostragem_periodica, caminho_perfil, listar_perfis
+from ...models.schemas import (
+    PDFResult, ProcessingResponse, SendRequest, SendResponse, SendStatusResponse, LedgerEntry, LedgerPage
+)
+from ...processing.pdf_processor import normalizar_campos
+from ...processing.isolation import processar_com_prazo
+from ...processing.errors import InvalidDataError
+from ...processing.extraction_profiles import obter_perfil
+from ...processing.soap_service import enviar_dados_soap, validar_envio_local, STATUS_REJEITADO
+from ...processing.send_outbox import outbox, STATUS_PENDENTE
+from ...processing.idpgto_resolver import idpgto_resolver
+from ...processing.processing_ledger import processing_ledger
+from ...processing.duplicate_index import duplicate_index
+from ...processing.location_hints import location_hints
 
 router = APIRouter()
 
 # Executor para processamento paralelo
 executor = ThreadPoolExecutor(max_workers=settings.MAX_WORKERS)
 
+def _fila_documentos() -> dict:
+    """Documentos aguardando uma thread livre do executor (para o medidor FILA_EXECUTOR)."""
+    return {("documentos",): executor._work_queue.qsize()}
+
+FILA_EXECUTOR.observar_funcao(_fila_documentos)
+
+def _registrar_resultado(result: dict, filename: str) -> PDFResult:
+    """Marca boletos repetidos (um a um, com multi_boleto), grava o resultado no ledger e converte para PDFResult."""
+    duplicate_index.marcar_resultado(result)
+    processing_ledger.registrar(result)
+    return PDFResult(
+        filename=filename,
+        id_fluxus=result.get("id_fluxus"),
+        barcode=result.get("barcode"),
+        barcode_source=result.get("barcode_source", "texto"),
+        cnpj=result.get("cnpj"),
+        fornecedor=result.get("fornecedor"),
+        valor=result.get("valor"),
+        vencimento=result.get("vencimento"),
+        idpgto=result.get("idpgto"),
+        status=result.get("status", "Processado"),
+        error=result.get("error"),
+        content_hash=result.get("content_hash"),
+        duplicate=result.get("duplicate", False),
+        duplicate_of=result.get("duplicate_of"),
+        boletos=result.get("boletos"),
+        profile=result.get("profile"),
+        budget_exhausted=result.get("budget_exhausted", False),
+        trace=result.get("trace"),
+        profiling=result.get("profiling")
+    )
+
+def _processar_documento(content, filename: str, multi_boleto: bool = False, campos=None, perfil: Optional[str] = None,
+                         trace: bool = False, formato_perfil: Optional[str] = None) -> dict:
+    """
+    process_pdf com o prazo de DOCUMENT_TIMEOUT (processo isolado). Com `formato_perfil`, o
+    documento é perfilado no processo que o executa (perfil salvo em PROFILING_DIR), sob o mesmo prazo.
+    """
+    return processar_com_prazo(content, filename, multi_boleto, campos, perfil, trace, formato_perfil)
+
+def _processar_membro_zip(zf: zipfile.ZipFile, info: zipfile.ZipInfo, multi_boleto: bool = False, campos=None,
+                          perfil: Optional[str] = None, trace: bool = False, formato_perfil: Optional[str] = None) -> dict:
+    """Lê um membro do ZIP direto para a memória (sem extrair em disco) e processa."""
+    return _processar_documento(zf.read(info), info.filename, multi_boleto, campos, perfil, trace, formato_perfil)
+
+def _exigir_admin(x_admin_token: Optional[str]):
+    """403 se ADMIN_TOKEN não estiver configurado ou o cabeçalho X-Admin-Token não conferir."""
+    if not settings.ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Acesso administrativo negado")
+
+def _validar_profiling(profiling: Optional[str], x_admin_token: Optional[str]) -> Optional[str]:
+    """Formato do profiling pedido (exige X-Admin-Token) ou None; 400 se o formato for desconhecido."""
+    if profiling is None:
+        return None
+    _exigir_admin(x_admin_token)
+    if profiling not in FORMATOS:
+        raise HTTPException(status_code=400, detail=f"Formato de profiling desconhecido: {profiling} (use {', '.join(FORMATOS)})")
+    return profiling
+
+def _formato_perfil(profiling: Optional[str]) -> Optional[str]:
+    """Formato pedido ou, para um a cada PROFILING_EVERY_N documentos, o formato padrão."""
+    if profiling is not None:
+        return profiling
+    return settings.PROFILING_FORMAT if amostragem_periodica.sortear() else None
+
+def _validar_campos(fields: Optional[str]):
+    """Converte o parâmetro `fields` (separado por vírgulas) ou responde 400 se houver campo desconhecido."""
+    try:
+        return normalizar_campos(fields)
+    except InvalidDataError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _validar_perfil(profile: Optional[str]) -> str:
+    """Nome do perfil de extração pedido (padrão: EXTRACTION_STRATEGY) ou 400 se desconhecido."""
+    try:
+        return obter_perfil(profile).nome
+    except InvalidDataError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+CAMPOS_DESCRICAO = "Campos a extrair, separados por vírgula (ex.: barcode,valor). Padrão: todos."
+PERFIL_DESCRICAO = "Perfil de extração: fast, balanced ou complete. Padrão: EXTRACTION_STRATEGY."
+TRACE_DESCRICAO = "Inclui no resultado (e no ledger) o trace do processamento de cada documento"
+PROFILING_DESCRICAO = "Perfila o processamento de cada documento (collapsed ou speedscope). Requer X-Admin-Token."
+
 @router.post("/upload/", response_model=ProcessingResponse)
-async def upload_pdfs(files: List[UploadFile] = File(...)):
-    """Recebe arquivos PDF para processamento."""
+async def upload_pdfs(
+    files: List[UploadFile] = File(...),
+    multi_boleto: bool = Query(False, description="Retorna todos os boletos do PDF (um por página, por exemplo)"),
+    fields: Optional[str] = Query(None, description=CAMPOS_DESCRICAO),
+    profile: Optional[str] = Query(None, description=PERFIL_DESCRICAO),
+    trace: bool = Query(False, description=TRACE_DESCRICAO),
+    profiling: Optional[str] = Query(None, description=PROFILING_DESCRICAO),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Recebe arquivos PDF para processamento. Com `fields`, só as etapas necessárias são executadas;
+    `profile` escolhe o equilíbrio entre latência e recall (e o orçamento de tempo por documento).
+    """
+    campos = _validar_campos(fields)
+    perfil = _validar_perfil(profile)
+    profiling = _validar_profiling(profiling, x_admin_token)
     if not files:
         return JSONResponse(
             status_code=400,
@@ -27,8 +137,7 @@ async def upload_pdfs(files: List[UploadFile] = File(...)):
         )
     
     results = []
-    processed_files = []
-    
+
     # Processar arquivos em paralelo
     future_to_file = {}
     
@@ -41,18 +150,12 @@ async def upload_pdfs(files: List[UploadFile] = File(...)):
             ))
             continue
             
-        # Criar arquivo temporário
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
         try:
-            # Ler e salvar o arquivo
+            # O conteúdo segue em memória até o processador (sem cópia em disco)
             content = await file.read()
-            temp_file.write(content)
-            temp_file.close()
-            
-            # Adicionar à lista para processamento paralelo
-            future = executor.submit(process_pdf, content, file.filename)
+            future = executor.submit(_processar_documento, content, file.filename, multi_boleto, campos, perfil, trace,
+                                     _formato_perfil(profiling))
             future_to_file[future] = file.filename
-            processed_files.append(temp_file.name)
         except Exception as e:
             results.append(PDFResult(
                 filename=file.filename,
@@ -65,20 +168,7 @@ async def upload_pdfs(files: List[UploadFile] = File(...)):
         filename = future_to_file[future]
         try:
             result = future.result()
-            # Converter para o modelo PDFResult
-            pdf_result = PDFResult(
-                filename=filename,
-                id_fluxus=result.get("id_fluxus"),
-                barcode=result.get("barcode"),
-                barcode_source=result.get("barcode_source", "texto"),
-                cnpj=result.get("cnpj"),
-                fornecedor=result.get("fornecedor"),
-                valor=result.get("valor"),
-                vencimento=result.get("vencimento"),
-                idpgto=result.get("idpgto"),
-                status=result.get("status", "Processado"),
-                error=result.get("error")
-            )
+            pdf_result = _registrar_resultado(result, filename)
             results.append(pdf_result)
         except Exception as e:
             results.append(PDFResult(
@@ -87,38 +177,204 @@ async def upload_pdfs(files: List[UploadFile] = File(...)):
                 error=f"Erro no processamento: {str(e)}"
             ))
     
-    # Limpar arquivos temporários
-    for temp_path in processed_files:
-        if os.path.exists(temp_path):
-            os.unlink(temp_path)
-    
     return ProcessingResponse(
         success=True,
         message=f"Processados {len(results)} arquivos",
         results=results
     )
 
-@router.post("/send/", response_model=SendResponse)
+@router.post("/upload-zip/")
+async def upload_zip(
+    file: UploadFile = File(...),
+    multi_boleto: bool = Query(False, description="Retorna todos os boletos de cada PDF"),
+    fields: Optional[str] = Query(None, description=CAMPOS_DESCRICAO),
+    profile: Optional[str] = Query(None, description=PERFIL_DESCRICAO),
+    trace: bool = Query(False, description=TRACE_DESCRICAO),
+    profiling: Optional[str] = Query(None, description=PROFILING_DESCRICAO),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Recebe um ZIP com PDFs e devolve os resultados em streaming (NDJSON, um PDFResult por linha),
+    na ordem em que cada membro termina de ser processado.
+    """
+    campos = _validar_campos(fields)
+    perfil = _validar_perfil(profile)
+    profiling = _validar_profiling(profiling, x_admin_token)
+    try:
+        zf = zipfile.ZipFile(file.file)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Arquivo ZIP inválido")
+
+    infos = [info for info in zf.infolist() if not info.is_dir()]
+    limite_bytes = settings.MAX_ZIP_MEMBER_MB * 1024 * 1024
+    # Membros em processamento ao mesmo tempo: limita a memória usada, independente do tamanho do ZIP
+    max_em_andamento = settings.MAX_WORKERS * 2
+
+    async def gerar_resultados():
+        loop = asyncio.get_running_loop()
+        pendentes = {}
+        try:
+            for info in infos:
+                if not info.filename.lower().endswith(".pdf"):
+                    erro = PDFResult(filename=info.filename, status="Erro", error="Formato inválido. Apenas PDFs são aceitos.")
+                    yield erro.json() + "\n"
+                    continue
+                if info.file_size > limite_bytes:
+                    erro = PDFResult(filename=info.filename, status="Erro",
+                                     error=f"Arquivo excede o limite de {settings.MAX_ZIP_MEMBER_MB} MB.")
+                    yield erro.json() + "\n"
+                    continue
+
+                while len(pendentes) >= max_em_andamento:
+                    prontos, _ = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+                    for future in prontos:
+                        yield _resultado_membro(future, pendentes.pop(future)).json() + "\n"
+
+                future = loop.run_in_executor(executor, _processar_membro_zip, zf, info, multi_boleto, campos, perfil, trace,
+                                              _formato_perfil(profiling))
+                pendentes[future] = info.filename
+
+            while pendentes:
+                prontos, _ = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+                for future in prontos:
+                    yield _resultado_membro(future, pendentes.pop(future)).json() + "\n"
+        finally:
+            zf.close()
+            await file.close()
+
+    return StreamingResponse(gerar_resultados(), media_type="application/x-ndjson")
+
+def _resultado_membro(future, filename: str) -> PDFResult:
+    try:
+        return _registrar_resultado(future.result(), filename)
+    except Exception as e:
+        return PDFResult(filename=filename, status="Erro", error=f"Erro no processamento: {str(e)}")
+
+@router.get("/ledger/", response_model=LedgerPage)
+async def query_ledger(
+    id_fluxus: Optional[str] = None,
+    barcode: Optional[str] = None,
+    cnpj: Optional[str] = None,
+    content_hash: Optional[str] = None,
+    min_duration_ms: Optional[float] = Query(None, description="Só documentos processados com trace que levaram ao menos esse tempo"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[int] = None
+):
+    """Consulta os resultados de processamento já registrados (mais recentes primeiro)."""
+    registros, next_cursor = processing_ledger.consultar(
+        {"id_fluxus": id_fluxus, "barcode": barcode, "cnpj": cnpj, "content_hash": content_hash},
+        limit=limit,
+        cursor=cursor,
+        min_duracao_ms=min_duration_ms
+    )
+    return LedgerPage(
+        items=[LedgerEntry(**registro) for registro in registros],
+        next_cursor=next_cursor
+    )
+
+@router.get("/profiles/")
+async def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """Perfis salvos em PROFILING_DIR (uso administrativo)."""
+    _exigir_admin(x_admin_token)
+    return listar_perfis()
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Baixa um perfil salvo (abrir no speedscope.app ou no flamegraph.pl)."""
+    _exigir_admin(x_admin_token)
+    caminho = caminho_perfil(profile_id)
+    if caminho is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return FileResponse(caminho, filename=os.path.basename(caminho))
+
+@router.post("/send/", response_model=SendResponse, status_code=202)
 async def send_data(data: SendRequest):
-    """Envia dados para o sistema via SOAP."""
+    """Registra o envio na fila local; o despachante envia ao TOTVS em segundo plano."""
     if not data.id_fluxus or not data.barcode:
         return JSONResponse(
             status_code=400,
             content={
-                "success": False, 
+                "success": False,
                 "message": "ID.Fluxus e código de barras são obrigatórios",
                 "logs": []
             }
         )
-    
-    success, message, logs = enviar_dados_soap(
+
+    # Rejeita localmente códigos/IDPGTO inválidos sem ocupar a fila nem o TOTVS.
+    # Com apenas o CNPJ, o IDPGTO é resolvido pelo despachante (a consulta ao TOTVS é bloqueante)
+    logs = []
+    erro, _, _ = validar_envio_local(data.barcode, data.idpgto, data.cnpj, data.barcode_source, logs,
+                                     resolver_cnpj=False, tag=data.tag)
+    if erro:
+        logs.append(f"ERRO: {erro}")
+        return JSONResponse(
+            status_code=400,
+            content={
+                "success": False,
+                "message": erro,
+                "logs": logs,
+                "status": STATUS_REJEITADO
+            }
+        )
+
+    send_id = outbox.enfileirar(
         data.id_fluxus,
         data.barcode,
         data.idpgto,
         data.cnpj,
-        data.barcode_source
+        data.barcode_source,
+        force=data.force,
+        tag=data.tag
+    )
+
+    return SendResponse(
+        success=True,
+        message="Envio registrado na fila. Consulte o status pelo send_id.",
+        logs=[f"Envio {send_id} enfileirado para IDLAN={data.id_fluxus}"],
+        send_id=send_id,
+        status=STATUS_PENDENTE
+    )
+
+@router.get("/send/{send_id}", response_model=SendStatusResponse)
+async def send_status(send_id: str):
+    """Retorna o estado de um envio da fila, com o resultado final e os logs."""
+    envio = outbox.obter(send_id)
+    if envio is None:
+        raise HTTPException(status_code=404, detail="Envio não encontrado")
+
+    return SendStatusResponse(
+        send_id=envio["send_id"],
+        status=envio["status"],
+        success=envio["success"],
+        message=envio["message"],
+        logs=envio["logs"],
+        tentativas=envio["tentativas"],
+        criado_em=envio["criado_em"],
+        atualizado_em=envio["atualizado_em"]
+    )
+
+def _enviar_item(item: SendRequest) -> SendResponse:
+    """Valida e envia um item do batch ao TOTVS (bloqueante: roda fora do loop de eventos)."""
+    logs = []
+    erro, _, _ = validar_envio_local(item.barcode, item.idpgto, item.cnpj, item.barcode_source, logs, tag=item.tag)
+    if erro:
+        logs.append(f"ERRO: {erro}")
+        return SendResponse(
+            success=False,
+            message=erro,
+            logs=logs,
+            status=STATUS_REJEITADO
+        )
+
+    success, message, logs = enviar_dados_soap(
+        item.id_fluxus,
+        item.barcode,
+        item.idpgto,
+        item.cnpj,
+        item.barcode_source,
+        force=item.force,
+        tag=item.tag
     )
-    
     return SendResponse(
         success=success,
         message=message,
@@ -127,22 +383,20 @@ async def send_data(data: SendRequest):
 
 @router.post("/batch-send/", response_model=List[SendResponse])
 async def batch_send(items: List[SendRequest]):
-    """Envia múltiplos documentos em batch."""
+    """Envia múltiplos documentos em batch. Itens inválidos são rejeitados localmente, sem chamar o TOTVS."""
+    loop = asyncio.get_running_loop()
     results = []
-    
     for item in items:
-        success, message, logs = enviar_dados_soap(
-            item.id_fluxus,
-            item.barcode,
-            item.idpgto,
-            item.cnpj,
-            item.barcode_source
-        )
-        
-        results.append(SendResponse(
-            success=success,
-            message=message,
-            logs=logs
-        ))
-    
-    return results
\ No newline at end of file
+        # Resolução do IDPGTO e SaveRecord usam requests: no executor padrão, não no executor de documentos
+        results.append(await loop.run_in_executor(None, _enviar_item, item))
+    return results
+
+@router.get("/idpgto/stats")
+async def idpgto_stats():
+    """Contadores do resolvedor de IDPGTO (acertos por camada, ausências e latência do TOTVS)."""
+    return idpgto_resolver.estatisticas()
+
+@router.get("/location-hints/stats")
+async def location_hints_stats():
+    """Taxa de acerto das dicas de localização do código de barras por fornecedor."""
+    return location_hints.estatisticas()
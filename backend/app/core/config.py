@@ -6,6 +6,9 @@ from dotenv import load_dotenv
 env_path = Path(".") / ".env"
 load_dotenv(dotenv_path=env_path)
 
+# Diretório raiz do backend (onde ficam main.py e data/)
+BASE_DIR = Path(__file__).resolve().parents[2]
+
 class Settings:
     API_V1_STR: str = "/api/v1"
     PROJECT_NAME: str = "Sistema de Leitura de Boletos"
@@ -21,15 +24,106 @@ class Settings:
     # Configurações de OCR
     TESSERACT_CMD: str = os.getenv("TESSERACT_CMD", "tesseract")
     OCR_DPI: int = int(os.getenv("OCR_DPI", "300"))
+    # Motor de OCR: auto (tesserocr se instalado, senão pytesseract), tesserocr ou pytesseract.
+    # OCR_POOL_SIZE = handles do tesserocr por processo (0 = MAX_WORKERS); TESSDATA_DIR vazio = padrão do Tesseract
+    OCR_ENGINE: str = os.getenv("OCR_ENGINE", "auto")
+    OCR_POOL_SIZE: int = int(os.getenv("OCR_POOL_SIZE", "0"))
+    TESSDATA_DIR: str = os.getenv("TESSDATA_DIR", "")
+    # Renderização das páginas: auto, poppler ou pdfium. O poppler roda um subprocesso por chamada
+    # (paralelo e interrompido por STAGE_TIMEOUT); o pdfium renderiza no processo, uma chamada por vez
+    # e sem interrupção, então só é seguro com DOCUMENT_TIMEOUT > 0 (um processo isolado por documento).
+    # "auto" usa o pdfium com DOCUMENT_TIMEOUT > 0 ou sem o poppler instalado; senão, o poppler.
+    RASTERIZER: str = os.getenv("RASTERIZER", "auto")
+    
+    # Lista de fornecedores (CNPJ/CPF -> IDPGTO)
+    CNPJ_CSV_PATH: str = os.getenv("CNPJ_CSV_PATH", str(BASE_DIR / "data" / "Listas_Fornecedores1.csv"))
+    CNPJ_INDEX_PATH: str = os.getenv("CNPJ_INDEX_PATH", os.path.join(CACHE_DIR, "cnpj_index.bin"))
     
     # Configurações de processamento
     MAX_WORKERS: int = int(os.getenv("MAX_WORKERS", "4"))
+    # Processos usados para dividir as páginas no modo multi-boleto
+    PAGE_WORKERS: int = int(os.getenv("PAGE_WORKERS", str(MAX_WORKERS)))
+    # Perfil de extração padrão (fast, balanced ou complete) e orçamento de tempo por documento (0 = sem limite)
     EXTRACTION_STRATEGY: str = os.getenv("EXTRACTION_STRATEGY", "complete")
+    EXTRACTION_BUDGET_FAST: float = float(os.getenv("EXTRACTION_BUDGET_FAST", "5"))  # segundos
+    EXTRACTION_BUDGET_BALANCED: float = float(os.getenv("EXTRACTION_BUDGET_BALANCED", "20"))  # segundos
+    EXTRACTION_BUDGET_COMPLETE: float = float(os.getenv("EXTRACTION_BUDGET_COMPLETE", "120"))  # segundos
+    MAX_ZIP_MEMBER_MB: int = int(os.getenv("MAX_ZIP_MEMBER_MB", "100"))
+    # Classificador de páginas: pyzbar/OCR só nas páginas candidatas a boleto
+    PAGE_CLASSIFIER: bool = os.getenv("PAGE_CLASSIFIER", "true").lower() == "true"
+    PAGE_CLASSIFIER_DPI: int = int(os.getenv("PAGE_CLASSIFIER_DPI", "72"))
+    # Camada de texto: auto (motor calibrado por benchmarks/text_extractors.py; sem calibração, pdfplumber),
+    # pdfplumber, pdfminer, pdfminer_raw ou pdfium
+    TEXT_EXTRACTOR: str = os.getenv("TEXT_EXTRACTOR", "auto")
+    TEXT_EXTRACTOR_CALIBRATION_PATH: str = os.getenv("TEXT_EXTRACTOR_CALIBRATION_PATH", os.path.join(CACHE_DIR, "text_extractor.json"))
+    # Dicas de localização do código por fornecedor (página/região do último documento)
+    LOCATION_HINTS: bool = os.getenv("LOCATION_HINTS", "true").lower() == "true"
+    LOCATION_HINTS_DB_PATH: str = os.getenv("LOCATION_HINTS_DB_PATH", os.path.join(CACHE_DIR, "location_hints.db"))
+    LOCATION_HINT_MARGIN: float = float(os.getenv("LOCATION_HINT_MARGIN", "0.05"))  # fração da página
+    # PDFs acima deste tamanho são mantidos em disco em vez de memória (0 = sempre em memória)
+    PDF_SPOOL_THRESHOLD_MB: int = int(os.getenv("PDF_SPOOL_THRESHOLD_MB", "50"))
+    # Memória: imagens renderizadas ao mesmo tempo por documento e RSS máximo do processo (0 = sem limite).
+    # Acima do orçamento as páginas são renderizadas uma a uma e, se preciso, com DPI menor (até MEMORY_MIN_DPI);
+    # com o RSS acima do limite, o documento espera MEMORY_DEFER_SECONDS e, persistindo, é adiado.
+    MEMORY_BUDGET_MB: int = int(os.getenv("MEMORY_BUDGET_MB", "256"))
+    MEMORY_RSS_LIMIT_MB: int = int(os.getenv("MEMORY_RSS_LIMIT_MB", "0"))
+    MEMORY_MIN_DPI: int = int(os.getenv("MEMORY_MIN_DPI", "150"))
+    MEMORY_DEFER_SECONDS: float = float(os.getenv("MEMORY_DEFER_SECONDS", "10"))
+    MEMORY_TRACEMALLOC: bool = os.getenv("MEMORY_TRACEMALLOC", "false").lower() == "true"
+    # Prazos: por documento, em processo isolado encerrado ao estourar (0 = sem prazo, roda na thread),
+    # e por chamada ao poppler/tesseract, cujo subprocesso é encerrado (0 = sem prazo)
+    DOCUMENT_TIMEOUT: float = float(os.getenv("DOCUMENT_TIMEOUT", "0"))  # segundos
+    STAGE_TIMEOUT: float = float(os.getenv("STAGE_TIMEOUT", "120"))  # segundos
     
     # Configurações SOAP
     SOAP_URL: str = os.getenv("SOAP_URL", "http://10.131.0.13:8051/wsDataServer/IwsDataServer")
     SOAP_USERNAME: str = os.getenv("SOAP_USERNAME", "douglas.vermil")
     SOAP_PASSWORD: str = os.getenv("SOAP_PASSWORD", "Chouest123@")
+    SOAP_TIMEOUT: float = float(os.getenv("SOAP_TIMEOUT", "30"))
+
+    # Consulta de IDPGTO no TOTVS para CNPJs ausentes do CSV
+    IDPGTO_TOTVS_LOOKUP: bool = os.getenv("IDPGTO_TOTVS_LOOKUP", "true").lower() == "true"
+    IDPGTO_DATASERVER: str = os.getenv("IDPGTO_DATASERVER", "FinDadosPgtoDataBR")
+    IDPGTO_FILTRO: str = os.getenv("IDPGTO_FILTRO", "FDADOSPGTO.CODCOLIGADA=4 AND FCFO.CGCCFO='{cnpj}'")
+    IDPGTO_CACHE_TTL: float = float(os.getenv("IDPGTO_CACHE_TTL", "3600"))  # segundos
+    IDPGTO_NEGATIVE_TTL: float = float(os.getenv("IDPGTO_NEGATIVE_TTL", "600"))  # segundos
+
+    # Fila local (outbox) de envios SOAP
+    OUTBOX_DB_PATH: str = os.getenv("OUTBOX_DB_PATH", os.path.join(CACHE_DIR, "outbox.db"))
+    SOAP_MAX_CONCURRENCY: int = int(os.getenv("SOAP_MAX_CONCURRENCY", "2"))
+    SOAP_RATE_LIMIT: float = float(os.getenv("SOAP_RATE_LIMIT", "5"))  # envios por segundo
+    OUTBOX_POLL_INTERVAL: float = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))
+
+    # Registro de envios já realizados (evita SaveRecord duplicados)
+    SEND_LEDGER_DB_PATH: str = os.getenv("SEND_LEDGER_DB_PATH", os.path.join(CACHE_DIR, "send_ledger.db"))
+    SEND_LEDGER_WINDOW_HOURS: float = float(os.getenv("SEND_LEDGER_WINDOW_HOURS", "72"))
+
+    # Registro local dos resultados de processamento
+    PROCESSING_LEDGER_DB_PATH: str = os.getenv("PROCESSING_LEDGER_DB_PATH", os.path.join(CACHE_DIR, "processing_ledger.db"))
+
+    # Detecção de boletos repetidos entre uploads
+    DUPLICATE_INDEX_DB_PATH: str = os.getenv("DUPLICATE_INDEX_DB_PATH", os.path.join(CACHE_DIR, "duplicate_index.db"))
+    DUPLICATE_BLOOM_CAPACITY: int = int(os.getenv("DUPLICATE_BLOOM_CAPACITY", "5000000"))
+    DUPLICATE_BLOOM_ERROR_RATE: float = float(os.getenv("DUPLICATE_BLOOM_ERROR_RATE", "0.001"))
+    DUPLICATE_RECENT_SIZE: int = int(os.getenv("DUPLICATE_RECENT_SIZE", "100000"))
+
+    # Ingestão por pastas monitoradas (separadas por os.pathsep)
+    WATCH_FOLDERS: str = os.getenv("WATCH_FOLDERS", "")
+    WATCH_DONE_SUBDIR: str = os.getenv("WATCH_DONE_SUBDIR", "processados")
+    WATCH_ERROR_SUBDIR: str = os.getenv("WATCH_ERROR_SUBDIR", "erros")
+    WATCH_RESULTS_CSV: str = os.getenv("WATCH_RESULTS_CSV", os.path.join(CACHE_DIR, "watch_results.csv"))
+    WATCH_DEBOUNCE_SECONDS: float = float(os.getenv("WATCH_DEBOUNCE_SECONDS", "3"))
+    WATCH_POLLING: bool = os.getenv("WATCH_POLLING", "false").lower() == "true"
+
+    # Acesso administrativo (X-Admin-Token); vazio = rotas administrativas desativadas
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")
+
+    # Profiling sob demanda (ver app/core/profiling.py)
+    PROFILING_EVERY_N: int = int(os.getenv("PROFILING_EVERY_N", "0"))  # 0 = só quando pedido
+    PROFILING_ENGINE: str = os.getenv("PROFILING_ENGINE", "sampler")  # sampler ou cprofile
+    PROFILING_FORMAT: str = os.getenv("PROFILING_FORMAT", "speedscope")  # speedscope ou collapsed
+    PROFILING_INTERVAL: float = float(os.getenv("PROFILING_INTERVAL", "0.005"))  # segundos entre amostras
+    PROFILING_DIR: str = os.getenv("PROFILING_DIR", os.path.join(CACHE_DIR, "profiles"))
 
     # Criar diretórios necessários
     def create_directories(self):
@@ -0,0 +1,30 @@
+import os
+import sqlite3
+import threading
+
+# Conexões SQLite são mantidas por thread (sqlite3 não permite compartilhar
+# a mesma conexão entre threads sem sincronização externa).
+_local = threading.local()
+
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """
+    Retorna a conexão SQLite da thread atual para o arquivo informado.
+
+    A conexão é aberta em modo autocommit, com journal WAL (leitores não
+    bloqueiam o escritor) e busy_timeout para tolerar concorrência entre
+    threads e processos.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    if conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        connections[db_path] = conn
+    return conn
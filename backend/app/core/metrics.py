@@ -0,0 +1,290 @@
+"""
+Métricas do processamento no formato texto do Prometheus (servidas em /metrics).
+
+Contadores, histogramas e medidores simples, sem dependências externas. Nos workers de
+processo (páginas no modo multi-boleto, CLI em lote) os valores ficam no registro do
+worker: `coletar_delta()` devolve o acumulado desde a última coleta e o processo
+principal soma com `mesclar()`.
+"""
+import functools
+import threading
+import time
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from .tracing import trace_atual
+
+# Etapas do pipeline medidas em DURACAO_ETAPA
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Memória por documento (MEMORIA_DOCUMENTO)
+BUCKETS_MB = (1, 4, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+Rotulos = Tuple[str, ...]
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _formatar_rotulos(nomes: Sequence[str], valores: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+def _formatar_numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores: Dict[Rotulos, object] = {}
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos: Dict[str, str]) -> Rotulos:
+        if set(rotulos) != set(self.rotulos):
+            raise ValueError(f"{self.nome}: rótulos esperados {self.rotulos}, recebidos {tuple(rotulos)}")
+        return tuple(str(rotulos[nome]) for nome in self.rotulos)
+
+    def _cabecalho(self) -> list:
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+
+class Contador(_Metrica):
+    """Valor que só cresce (ex.: códigos encontrados por origem)."""
+    tipo = "counter"
+
+    def incrementar(self, valor: float = 1.0, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0.0) + valor
+
+    def _delta(self) -> Dict[Rotulos, float]:
+        with self._lock:
+            delta, self._valores = self._valores, {}
+        return delta
+
+    def _mesclar(self, delta: Dict[Rotulos, float]):
+        with self._lock:
+            for chave, valor in delta.items():
+                self._valores[chave] = self._valores.get(chave, 0.0) + valor
+
+    def exportar(self) -> list:
+        with self._lock:
+            valores = dict(self._valores)
+        linhas = self._cabecalho()
+        for chave, valor in sorted(valores.items()):
+            linhas.append(f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_formatar_numero(valor)}")
+        return linhas
+
+class Histograma(_Metrica):
+    """Distribuição de durações em buckets cumulativos, com soma e contagem."""
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = (), buckets: Sequence[float] = BUCKETS_SEGUNDOS):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(sorted(buckets))
+
+    def observar(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            contagens = self._valores.get(chave)
+            if contagens is None:
+                # Um contador por bucket (não cumulativo), depois soma e contagem
+                contagens = self._valores[chave] = [0] * len(self.buckets) + [0.0, 0]
+            for indice, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    contagens[indice] += 1
+                    break
+            contagens[-2] += valor
+            contagens[-1] += 1
+
+    def cronometrar(self, **rotulos) -> "Cronometro":
+        """Mede a duração de um bloco `with` ou de cada chamada de uma função decorada."""
+        return Cronometro(self, rotulos)
+
+    def _delta(self) -> Dict[Rotulos, list]:
+        with self._lock:
+            delta, self._valores = self._valores, {}
+        return delta
+
+    def _mesclar(self, delta: Dict[Rotulos, list]):
+        with self._lock:
+            for chave, contagens in delta.items():
+                atuais = self._valores.setdefault(chave, [0] * len(self.buckets) + [0.0, 0])
+                for indice, valor in enumerate(contagens):
+                    atuais[indice] += valor
+
+    def exportar(self) -> list:
+        with self._lock:
+            valores = {chave: list(contagens) for chave, contagens in self._valores.items()}
+        linhas = self._cabecalho()
+        for chave, contagens in sorted(valores.items()):
+            acumulado = 0
+            for limite, quantidade in zip(self.buckets, contagens):
+                acumulado += quantidade
+                rotulos = _formatar_rotulos(self.rotulos, chave, ("le", _formatar_numero(limite)))
+                linhas.append(f"{self.nome}_bucket{rotulos} {acumulado}")
+            rotulos = _formatar_rotulos(self.rotulos, chave, ("le", "+Inf"))
+            linhas.append(f"{self.nome}_bucket{rotulos} {contagens[-1]}")
+            linhas.append(f"{self.nome}_sum{_formatar_rotulos(self.rotulos, chave)} {_formatar_numero(contagens[-2])}")
+            linhas.append(f"{self.nome}_count{_formatar_rotulos(self.rotulos, chave)} {contagens[-1]}")
+        return linhas
+
+class Medidor(_Metrica):
+    """Valor instantâneo; com `funcao`, lido na hora da exportação ({rótulos: valor})."""
+    tipo = "gauge"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        super().__init__(nome, ajuda, rotulos)
+        self._funcoes: list = []
+
+    def definir(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = valor
+
+    def observar_funcao(self, funcao: Callable[[], Dict[Rotulos, float]]):
+        """Registra uma função chamada a cada exportação (ex.: tamanho atual de uma fila)."""
+        with self._lock:
+            self._funcoes.append(funcao)
+
+    def exportar(self) -> list:
+        with self._lock:
+            valores = dict(self._valores)
+            funcoes = list(self._funcoes)
+        for funcao in funcoes:
+            try:
+                valores.update(funcao())
+            except Exception:
+                continue
+        linhas = self._cabecalho()
+        for chave, valor in sorted(valores.items()):
+            linhas.append(f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_formatar_numero(valor)}")
+        return linhas
+
+class Cronometro:
+    """Context manager/decorador que registra a duração em um Histograma."""
+    def __init__(self, histograma: Histograma, rotulos: Dict[str, str]):
+        self.histograma = histograma
+        self.rotulos = rotulos
+
+    def _registrar(self, duracao: float):
+        self.histograma.observar(duracao, **self.rotulos)
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._registrar(time.perf_counter() - self._inicio)
+        return False
+
+    def __call__(self, funcao):
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                self._registrar(time.perf_counter() - inicio)
+        return medida
+
+class CronometroEtapa(Cronometro):
+    """Cronômetro de etapa do pipeline: também soma a duração no trace do documento, se houver."""
+    def __init__(self, nome: str):
+        super().__init__(DURACAO_ETAPA, {"etapa": nome})
+        self.nome = nome
+
+    def _registrar(self, duracao: float):
+        super()._registrar(duracao)
+        trace = trace_atual()
+        if trace is not None:
+            trace.etapa(self.nome, duracao)
+
+class RegistroMetricas:
+    """Conjunto das métricas do processo, exportadas juntas."""
+    def __init__(self):
+        self._metricas: Dict[str, _Metrica] = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, metrica: _Metrica) -> _Metrica:
+        with self._lock:
+            return self._metricas.setdefault(metrica.nome, metrica)
+
+    def contador(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()) -> Contador:
+        return self._registrar(Contador(nome, ajuda, rotulos))
+
+    def histograma(self, nome: str, ajuda: str, rotulos: Sequence[str] = (), buckets: Sequence[float] = BUCKETS_SEGUNDOS) -> Histograma:
+        return self._registrar(Histograma(nome, ajuda, rotulos, buckets))
+
+    def medidor(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()) -> Medidor:
+        return self._registrar(Medidor(nome, ajuda, rotulos))
+
+    def exportar(self) -> str:
+        """Todas as métricas no formato texto do Prometheus (versão 0.0.4)."""
+        with self._lock:
+            metricas = list(self._metricas.values())
+        linhas = []
+        for metrica in metricas:
+            linhas.extend(metrica.exportar())
+        return "\n".join(linhas) + "\n"
+
+    def coletar_delta(self) -> Dict[str, dict]:
+        """Contadores e histogramas acumulados desde a última coleta (que são zerados). Usado nos workers."""
+        with self._lock:
+            metricas = list(self._metricas.values())
+        return {
+            metrica.nome: metrica._delta()
+            for metrica in metricas if isinstance(metrica, (Contador, Histograma))
+        }
+
+    def mesclar(self, delta: Optional[Dict[str, dict]]):
+        """Soma ao registro local o delta coletado em um worker."""
+        for nome, valores in (delta or {}).items():
+            metrica = self._metricas.get(nome)
+            if isinstance(metrica, (Contador, Histograma)) and valores:
+                metrica._mesclar(valores)
+
+    def zerar(self):
+        """Descarta os valores herdados do processo pai (inicializador dos workers de processo)."""
+        self.coletar_delta()
+
+metricas = RegistroMetricas()
+
+# Métricas do pipeline de extração
+DURACAO_ETAPA = metricas.histograma(
+    "boletos_etapa_duracao_segundos", "Duração de cada etapa do pipeline de extração.", ("etapa",)
+)
+DURACAO_DOCUMENTO = metricas.histograma(
+    "boletos_documento_duracao_segundos", "Duração do processamento de um documento, por perfil.", ("perfil",)
+)
+DOCUMENTOS = metricas.contador(
+    "boletos_documentos_total", "Documentos processados, por status.", ("status",)
+)
+ORIGEM_CODIGO = metricas.contador(
+    "boletos_codigo_origem_total",
+    "Etapa da cascata que produziu o código de barras (texto, dica, pyzbar, ocr ou nao_encontrado).",
+    ("origem",)
+)
+FILA_EXECUTOR = metricas.medidor(
+    "boletos_fila_executor", "Tarefas pendentes em cada executor.", ("executor",)
+)
+MEMORIA_DOCUMENTO = metricas.histograma(
+    "boletos_documento_memoria_mb",
+    "Memória por documento: aumento do RSS (rss), pico do tracemalloc (tracemalloc) e maior lote de imagens renderizadas (imagens).",
+    ("medida",), BUCKETS_MB
+)
+AJUSTES_MEMORIA = metricas.contador(
+    "boletos_memoria_ajustes_total", "Ajustes por falta de memória (dpi_reduzido, pagina_a_pagina ou adiado).", ("acao",)
+)
+TIMEOUTS = metricas.contador(
+    "boletos_timeouts_total", "Trabalho interrompido por prazo (rasterizacao, tesseract ou documento).", ("etapa",)
+)
+RSS_PROCESSO = metricas.medidor("boletos_processo_rss_mb", "RSS atual do processo, em MB.")
+
+def etapa(nome: str) -> CronometroEtapa:
+    """Cronômetro da etapa `nome` (context manager ou decorador), refletido no trace do documento."""
+    return CronometroEtapa(nome)
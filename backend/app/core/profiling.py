@@ -0,0 +1,250 @@
+"""
+Profiling sob demanda de documentos específicos (uso administrativo).
+
+Um perfilador de amostragem (sys._current_frames) registra as pilhas da thread que
+executa process_pdf; se a amostragem não estiver disponível ou PROFILING_ENGINE=cprofile,
+usa o cProfile, que gera um perfil plano (uma entrada por função, peso = tempo próprio).
+Os workers de processo do modo multi-boleto perfilam a própria execução e devolvem as
+pilhas, somadas ao perfil do documento.
+
+O perfil é salvo em PROFILING_DIR como pilhas colapsadas (flamegraph.pl, speedscope)
+ou JSON do speedscope. Sem sessão ativa, nada roda: não há thread de amostragem nem
+hook de profiling.
+"""
+import cProfile
+import json
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .config import settings
+
+logger = logging.getLogger("profiling")
+
+FORMATO_COLLAPSED = "collapsed"
+FORMATO_SPEEDSCOPE = "speedscope"
+FORMATOS = (FORMATO_COLLAPSED, FORMATO_SPEEDSCOPE)
+EXTENSOES = {FORMATO_COLLAPSED: ".collapsed.txt", FORMATO_SPEEDSCOPE: ".speedscope.json"}
+
+MOTOR_AMOSTRAGEM = "sampler"
+MOTOR_CPROFILE = "cprofile"
+
+# Quadro: (função, arquivo, linha de definição); pilha: da raiz até o quadro executando
+Quadro = Tuple[str, str, int]
+Pilha = Tuple[Quadro, ...]
+
+AMOSTRAGEM_DISPONIVEL = hasattr(sys, "_current_frames")
+
+class _Amostrador:
+    """Thread que amostra periodicamente a pilha de uma única thread."""
+    def __init__(self, thread_id: int, intervalo: float):
+        self.thread_id = thread_id
+        self.intervalo = intervalo
+        self.pesos: Dict[Pilha, float] = {}
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="profiling-sampler", daemon=True)
+
+    def iniciar(self):
+        self._thread.start()
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self.thread_id)
+            pilha = []
+            while frame is not None:
+                codigo = frame.f_code
+                pilha.append((codigo.co_name, codigo.co_filename, codigo.co_firstlineno))
+                frame = frame.f_back
+            if pilha:
+                chave = tuple(reversed(pilha))
+                self.pesos[chave] = self.pesos.get(chave, 0.0) + self.intervalo
+
+    def parar(self) -> Dict[Pilha, float]:
+        self._parar.set()
+        self._thread.join()
+        return self.pesos
+
+class _PerfiladorCProfile:
+    """cProfile na thread atual; o resultado é um perfil plano (tempo próprio por função)."""
+    def __init__(self):
+        self._perfil = cProfile.Profile()
+
+    def iniciar(self):
+        self._perfil.enable()
+
+    def parar(self) -> Dict[Pilha, float]:
+        self._perfil.disable()
+        pesos = {}
+        for (arquivo, linha, funcao), (_, _, tempo_proprio, _, _) in pstats.Stats(self._perfil).stats.items():
+            if tempo_proprio > 0:
+                pesos[((funcao, arquivo, linha),)] = tempo_proprio
+        return pesos
+
+def _criar_perfilador(motor: Optional[str] = None):
+    motor = motor or settings.PROFILING_ENGINE
+    if motor == MOTOR_AMOSTRAGEM and AMOSTRAGEM_DISPONIVEL:
+        return MOTOR_AMOSTRAGEM, _Amostrador(threading.get_ident(), settings.PROFILING_INTERVAL)
+    return MOTOR_CPROFILE, _PerfiladorCProfile()
+
+class SessaoPerfil:
+    """Perfil de um documento: pilhas com peso em segundos, incluindo as dos workers."""
+    def __init__(self, nome: str, motor: Optional[str] = None):
+        self.nome = nome
+        self.motor, self._perfilador = _criar_perfilador(motor)
+        self.pesos: Dict[Pilha, float] = {}
+        self.inicio = time.perf_counter()
+        self.duracao = 0.0
+
+    def mesclar(self, pesos: Optional[Dict[Pilha, float]], prefixo: Optional[str] = None):
+        """Soma pilhas coletadas em outro lugar (ex.: worker de processo), sob um quadro `prefixo`."""
+        raiz = ((prefixo, "", 0),) if prefixo else ()
+        for pilha, peso in (pesos or {}).items():
+            chave = raiz + tuple(pilha)
+            self.pesos[chave] = self.pesos.get(chave, 0.0) + peso
+
+    def _encerrar(self):
+        self.mesclar(self._perfilador.parar())
+        self.duracao = time.perf_counter() - self.inicio
+
+    def salvar(self, formato: str = None) -> Dict:
+        """Grava o perfil em PROFILING_DIR e retorna {id, formato, motor, amostras, duracao_s}."""
+        formato = formato or settings.PROFILING_FORMAT
+        perfil_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        caminho = os.path.join(settings.PROFILING_DIR, perfil_id + EXTENSOES[formato])
+        with open(caminho, "w", encoding="utf-8") as f:
+            if formato == FORMATO_SPEEDSCOPE:
+                json.dump(para_speedscope(self.pesos, self.nome, self.duracao), f)
+            else:
+                f.write(para_collapsed(self.pesos))
+        logger.info(f"Perfil de {self.nome} ({self.motor}, {len(self.pesos)} pilhas) salvo em {caminho}")
+        return {
+            "id": perfil_id,
+            "formato": formato,
+            "motor": self.motor,
+            "pilhas": len(self.pesos),
+            "duracao_s": round(self.duracao, 3)
+        }
+
+_sessao_atual: ContextVar[Optional[SessaoPerfil]] = ContextVar("sessao_perfil", default=None)
+
+def sessao_atual() -> Optional[SessaoPerfil]:
+    """Sessão de profiling ativa nesta thread/contexto, ou None."""
+    return _sessao_atual.get()
+
+@contextmanager
+def perfilar(nome: str, motor: Optional[str] = None) -> Iterator[SessaoPerfil]:
+    """Perfila o bloco na thread atual (a que executa process_pdf)."""
+    sessao = SessaoPerfil(nome, motor)
+    token = _sessao_atual.set(sessao)
+    sessao._perfilador.iniciar()
+    try:
+        yield sessao
+    finally:
+        sessao._encerrar()
+        _sessao_atual.reset(token)
+
+def _nome_quadro(quadro: Quadro) -> str:
+    funcao, arquivo, linha = quadro
+    if not arquivo:
+        return funcao
+    return f"{funcao} ({os.path.basename(arquivo)}:{linha})"
+
+def para_collapsed(pesos: Dict[Pilha, float]) -> str:
+    """Pilhas colapsadas: "raiz;...;folha <microssegundos>" por linha."""
+    linhas = []
+    for pilha, peso in sorted(pesos.items(), key=lambda item: -item[1]):
+        nomes = ";".join(re.sub(r"[;\r\n]", "_", _nome_quadro(quadro)) for quadro in pilha)
+        linhas.append(f"{nomes} {max(1, int(peso * 1_000_000))}")
+    return "\n".join(linhas) + "\n"
+
+def para_speedscope(pesos: Dict[Pilha, float], nome: str, duracao: float) -> Dict:
+    """Perfil no formato de arquivo do speedscope (tipo "sampled", pesos em segundos)."""
+    indices: Dict[Quadro, int] = {}
+    quadros: List[Dict] = []
+    amostras, pesos_amostras = [], []
+    for pilha, peso in pesos.items():
+        amostra = []
+        for quadro in pilha:
+            if quadro not in indices:
+                indices[quadro] = len(quadros)
+                funcao, arquivo, linha = quadro
+                quadros.append({"name": funcao, "file": arquivo, "line": linha} if arquivo else {"name": funcao})
+            amostra.append(indices[quadro])
+        amostras.append(amostra)
+        pesos_amostras.append(peso)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": nome,
+        "exporter": settings.PROJECT_NAME,
+        "shared": {"frames": quadros},
+        "profiles": [{
+            "type": "sampled",
+            "name": nome,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": max(duracao, sum(pesos_amostras)),
+            "samples": amostras,
+            "weights": pesos_amostras
+        }]
+    }
+
+def caminho_perfil(perfil_id: str) -> Optional[str]:
+    """Arquivo salvo do perfil, ou None (ids são validados para não sair de PROFILING_DIR)."""
+    if not re.fullmatch(r"[\w-]+", perfil_id or ""):
+        return None
+    for extensao in EXTENSOES.values():
+        caminho = os.path.join(settings.PROFILING_DIR, perfil_id + extensao)
+        if os.path.exists(caminho):
+            return caminho
+    return None
+
+def listar_perfis() -> List[Dict]:
+    """Perfis salvos, do mais recente para o mais antigo."""
+    if not os.path.isdir(settings.PROFILING_DIR):
+        return []
+    perfis = []
+    for arquivo in os.listdir(settings.PROFILING_DIR):
+        for formato, extensao in EXTENSOES.items():
+            if arquivo.endswith(extensao):
+                caminho = os.path.join(settings.PROFILING_DIR, arquivo)
+                perfis.append({
+                    "id": arquivo[:-len(extensao)],
+                    "formato": formato,
+                    "tamanho_kb": round(os.path.getsize(caminho) / 1024, 1)
+                })
+    return sorted(perfis, key=lambda perfil: perfil["id"], reverse=True)
+
+class AmostragemPeriodica:
+    """Decide quais documentos são perfilados automaticamente (um a cada PROFILING_EVERY_N)."""
+    def __init__(self):
+        self._contador = 0
+        self._lock = threading.Lock()
+
+    def sortear(self) -> bool:
+        if settings.PROFILING_EVERY_N <= 0:
+            return False
+        with self._lock:
+            self._contador += 1
+            return self._contador % settings.PROFILING_EVERY_N == 0
+
+amostragem_periodica = AmostragemPeriodica()
+
+# Funções usadas pelos workers de processo
+
+def iniciar_perfil_worker(motor: str):
+    """Inicia o perfilador dentro do worker (a chamada roda na thread principal do worker)."""
+    _, perfilador = _criar_perfilador(motor)
+    perfilador.iniciar()
+    return perfilador
+
+def encerrar_perfil_worker(perfilador) -> Dict[Pilha, float]:
+    return perfilador.parar()
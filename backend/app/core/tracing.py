@@ -0,0 +1,118 @@
+"""
+Trace por documento: o que o pipeline fez com um PDF específico (etapas e suas durações,
+páginas e DPI renderizados, fallbacks acionados, candidatos encontrados e memória).
+
+Ativado por documento (`process_pdf(..., trace=True)`); o trace corrente fica em uma
+ContextVar, então as etapas só registram algo quando há um trace ativo na thread.
+Desligado, o custo é uma leitura da ContextVar por etapa.
+"""
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:  # Windows
+    RESOURCE_AVAILABLE = False
+
+_trace_atual: ContextVar[Optional["TraceDocumento"]] = ContextVar("trace_documento", default=None)
+
+def trace_atual() -> Optional["TraceDocumento"]:
+    """Trace do documento em processamento nesta thread/contexto, ou None."""
+    return _trace_atual.get()
+
+def evento(nome: str, quantidade: int = 1):
+    """Registra um fallback/ocorrência (ex.: "cid", "pyzbar_sem_codigo") no trace ativo, se houver."""
+    trace = _trace_atual.get()
+    if trace is not None:
+        trace.evento(nome, quantidade)
+
+class TraceDocumento:
+    """Acumula as etapas de um documento, agregadas por nome, na ordem em que apareceram."""
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.etapas: Dict[str, dict] = {}
+        self.eventos: Dict[str, int] = {}
+        self.candidatos: Dict[str, int] = {}
+        self.info: Dict[str, object] = {}
+
+    def _etapa(self, nome: str) -> dict:
+        return self.etapas.setdefault(nome, {"etapa": nome, "n": 0, "ms": 0.0})
+
+    def etapa(self, nome: str, segundos: float):
+        """Soma uma execução da etapa."""
+        registro = self._etapa(nome)
+        registro["n"] += 1
+        registro["ms"] += segundos * 1000
+
+    def detalhar(self, nome: str, paginas: Optional[int] = None, dpi: Optional[int] = None):
+        """Acrescenta à etapa as páginas processadas (somadas) e o DPI usado (valores distintos)."""
+        registro = self._etapa(nome)
+        if paginas is not None:
+            registro["paginas"] = registro.get("paginas", 0) + paginas
+        if dpi is not None and dpi not in registro.setdefault("dpi", []):
+            registro["dpi"].append(dpi)
+
+    def somar_etapas_worker(self, histograma_delta: Optional[dict]):
+        """
+        Soma as etapas executadas em um worker de processo, a partir do delta do
+        histograma de etapas (ver metrics.coletar_delta): {(etapa,): [buckets..., soma, n]}.
+        """
+        for (nome,), contagens in (histograma_delta or {}).items():
+            registro = self._etapa(nome)
+            registro["n"] += contagens[-1]
+            registro["ms"] += contagens[-2] * 1000
+            registro["worker"] = True
+
+    def evento(self, nome: str, quantidade: int = 1):
+        self.eventos[nome] = self.eventos.get(nome, 0) + quantidade
+
+    def contar_candidatos(self, origem: str, quantidade: int):
+        self.candidatos[origem] = self.candidatos.get(origem, 0) + quantidade
+
+    def definir(self, **info):
+        """Informações do documento (perfil, páginas, origem do código...)."""
+        self.info.update({chave: valor for chave, valor in info.items() if valor is not None})
+
+    def resumo(self) -> dict:
+        """Trace compacto, serializável em JSON."""
+        etapas = []
+        for registro in self.etapas.values():
+            registro = dict(registro, ms=round(registro["ms"], 1))
+            etapas.append(registro)
+        resumo = {
+            "total_ms": round((time.perf_counter() - self.inicio) * 1000, 1),
+            **self.info,
+            "etapas": etapas,
+            "eventos": dict(self.eventos),
+            "candidatos": dict(self.candidatos),
+        }
+        memoria = _memoria_pico_mb()
+        if memoria:
+            resumo["memoria_pico_mb"] = memoria
+        return resumo
+
+def _memoria_pico_mb() -> Optional[float]:
+    """Pico de memória: do tracemalloc, se estiver ativo; senão, o RSS máximo do processo."""
+    if tracemalloc.is_tracing():
+        return round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+    if RESOURCE_AVAILABLE:
+        # ru_maxrss em KB no Linux
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return None
+
+@contextmanager
+def rastrear(ativo: bool = True) -> Iterator[Optional[TraceDocumento]]:
+    """Ativa um trace para o bloco (ou não faz nada, com `ativo=False`)."""
+    if not ativo:
+        yield None
+        return
+    trace = TraceDocumento()
+    token = _trace_atual.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace_atual.reset(token)
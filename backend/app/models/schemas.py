@@ -2,6 +2,26 @@ from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 
+class DuplicateReference(BaseModel):
+    content_hash: Optional[str] = None
+    filename: Optional[str] = None
+    id_fluxus: Optional[str] = None
+    visto_em: Optional[str] = None
+
+class BoletoEncontrado(BaseModel):
+    page: int
+    barcode: str
+    barcode_source: Optional[str] = "texto"
+    valor: Optional[str] = None
+    vencimento: Optional[str] = None
+    id_fluxus: Optional[str] = None
+    numero_nf: Optional[str] = None
+    cnpj: Optional[str] = None
+    fornecedor: Optional[str] = None
+    idpgto: Optional[str] = None
+    duplicate: bool = False
+    duplicate_of: Optional[DuplicateReference] = None
+
 class PDFResult(BaseModel):
     filename: str
     id_fluxus: Optional[str] = None
@@ -14,6 +34,14 @@ class PDFResult(BaseModel):
     idpgto: Optional[str] = None
     status: str = "Processado"
     error: Optional[str] = None
+    content_hash: Optional[str] = None
+    duplicate: bool = False
+    duplicate_of: Optional[DuplicateReference] = None
+    boletos: Optional[List[BoletoEncontrado]] = None
+    profile: Optional[str] = None
+    budget_exhausted: bool = False
+    trace: Optional[dict] = None
+    profiling: Optional[dict] = None
 
 class ProcessingResponse(BaseModel):
     success: bool
@@ -26,8 +54,44 @@ class SendRequest(BaseModel):
     idpgto: Optional[str] = None
     cnpj: Optional[str] = None
     barcode_source: Optional[str] = "texto"
+    force: bool = False
+    tag: Optional[str] = None  # "IPTE" ou "CODIGOBARRA"; None = pelo tamanho do código
 
 class SendResponse(BaseModel):
     success: bool
     message: str
-    logs: List[str] = []
\ No newline at end of file
+    logs: List[str] = []
+    send_id: Optional[str] = None
+    status: Optional[str] = None
+
+class SendStatusResponse(BaseModel):
+    send_id: str
+    status: str
+    success: Optional[bool] = None
+    message: Optional[str] = None
+    logs: List[str] = []
+    tentativas: int = 0
+    criado_em: str
+    atualizado_em: str
+
+class LedgerEntry(BaseModel):
+    id: int
+    content_hash: Optional[str] = None
+    filename: Optional[str] = None
+    id_fluxus: Optional[str] = None
+    barcode: Optional[str] = None
+    barcode_source: Optional[str] = None
+    cnpj: Optional[str] = None
+    fornecedor: Optional[str] = None
+    valor: Optional[str] = None
+    vencimento: Optional[str] = None
+    idpgto: Optional[str] = None
+    status: Optional[str] = None
+    error: Optional[str] = None
+    duracao_ms: Optional[float] = None
+    trace: Optional[dict] = None
+    processado_em: str
+
+class LedgerPage(BaseModel):
+    items: List[LedgerEntry] = []
+    next_cursor: Optional[int] = None
@@ -0,0 +1,265 @@
+"""
+Processamento em lote pela linha de comando, sem a API.
+
+Aceita diretórios (busca *.pdf recursivamente), padrões glob e arquivos ZIP,
+processa os PDFs em um process pool e grava os resultados em CSV, JSONL ou
+Parquet. Um arquivo de checkpoint registra os itens concluídos, permitindo
+retomar o lote após uma queda. O checkpoint só avança depois que os resultados
+estão gravados (no Parquet, em partes já fechadas: <saida> e <base>.partN.parquet).
+
+Uso (a partir de backend/):
+    python -m app.processing.batch_cli /dados/boletos/2023 lote.zip -o resultados.parquet
+"""
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from collections import deque
+from typing import Dict, Iterator, List, Set
+
+from ..core.config import settings
+from ..core.metrics import FILA_EXECUTOR, metricas
+from .errors import InvalidDataError
+from .extraction_profiles import PERFIS
+from .memory_budget import STATUS_ADIADO
+from .result_writers import RESULT_FIELDS, criar_writer
+
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+logger = logging.getLogger("batch_cli")
+
+# Separador entre o caminho do ZIP e o membro nos identificadores de item
+ZIP_SEPARATOR = "::"
+
+OUTPUT_FIELDS = ["source"] + RESULT_FIELDS
+
+def listar_itens(entradas: List[str]) -> Iterator[str]:
+    """Expande diretórios, globs e ZIPs em identificadores de item (caminho ou zip::membro)."""
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            for raiz, _, arquivos in os.walk(entrada):
+                for nome in sorted(arquivos):
+                    caminho = os.path.join(raiz, nome)
+                    if nome.lower().endswith(".pdf"):
+                        yield os.path.abspath(caminho)
+                    elif nome.lower().endswith(".zip"):
+                        yield from _listar_zip(caminho)
+        elif os.path.isfile(entrada):
+            if entrada.lower().endswith(".zip"):
+                yield from _listar_zip(entrada)
+            else:
+                yield os.path.abspath(entrada)
+        else:
+            correspondencias = sorted(glob.glob(entrada, recursive=True))
+            if not correspondencias:
+                logger.warning(f"Nenhum arquivo encontrado para {entrada}")
+            yield from listar_itens(correspondencias)
+
+def _listar_zip(caminho: str) -> Iterator[str]:
+    caminho = os.path.abspath(caminho)
+    try:
+        with zipfile.ZipFile(caminho) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(".pdf"):
+                    yield f"{caminho}{ZIP_SEPARATOR}{info.filename}"
+    except zipfile.BadZipFile as e:
+        logger.error(f"ZIP inválido {caminho}: {e}")
+
+# ZIPs abertos por processo worker (evita reabrir o arquivo a cada membro)
+_zips_abertos: Dict[str, zipfile.ZipFile] = {}
+
+def _ler_item(item: str) -> bytes:
+    if ZIP_SEPARATOR in item:
+        caminho_zip, membro = item.split(ZIP_SEPARATOR, 1)
+        zf = _zips_abertos.get(caminho_zip)
+        if zf is None:
+            zf = _zips_abertos[caminho_zip] = zipfile.ZipFile(caminho_zip)
+        return zf.read(membro)
+    with open(item, "rb") as f:
+        return f.read()
+
+def _init_worker(log_level: int):
+    logging.basicConfig(level=log_level, format="%(asctime)s - %(processName)s - %(levelname)s - %(message)s")
+    metricas.zerar()
+
+def _processar_item(item: str, campos=None, perfil: str = None, trace: bool = False) -> Dict:
+    """Executado no processo worker: lê o item e roda o pipeline."""
+    from .pdf_processor import process_pdf
+    filename = os.path.basename(item.split(ZIP_SEPARATOR, 1)[-1])
+    try:
+        result = process_pdf(_ler_item(item), filename, fields=campos, profile=perfil, trace=trace)
+    except Exception as e:
+        result = {"filename": filename, "status": "Erro", "error": f"Erro ao ler o arquivo: {str(e)}"}
+    result["source"] = item
+    # Métricas do worker desde o último item, somadas no processo principal
+    result["metricas"] = metricas.coletar_delta()
+    return result
+
+def _carregar_checkpoint(path: str) -> Set[str]:
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {linha.rstrip("\n") for linha in f if linha.strip()}
+
+class _Progresso:
+    """Barra de progresso (tqdm, se instalado) ou linhas periódicas no stderr."""
+    def __init__(self, total: int):
+        self.total = total
+        self.feitos = 0
+        self.inicio = time.monotonic()
+        self._bar = tqdm(total=total, unit="pdf") if tqdm else None
+
+    def avancar(self):
+        self.feitos += 1
+        if self._bar is not None:
+            self._bar.update(1)
+        elif self.feitos % 100 == 0 or self.feitos == self.total:
+            decorrido = time.monotonic() - self.inicio
+            taxa = self.feitos / decorrido if decorrido else 0
+            print(f"{self.feitos}/{self.total} PDFs ({taxa:.1f}/s)", file=sys.stderr)
+
+    def fechar(self):
+        if self._bar is not None:
+            self._bar.close()
+
+def executar_lote(entradas: List[str], saida: str, formato: str = None, workers: int = None,
+                  checkpoint: str = None, checkpoint_every: int = 200, registrar: bool = True,
+                  campos=None, perfil: str = None, arquivo_metricas: str = None, trace: bool = False) -> int:
+    """
+    Processa todos os PDFs das entradas e grava os resultados em `saida`.
+    Com `campos` (ex.: ["barcode"]), só as etapas necessárias para eles são executadas.
+    `perfil` escolhe o perfil de extração (padrão: EXTRACTION_STRATEGY).
+    Com `arquivo_metricas`, grava ao final as métricas no formato texto do Prometheus.
+    Com `trace`, o trace de cada documento é gravado no ledger.
+
+    Returns:
+        Quantidade de PDFs processados nesta execução
+    """
+    checkpoint = checkpoint or f"{saida}.checkpoint"
+    concluidos = _carregar_checkpoint(checkpoint)
+    itens = [item for item in listar_itens(entradas) if item not in concluidos]
+    if concluidos:
+        logger.info(f"Retomando do checkpoint: {len(concluidos)} itens já concluídos, {len(itens)} restantes.")
+    if not itens:
+        return 0
+
+    if registrar:
+        from .duplicate_index import duplicate_index
+        from .processing_ledger import processing_ledger
+
+    writer = criar_writer(saida, formato, OUTPUT_FIELDS)
+    progresso = _Progresso(len(itens))
+    workers = workers or settings.MAX_WORKERS
+    pendentes_checkpoint: List[str] = []
+    processados = 0
+    # Itens adiados por falta de memória voltam uma vez para o fim da fila
+    adiados: deque = deque()
+    readiados: Set[str] = set()
+
+    def _salvar_checkpoint():
+        # Só marca como concluído o que já está gravado na saída
+        writer.flush()
+        with open(checkpoint, "a", encoding="utf-8") as f:
+            f.writelines(item + "\n" for item in pendentes_checkpoint)
+            f.flush()
+            os.fsync(f.fileno())
+        pendentes_checkpoint.clear()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(logging.WARNING,)) as executor:
+            fila = iter(itens)
+            em_andamento = set()
+            # Mantém poucos itens na fila do pool para limitar a memória
+            for item in fila:
+                em_andamento.add(executor.submit(_processar_item, item, campos, perfil, trace))
+                if len(em_andamento) >= workers * 4:
+                    break
+            while em_andamento:
+                prontos, em_andamento = wait(em_andamento, return_when=FIRST_COMPLETED)
+                for future in prontos:
+                    result = future.result()
+                    metricas.mesclar(result.pop("metricas", None))
+                    if result.get("status") == STATUS_ADIADO and result["source"] not in readiados:
+                        readiados.add(result["source"])
+                        adiados.append(result["source"])
+                        proximo = next(fila, None) or adiados.popleft()
+                        em_andamento.add(executor.submit(_processar_item, proximo, campos, perfil, trace))
+                        continue
+                    if registrar:
+                        duplicate_index.marcar_resultado(result)
+                        processing_ledger.registrar(result)
+                    writer.write(result)
+                    if result.get("status") != STATUS_ADIADO:
+                        # Adiado de novo: fica fora do checkpoint para a próxima execução
+                        pendentes_checkpoint.append(result["source"])
+                    processados += 1
+                    progresso.avancar()
+                    proximo = next(fila, None) or (adiados.popleft() if adiados else None)
+                    if proximo is not None:
+                        em_andamento.add(executor.submit(_processar_item, proximo, campos, perfil, trace))
+                FILA_EXECUTOR.definir(len(em_andamento), executor="lote")
+                if len(pendentes_checkpoint) >= checkpoint_every:
+                    _salvar_checkpoint()
+    finally:
+        _salvar_checkpoint()
+        writer.close()
+        progresso.fechar()
+        if registrar:
+            processing_ledger.flush(timeout=30)
+        if arquivo_metricas:
+            with open(arquivo_metricas, "w", encoding="utf-8") as f:
+                f.write(metricas.exportar())
+    return processados
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Processa PDFs de boletos em lote, sem a API.")
+    parser.add_argument("entradas", nargs="+", help="Diretórios, padrões glob ou arquivos ZIP")
+    parser.add_argument("-o", "--saida", required=True, help="Arquivo de resultados (.csv, .jsonl ou .parquet)")
+    parser.add_argument("-f", "--formato", choices=["csv", "jsonl", "parquet"], help="Formato (padrão: extensão da saída)")
+    parser.add_argument("-w", "--workers", type=int, default=settings.MAX_WORKERS, help="Processos worker")
+    parser.add_argument("--checkpoint", help="Arquivo de checkpoint (padrão: <saida>.checkpoint)")
+    parser.add_argument("--checkpoint-every", type=int, default=200,
+                        help="Itens entre gravações do checkpoint (com Parquet, cada gravação fecha uma parte da saída)")
+    parser.add_argument("--campos", help="Campos a extrair, separados por vírgula (ex.: barcode,valor). Padrão: todos")
+    parser.add_argument("--perfil", choices=sorted(PERFIS),
+                        help=f"Perfil de extração (padrão: {settings.EXTRACTION_STRATEGY})")
+    parser.add_argument("--metricas", help="Grava as métricas (formato Prometheus) neste arquivo ao final")
+    parser.add_argument("--trace", action="store_true", help="Grava no ledger o trace de cada documento")
+    parser.add_argument("--sem-ledger", action="store_true",
+                        help="Não registra os resultados no ledger nem no índice de boletos repetidos")
+    args = parser.parse_args(argv)
+    from .pdf_processor import normalizar_campos
+    try:
+        campos = normalizar_campos(args.campos)
+    except InvalidDataError as e:
+        parser.error(str(e))
+
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    inicio = time.monotonic()
+    total = executar_lote(
+        args.entradas,
+        args.saida,
+        formato=args.formato,
+        workers=args.workers,
+        checkpoint=args.checkpoint,
+        checkpoint_every=args.checkpoint_every,
+        registrar=not args.sem_ledger,
+        campos=sorted(campos) if campos else None,
+        perfil=args.perfil,
+        arquivo_metricas=args.metricas,
+        trace=args.trace
+    )
+    logger.info(f"{total} PDFs processados em {time.monotonic() - inicio:.1f}s. Resultados em {args.saida}")
+
+if __name__ == "__main__":
+    main()
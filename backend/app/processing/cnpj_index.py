@@ -0,0 +1,295 @@
+"""
+Índice CNPJ/CPF → IDPGTO carregado de Listas_Fornecedores1.csv.
+
+O CSV é lido em streaming e o índice é trocado atomicamente quando o arquivo
+muda. Uma cópia compacta (binária, ordenada) é gravada no CACHE_DIR para que
+workers de process pool façam mmap dela em vez de reprocessar o CSV.
+"""
+import array
+import bisect
+import csv
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from ..core.config import settings
+
+logger = logging.getLogger("cnpj_index")
+
+_COMPACT_MAGIC = b"CNPJIDX1"
+# magic, quantidade de registros, mtime_ns e tamanho do CSV de origem
+_COMPACT_HEADER = struct.Struct("<8sQqQ")
+
+def limpar_cnpj(cnpj) -> str:
+    """Remove a formatação (pontos, barras, hífens) de um CNPJ/CPF."""
+    return re.sub(r"[^\d]", "", str(cnpj or ""))
+
+def _codificar(cnpj_clean: str) -> int:
+    """Converte CNPJ/CPF limpo em inteiro, preservando o tamanho (CPF e CNPJ não colidem)."""
+    return int(("1" if len(cnpj_clean) == 11 else "2") + cnpj_clean)
+
+def carregar_mapeamento_csv(csv_path: str) -> Dict[str, int]:
+    """Lê o CSV (delimitador ";") em streaming e retorna {cnpj_limpo: idpgto}."""
+    mapping = {}
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f, delimiter=";")
+        header = next(reader, None)
+        if not header:
+            return mapping
+        try:
+            col_idpgto = header.index("IDPGTO")
+            col_cnpj = header.index("CNPJ/CPF")
+        except ValueError:
+            logger.error(f"Cabeçalho inesperado em {csv_path}: {header}")
+            return mapping
+        for line_num, row in enumerate(reader, start=2):
+            try:
+                cnpj_clean = limpar_cnpj(row[col_cnpj])
+                if cnpj_clean:
+                    mapping[cnpj_clean] = int(row[col_idpgto])
+            except (ValueError, IndexError) as e:
+                logger.warning(f"Erro ao processar linha {line_num} do CSV de mapeamento CNPJ: {row} - {e}")
+    return mapping
+
+class _CompactMapping:
+    """
+    Visão somente leitura (via mmap) do índice compacto gravado em disco.
+
+    Leitores usam adquirir()/liberar(); depois de descartar() (índice trocado na
+    recarga), o mmap é fechado assim que o último leitor liberar.
+    """
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._uso_lock = threading.Lock()
+        self._leitores = 0
+        self._descartado = False
+        self.fechado = False
+        magic, count, self.source_mtime_ns, self.source_size = _COMPACT_HEADER.unpack_from(self._mm, 0)
+        if magic != _COMPACT_MAGIC:
+            self._mm.close()
+            raise ValueError(f"Arquivo de índice inválido: {path}")
+        self._view = memoryview(self._mm)
+        keys_start = _COMPACT_HEADER.size
+        values_start = keys_start + count * 8
+        self._keys = self._view[keys_start:values_start].cast("Q")
+        self._values = self._view[values_start:values_start + count * 4].cast("I")
+
+    def adquirir(self) -> bool:
+        """Registra um leitor; False se o índice já foi descartado (use o atual)."""
+        with self._uso_lock:
+            if self._descartado:
+                return False
+            self._leitores += 1
+            return True
+
+    def liberar(self):
+        with self._uso_lock:
+            self._leitores -= 1
+            if self._descartado and not self._leitores:
+                self._fechar()
+
+    def descartar(self):
+        """Fecha o mmap agora, se não houver leitores, ou quando o último liberar."""
+        with self._uso_lock:
+            self._descartado = True
+            if not self._leitores:
+                self._fechar()
+
+    def _fechar(self):
+        if self.fechado:
+            return
+        # As visões precisam ser liberadas antes do mmap (senão close() levanta BufferError)
+        self._keys.release()
+        self._values.release()
+        self._view.release()
+        self._mm.close()
+        self.fechado = True
+
+    def get(self, cnpj_clean: str, default=None):
+        key = _codificar(cnpj_clean)
+        pos = bisect.bisect_left(self._keys, key)
+        if pos < len(self._keys) and self._keys[pos] == key:
+            return self._values[pos]
+        return default
+
+    def __len__(self):
+        return len(self._keys)
+
+def gravar_indice_compacto(mapping: Dict[str, int], path: str, source_stat: os.stat_result):
+    """Grava o índice em formato binário ordenado (chaves uint64, valores uint32)."""
+    items = sorted((_codificar(cnpj), idpgto) for cnpj, idpgto in mapping.items())
+    keys = array.array("Q", (k for k, _ in items))
+    values = array.array("I", (v for _, v in items))
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_COMPACT_HEADER.pack(_COMPACT_MAGIC, len(items), source_stat.st_mtime_ns, source_stat.st_size))
+        keys.tofile(f)
+        values.tofile(f)
+    os.replace(tmp_path, path)
+
+class _CSVChangeHandler(FileSystemEventHandler):
+    """Dispara a recarga do índice quando o CSV monitorado é alterado."""
+    def __init__(self, index: "CNPJIndex", debounce: float = 1.0):
+        self.index = index
+        self.debounce = debounce
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def _is_target(self, event) -> bool:
+        target = os.path.abspath(self.index.csv_path)
+        paths = [getattr(event, "src_path", None), getattr(event, "dest_path", None)]
+        return any(p and os.path.abspath(p) == target for p in paths)
+
+    def on_any_event(self, event):
+        if event.is_directory or not self._is_target(event):
+            return
+        # Editores e cópias geram vários eventos seguidos: recarrega uma vez só
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce, self.index.recarregar)
+            self._timer.daemon = True
+            self._timer.start()
+
+class CNPJIndex:
+    """Índice thread-safe CNPJ/CPF → IDPGTO com recarga automática."""
+    def __init__(self, csv_path: str, compact_path: Optional[str] = None):
+        self.csv_path = csv_path
+        self.compact_path = compact_path
+        self._mapping = None
+        self._lock = threading.Lock()
+        self._observer: Optional[Observer] = None
+
+    def _carregar(self):
+        try:
+            stat = os.stat(self.csv_path)
+        except FileNotFoundError:
+            logger.error(f"Arquivo {self.csv_path} não encontrado. Mapeamento CNPJ->IDPGTO não carregado.")
+            return {}
+
+        # Índice compacto ainda válido para este CSV: usa mmap em vez de ler o CSV
+        if self.compact_path and os.path.exists(self.compact_path):
+            try:
+                compact = _CompactMapping(self.compact_path)
+                if compact.source_mtime_ns == stat.st_mtime_ns and compact.source_size == stat.st_size:
+                    logger.info(f"Índice CNPJ compacto carregado ({len(compact)} registros).")
+                    return compact
+                compact.descartar()
+            except (OSError, ValueError) as e:
+                logger.warning(f"Índice CNPJ compacto ignorado: {e}")
+
+        try:
+            mapping = carregar_mapeamento_csv(self.csv_path)
+        except Exception as e:
+            logger.error(f"Erro ao carregar o arquivo de mapeamento CNPJ: {e}", exc_info=True)
+            return {}
+        logger.info(f"{len(mapping)} mapeamentos CNPJ->IDPGTO carregados de {self.csv_path}.")
+
+        if self.compact_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.compact_path)), exist_ok=True)
+                gravar_indice_compacto(mapping, self.compact_path, stat)
+            except OSError as e:
+                logger.warning(f"Não foi possível gravar o índice CNPJ compacto: {e}")
+        return mapping
+
+    def _get_mapping(self):
+        mapping = self._mapping
+        if mapping is None:
+            with self._lock:
+                if self._mapping is None:
+                    self._mapping = self._carregar()
+                mapping = self._mapping
+        return mapping
+
+    @contextmanager
+    def _leitura(self) -> Iterator:
+        """Mapeamento atual, protegido contra o fechamento do índice compacto durante a leitura."""
+        while True:
+            mapping = self._get_mapping()
+            if not isinstance(mapping, _CompactMapping) or mapping.adquirir():
+                break
+            # Trocado por uma recarga entre a leitura e o adquirir(): usa o novo
+        try:
+            yield mapping
+        finally:
+            if isinstance(mapping, _CompactMapping):
+                mapping.liberar()
+
+    def recarregar(self):
+        """
+        Relê o CSV e troca o índice atomicamente (leitores nunca veem um índice parcial).
+        Se a leitura falhar ou não trouxer nenhum registro, o índice anterior é mantido.
+        """
+        with self._lock:
+            anterior = self._mapping
+            novo = self._carregar()
+            if not novo and anterior:
+                logger.error(f"Recarga de {self.csv_path} sem registros (arquivo ausente, ilegível ou vazio); "
+                             f"mantendo o índice anterior ({len(anterior)} registros).")
+                if isinstance(novo, _CompactMapping):
+                    novo.descartar()
+                return
+            self._mapping = novo
+        if isinstance(anterior, _CompactMapping) and anterior is not novo:
+            anterior.descartar()
+        logger.info(f"Índice CNPJ->IDPGTO recarregado ({len(novo)} registros).")
+
+    def lookup(self, cnpj) -> Optional[int]:
+        """Retorna o IDPGTO do CNPJ/CPF (com ou sem formatação) ou None."""
+        cnpj_clean = limpar_cnpj(cnpj)
+        if len(cnpj_clean) not in (11, 14):  # CPF tem 11, CNPJ tem 14
+            return None
+        with self._leitura() as mapping:
+            return mapping.get(cnpj_clean)
+
+    def lookup_many(self, cnpjs: Iterable) -> Dict[str, Optional[int]]:
+        """Busca vários CNPJs de uma vez. Retorna {cnpj_informado: idpgto ou None}."""
+        resultado = {}
+        with self._leitura() as mapping:
+            for cnpj in cnpjs:
+                cnpj_clean = limpar_cnpj(cnpj)
+                resultado[cnpj] = mapping.get(cnpj_clean) if len(cnpj_clean) in (11, 14) else None
+        return resultado
+
+    def as_dict(self) -> Dict[str, int]:
+        """Cópia do mapeamento completo como dicionário."""
+        mapping = self._get_mapping()
+        if isinstance(mapping, dict):
+            return dict(mapping)
+        return carregar_mapeamento_csv(self.csv_path)
+
+    def __len__(self):
+        with self._leitura() as mapping:
+            return len(mapping)
+
+    def iniciar_monitoramento(self):
+        """Começa a observar o CSV e recarrega o índice a cada alteração."""
+        if self._observer is not None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.csv_path))
+        if not os.path.isdir(directory):
+            logger.warning(f"Diretório {directory} não existe. Monitoramento do CSV de fornecedores desativado.")
+            return
+        self._observer = Observer()
+        self._observer.schedule(_CSVChangeHandler(self), directory, recursive=False)
+        self._observer.daemon = True
+        self._observer.start()
+        logger.info(f"Monitorando alterações em {self.csv_path}.")
+
+    def parar_monitoramento(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+cnpj_index = CNPJIndex(settings.CNPJ_CSV_PATH, settings.CNPJ_INDEX_PATH)
@@ -0,0 +1,183 @@
+"""
+Detecção de boletos repetidos entre uploads.
+
+Cada código é normalizado para o código de barras de 44 dígitos (linha digitável
+e leitura do pyzbar do mesmo boleto geram a mesma chave). O SQLite é a referência,
+compartilhada por todos os processos (workers da API, watch folder, batch CLI): todo
+boleto novo para o processo é gravado na hora com INSERT OR IGNORE, e a repetição é
+decidida pela linha ter sido inserida ou não. O Bloom filter (carregado do SQLite
+uma vez por processo) e o conjunto recente em memória só evitam ir ao banco para
+repetições já conhecidas pelo processo.
+"""
+import hashlib
+import logging
+import math
+import re
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from ..core.config import settings
+from ..core.database import get_connection
+from .pdf_processor import linha_digitavel_para_codigo_barras
+
+logger = logging.getLogger("duplicate_index")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS boletos_vistos (
+    barcode TEXT PRIMARY KEY,
+    content_hash TEXT,
+    filename TEXT,
+    id_fluxus TEXT,
+    visto_em TEXT NOT NULL
+);
+"""
+
+class BloomFilter:
+    """Bloom filter de tamanho fixo (bytearray) com hashing duplo sobre blake2b."""
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(1, capacity)
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _posicoes(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item: str):
+        for pos in self._posicoes(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._posicoes(item))
+
+def chave_boleto(barcode) -> Optional[str]:
+    """Normaliza um código (44/47/48 dígitos) para o código de barras de 44 dígitos."""
+    return linha_digitavel_para_codigo_barras(re.sub(r"[^\d]", "", str(barcode or "")))
+
+class DuplicateIndex:
+    """Índice de boletos já vistos: Bloom filter + conjunto recente em memória + SQLite."""
+    def __init__(self, db_path: str, capacity: int, error_rate: float, recent_size: int):
+        self.db_path = db_path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.recent_size = recent_size
+        self._bloom: Optional[BloomFilter] = None
+        self._recent: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _carregar(self):
+        """Carrega o Bloom filter com os códigos persistidos (chamado sob o lock)."""
+        conn = get_connection(self.db_path)
+        conn.executescript(_SCHEMA)
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        total = 0
+        for (barcode,) in conn.execute("SELECT barcode FROM boletos_vistos"):
+            bloom.add(barcode)
+            total += 1
+        if total > self.capacity:
+            logger.warning(f"{total} boletos registrados excedem DUPLICATE_BLOOM_CAPACITY={self.capacity}; "
+                           f"a taxa de falsos positivos (e de consultas ao SQLite) vai aumentar.")
+        self._bloom = bloom
+        logger.info(f"Índice de boletos carregado ({total} códigos).")
+
+    def _inserir(self, chave: str, referencia: Dict) -> bool:
+        """Grava o boleto no SQLite; False se ele já estava lá (registrado por qualquer processo)."""
+        cursor = get_connection(self.db_path).execute(
+            "INSERT OR IGNORE INTO boletos_vistos (barcode, content_hash, filename, id_fluxus, visto_em) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (chave, referencia["content_hash"], referencia["filename"], referencia["id_fluxus"], referencia["visto_em"])
+        )
+        return cursor.rowcount == 1
+
+    def _lembrar(self, chave: str, referencia: Dict):
+        """Acrescenta o boleto ao Bloom filter e ao conjunto recente (chamado sob o lock)."""
+        self._bloom.add(chave)
+        self._recent[chave] = referencia
+        if len(self._recent) > self.recent_size:
+            self._recent.pop(next(iter(self._recent)))
+
+    def _buscar_persistido(self, chave: str) -> Optional[Dict]:
+        row = get_connection(self.db_path).execute(
+            "SELECT content_hash, filename, id_fluxus, visto_em FROM boletos_vistos WHERE barcode = ?", (chave,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def verificar_e_registrar(self, barcode, content_hash: Optional[str] = None,
+                              filename: Optional[str] = None, id_fluxus: Optional[str] = None) -> Optional[Dict]:
+        """
+        Registra o boleto e informa se ele já havia sido visto.
+
+        Returns:
+            Referência ao documento anterior ({content_hash, filename, id_fluxus, visto_em})
+            se o boleto for repetido, ou None se for a primeira ocorrência.
+        """
+        chave = chave_boleto(barcode)
+        if not chave:
+            return None
+
+        with self._lock:
+            if self._bloom is None:
+                self._carregar()
+            talvez_visto = chave in self._bloom
+            anterior = self._recent.get(chave) if talvez_visto else None
+        if anterior is not None:
+            return anterior
+
+        if talvez_visto:
+            # Fora do conjunto recente: confirma no SQLite (pode ser falso positivo do Bloom)
+            anterior = self._buscar_persistido(chave)
+        if anterior is None:
+            referencia = {
+                "content_hash": content_hash,
+                "filename": filename,
+                "id_fluxus": id_fluxus,
+                "visto_em": datetime.now().isoformat(timespec="seconds")
+            }
+            if self._inserir(chave, referencia):
+                with self._lock:
+                    self._lembrar(chave, referencia)
+                return None
+            # Outro processo (ou thread) registrou o boleto depois que o Bloom foi carregado
+            anterior = self._buscar_persistido(chave)
+
+        with self._lock:
+            self._lembrar(chave, anterior)
+        return anterior
+
+    def marcar_resultado(self, result: Dict) -> Dict:
+        """
+        Preenche duplicate/duplicate_of em um resultado de process_pdf. Com multi_boleto,
+        cada item de "boletos" é registrado e marcado; os campos do documento seguem o
+        primeiro boleto, como barcode.
+        """
+        boletos = result.get("boletos")
+        if boletos:
+            for boleto in boletos:
+                anterior = self.verificar_e_registrar(
+                    boleto["barcode"], result.get("content_hash"), result.get("filename"),
+                    boleto.get("id_fluxus") or result.get("id_fluxus")
+                )
+                boleto["duplicate"] = anterior is not None
+                boleto["duplicate_of"] = anterior
+            result["duplicate"] = boletos[0]["duplicate"]
+            result["duplicate_of"] = boletos[0]["duplicate_of"]
+            return result
+        if not result.get("barcode"):
+            return result
+        anterior = self.verificar_e_registrar(
+            result["barcode"], result.get("content_hash"), result.get("filename"), result.get("id_fluxus")
+        )
+        result["duplicate"] = anterior is not None
+        result["duplicate_of"] = anterior
+        return result
+
+duplicate_index = DuplicateIndex(
+    settings.DUPLICATE_INDEX_DB_PATH,
+    settings.DUPLICATE_BLOOM_CAPACITY,
+    settings.DUPLICATE_BLOOM_ERROR_RATE,
+    settings.DUPLICATE_RECENT_SIZE
+)
@@ -49,3 +49,7 @@ class InvalidDataError(PDFProcessingError):
     """Dados extraídos ou fornecidos são inválidos."""
     pass
 
+class MemoryBudgetError(PDFProcessingError):
+    """Memória insuficiente para processar o documento agora (o documento é adiado)."""
+    pass
+
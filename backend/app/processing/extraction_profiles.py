@@ -0,0 +1,72 @@
+"""
+Perfis de extração (EXTRACTION_STRATEGY): quanto do pipeline roda para cada documento.
+
+- fast: camada de texto e pyzbar em baixa resolução; sem OCR.
+- balanced: como o fast, mais pyzbar em 300 DPI e OCR apenas na região da linha digitável.
+- complete: a cascata completa (texto, pyzbar e OCR das páginas inteiras).
+
+Cada perfil tem um orçamento de tempo por documento; esgotado o orçamento, as etapas
+seguintes da cascata são dispensadas e o documento sai com o que já foi encontrado.
+"""
+import time
+from typing import Dict, Optional
+
+from ..core.config import settings
+from .errors import InvalidDataError
+
+PERFIL_RAPIDO = "fast"
+PERFIL_EQUILIBRADO = "balanced"
+PERFIL_COMPLETO = "complete"
+
+# Até onde vai o OCR em cada perfil
+OCR_NENHUM = "nenhum"
+OCR_REGIAO = "regiao"
+OCR_COMPLETO = "completo"
+
+class PerfilExtracao:
+    """Configuração de um perfil: resolução do pyzbar, alcance do OCR e orçamento de tempo (segundos, 0 = sem limite)."""
+    def __init__(self, nome: str, dpi_imagem: int, ocr: str, orcamento_segundos: float):
+        self.nome = nome
+        self.dpi_imagem = dpi_imagem
+        self.ocr = ocr
+        self.orcamento_segundos = orcamento_segundos
+
+    @property
+    def usa_ocr(self) -> bool:
+        return self.ocr != OCR_NENHUM
+
+    def __repr__(self) -> str:
+        return f"PerfilExtracao({self.nome!r}, dpi={self.dpi_imagem}, ocr={self.ocr!r}, orcamento={self.orcamento_segundos}s)"
+
+PERFIS: Dict[str, PerfilExtracao] = {
+    PERFIL_RAPIDO: PerfilExtracao(PERFIL_RAPIDO, 150, OCR_NENHUM, settings.EXTRACTION_BUDGET_FAST),
+    PERFIL_EQUILIBRADO: PerfilExtracao(PERFIL_EQUILIBRADO, 300, OCR_REGIAO, settings.EXTRACTION_BUDGET_BALANCED),
+    PERFIL_COMPLETO: PerfilExtracao(PERFIL_COMPLETO, 300, OCR_COMPLETO, settings.EXTRACTION_BUDGET_COMPLETE),
+}
+
+def obter_perfil(nome: Optional[str] = None) -> PerfilExtracao:
+    """Perfil pelo nome (None = EXTRACTION_STRATEGY). Levanta InvalidDataError para nomes desconhecidos."""
+    chave = (nome or settings.EXTRACTION_STRATEGY).strip().lower()
+    if chave not in PERFIS:
+        raise InvalidDataError(f"Perfil de extração desconhecido: '{chave}'. Disponíveis: {', '.join(PERFIS)}.")
+    return PERFIS[chave]
+
+class OrcamentoExtracao:
+    """
+    Perfil em uso e prazo de um documento. O prazo é um instante de time.monotonic(),
+    válido também nos workers de página (mesma máquina).
+    """
+    def __init__(self, perfil: PerfilExtracao):
+        self.perfil = perfil
+        self.inicio = time.monotonic()
+        self.limite = self.inicio + perfil.orcamento_segundos if perfil.orcamento_segundos > 0 else None
+        self.esgotou = False
+
+    def esgotado(self) -> bool:
+        """True (e marca o documento) se o orçamento de tempo acabou."""
+        if self.limite is not None and time.monotonic() >= self.limite:
+            self.esgotou = True
+        return self.esgotou
+
+    def decorrido(self) -> float:
+        return time.monotonic() - self.inicio
@@ -0,0 +1,231 @@
+"""
+Resolução de IDPGTO em camadas: índice local (CSV) → cache TTL → consulta ao TOTVS.
+
+Tanto acertos quanto ausências retornados pelo TOTVS ficam em cache, de forma
+que cada CNPJ desconhecido é consultado no máximo uma vez por TTL.
+"""
+import html
+import logging
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import requests
+
+from ..core.config import settings
+from .cnpj_index import CNPJIndex, cnpj_index, limpar_cnpj
+
+logger = logging.getLogger("idpgto_resolver")
+
+def formatar_cnpj(cnpj_clean: str) -> str:
+    """Formata CNPJ (00.000.000/0000-00) ou CPF (000.000.000-00) como gravado no TOTVS."""
+    if len(cnpj_clean) == 14:
+        return f"{cnpj_clean[:2]}.{cnpj_clean[2:5]}.{cnpj_clean[5:8]}/{cnpj_clean[8:12]}-{cnpj_clean[12:]}"
+    if len(cnpj_clean) == 11:
+        return f"{cnpj_clean[:3]}.{cnpj_clean[3:6]}.{cnpj_clean[6:9]}-{cnpj_clean[9:]}"
+    return cnpj_clean
+
+class _ConsultaEmAndamento:
+    """Consulta ao TOTVS de um CNPJ em andamento; o resultado fica aqui para as threads que aguardam."""
+    __slots__ = ("evento", "resultado")
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado: Tuple[Optional[int], Optional[str]] = (None, None)
+
+class IDPGTOResolver:
+    """Resolve CNPJ/CPF → IDPGTO com cache TTL (positivo e negativo) e contadores."""
+    def __init__(self, index: CNPJIndex, url: str, username: str, password: str,
+                 dataserver: str, filtro: str, ttl: float, negative_ttl: float,
+                 timeout: float, totvs_enabled: bool = True, max_entries: int = 10000):
+        self.index = index
+        self.url = url
+        self.username = username
+        self.password = password
+        self.dataserver = dataserver
+        self.filtro = filtro
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.totvs_enabled = totvs_enabled
+        self.max_entries = max_entries
+        self._cache: Dict[str, Tuple[Optional[int], float]] = {}
+        self._inflight: Dict[str, _ConsultaEmAndamento] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits_indice": 0,
+            "hits_cache": 0,
+            "hits_cache_negativo": 0,
+            "consultas_totvs": 0,
+            "totvs_encontrados": 0,
+            "totvs_nao_encontrados": 0,
+            "erros_totvs": 0,
+            "consultas_compartilhadas": 0,
+            "latencia_totvs_total_s": 0.0,
+            "latencia_totvs_max_s": 0.0,
+        }
+
+    def _contar(self, chave: str, valor=1):
+        with self._lock:
+            self._stats[chave] += valor
+
+    def _ler_cache(self, cnpj_clean: str):
+        """Retorna (encontrado_no_cache, idpgto)."""
+        with self._lock:
+            entry = self._cache.get(cnpj_clean)
+            if entry is None:
+                return False, None
+            idpgto, expira_em = entry
+            if expira_em < time.monotonic():
+                del self._cache[cnpj_clean]
+                return False, None
+            return True, idpgto
+
+    def _gravar_cache(self, cnpj_clean: str, idpgto: Optional[int]):
+        ttl = self.ttl if idpgto is not None else self.negative_ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            if len(self._cache) >= self.max_entries:
+                # Descarta a entrada mais antiga (dict preserva a ordem de inserção)
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[cnpj_clean] = (idpgto, time.monotonic() + ttl)
+
+    def _consultar_totvs(self, cnpj_clean: str) -> Optional[int]:
+        """
+        Consulta o IDPGTO no TOTVS via ReadView.
+        Levanta requests.RequestException em caso de falha de comunicação.
+        """
+        filtro = self.filtro.format(cnpj=formatar_cnpj(cnpj_clean), cnpj_limpo=cnpj_clean)
+        headers = {
+            "Content-Type": "text/xml; charset=utf-8",
+            "SOAPAction": "http://www.totvs.com/IwsDataServer/ReadView"
+        }
+        body = f"""<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:tot="http://www.totvs.com/">
+        <soapenv:Header/>
+        <soapenv:Body>
+            <tot:ReadView>
+                <tot:DataServerName>{self.dataserver}</tot:DataServerName>
+                <tot:Filtro>{html.escape(filtro)}</tot:Filtro>
+                <tot:Contexto>CODSISTEMA=F;CODCOLIGADA=4;CODUSUARIO={self.username}</tot:Contexto>
+            </tot:ReadView>
+        </soapenv:Body>
+    </soapenv:Envelope>"""
+
+        response = requests.post(self.url, headers=headers, data=body.encode("utf-8"),
+                                 auth=(self.username, self.password), timeout=self.timeout)
+        response.raise_for_status()
+
+        # O resultado do ReadView vem como XML escapado dentro de <ReadViewResult>
+        content = html.unescape(response.text)
+        ids = re.findall(r"<IDPGTO>\s*(\d+)\s*</IDPGTO>", content)
+        if not ids:
+            return None
+        if len(set(ids)) > 1:
+            logger.warning(f"TOTVS retornou vários IDPGTO para o CNPJ {cnpj_clean}: {ids}. Usando o primeiro.")
+        return int(ids[0])
+
+    def resolver(self, cnpj) -> Tuple[Optional[int], Optional[str]]:
+        """
+        Resolve o IDPGTO de um CNPJ/CPF.
+        
+        Returns:
+            Tupla (idpgto, origem) onde origem é "indice", "cache", "totvs" ou None (não encontrado)
+        """
+        cnpj_clean = limpar_cnpj(cnpj)
+        if len(cnpj_clean) not in (11, 14):
+            return None, None
+
+        # 1. Índice local (CSV)
+        idpgto = self.index.lookup(cnpj_clean)
+        if idpgto is not None:
+            self._contar("hits_indice")
+            return idpgto, "indice"
+
+        if not self.totvs_enabled:
+            return None, None
+
+        while True:
+            # 2. Cache TTL (acertos e ausências)
+            em_cache, idpgto = self._ler_cache(cnpj_clean)
+            if em_cache:
+                self._contar("hits_cache" if idpgto is not None else "hits_cache_negativo")
+                return idpgto, ("cache" if idpgto is not None else None)
+
+            # Apenas uma thread consulta o TOTVS por CNPJ; as demais aguardam o resultado dela
+            with self._lock:
+                consulta = self._inflight.get(cnpj_clean)
+                if consulta is None:
+                    consulta = self._inflight[cnpj_clean] = _ConsultaEmAndamento()
+                    responsavel = True
+                else:
+                    responsavel = False
+            if responsavel:
+                break
+            if consulta.evento.wait(self.timeout):
+                # O resultado vem da própria consulta (com TTL 0 ele não fica no cache)
+                self._contar("consultas_compartilhadas")
+                return consulta.resultado
+            # A consulta ainda não terminou: verifica o cache e volta a aguardar
+
+        # 3. Consulta ao TOTVS
+        try:
+            consulta.resultado = self._consultar(cnpj_clean)
+            return consulta.resultado
+        finally:
+            with self._lock:
+                self._inflight.pop(cnpj_clean)
+            consulta.evento.set()
+
+    def _consultar(self, cnpj_clean: str) -> Tuple[Optional[int], Optional[str]]:
+        """Consulta o TOTVS, grava o resultado no cache e atualiza os contadores."""
+        try:
+            self._contar("consultas_totvs")
+            inicio = time.perf_counter()
+            try:
+                idpgto = self._consultar_totvs(cnpj_clean)
+            finally:
+                duracao = time.perf_counter() - inicio
+                with self._lock:
+                    self._stats["latencia_totvs_total_s"] += duracao
+                    self._stats["latencia_totvs_max_s"] = max(self._stats["latencia_totvs_max_s"], duracao)
+            self._contar("totvs_encontrados" if idpgto is not None else "totvs_nao_encontrados")
+            self._gravar_cache(cnpj_clean, idpgto)
+            logger.info(f"IDPGTO para CNPJ {cnpj_clean} consultado no TOTVS em {duracao:.3f}s: {idpgto}")
+            return idpgto, ("totvs" if idpgto is not None else None)
+        except requests.exceptions.RequestException as e:
+            # Falhas de comunicação não são cacheadas: a próxima chamada tenta novamente
+            self._contar("erros_totvs")
+            logger.warning(f"Erro ao consultar IDPGTO do CNPJ {cnpj_clean} no TOTVS: {e}")
+            return None, None
+
+    def invalidar(self, cnpj=None):
+        """Remove um CNPJ (ou todo o cache, se None) do cache TTL."""
+        with self._lock:
+            if cnpj is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(limpar_cnpj(cnpj), None)
+
+    def estatisticas(self) -> Dict:
+        """Contadores de acertos/ausências por camada e latência das consultas ao TOTVS."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entradas_cache"] = len(self._cache)
+        consultas = stats["consultas_totvs"]
+        stats["latencia_totvs_media_s"] = stats["latencia_totvs_total_s"] / consultas if consultas else 0.0
+        return stats
+
+idpgto_resolver = IDPGTOResolver(
+    cnpj_index,
+    url=settings.SOAP_URL,
+    username=settings.SOAP_USERNAME,
+    password=settings.SOAP_PASSWORD,
+    dataserver=settings.IDPGTO_DATASERVER,
+    filtro=settings.IDPGTO_FILTRO,
+    ttl=settings.IDPGTO_CACHE_TTL,
+    negative_ttl=settings.IDPGTO_NEGATIVE_TTL,
+    timeout=settings.SOAP_TIMEOUT,
+    totvs_enabled=settings.IDPGTO_TOTVS_LOOKUP
+)
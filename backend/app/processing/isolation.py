@@ -0,0 +1,214 @@
+"""
+Execução de process_pdf em processos isolados, com prazo por documento.
+
+Um documento travado (pdfminer analisando um PDF corrompido, poppler rodando por
+minutos) não pode ser interrompido dentro de uma thread. Com DOCUMENT_TIMEOUT > 0,
+cada documento roda em um processo do pool de isolamento; estourado o prazo, o
+processo é encerrado junto com seus subprocessos (poppler/tesseract), substituído por
+um novo, e o documento volta com status "Tempo esgotado", liberando a thread do
+executor para os próximos documentos.
+
+Os processos são criados com "spawn" (sem herdar threads e conexões SQLite do
+servidor) e reaproveitados entre documentos; cada um avisa quando terminou de
+importar o pipeline, e só então o prazo do documento começa a contar.
+
+Cada processo grava seus temporários (cópias do PDF em disco, imagens do poppler e do
+pytesseract) em um diretório próprio dentro de TEMP_DIR, criado e removido pelo
+servidor: um processo encerrado à força não tem como apagá-los.
+
+No modo multi-boleto, cada processo isolado divide as páginas entre PAGE_WORKERS
+processos próprios (criados no primeiro documento multi-boleto e mantidos entre
+documentos). Eles herdam o grupo de processos e morrem junto no estouro do prazo; no
+pior caso ficam MAX_WORKERS × PAGE_WORKERS processos de páginas.
+
+Documentos perfilados (profiling pedido ou amostragem periódica) também rodam no
+processo isolado, sob o prazo: o perfil é tomado e salvo lá, onde process_pdf executa.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
+import tempfile
+import time
+from typing import Optional
+
+from ..core.config import settings
+from ..core.metrics import DOCUMENTOS, TIMEOUTS, metricas
+from ..core.profiling import perfilar
+
+logger = logging.getLogger("isolation")
+
+STATUS_TEMPO_ESGOTADO = "Tempo esgotado"
+
+# Tempo máximo para um processo novo importar o pipeline e ficar pronto
+ESPERA_INICIO_SEGUNDOS = 120
+
+_PRONTO = "pronto"
+
+def _process_pdf(args: tuple, kwargs: dict, formato_perfil: Optional[str] = None, processar=None) -> dict:
+    """
+    process_pdf(*args, **kwargs) (ou `processar`, com a mesma assinatura); com `formato_perfil`,
+    sob o perfilador (perfil salvo em PROFILING_DIR).
+    """
+    if processar is None:
+        from .pdf_processor import process_pdf as processar
+    if formato_perfil is None:
+        return processar(*args, **kwargs)
+    with perfilar(args[1]) as sessao:
+        result = processar(*args, **kwargs)
+    result["profiling"] = sessao.salvar(formato_perfil)
+    return result
+
+def _loop_processo(conn, diretorio_temp: str, processar=None):
+    """Processo isolado: recebe (args, kwargs, formato_perfil) de process_pdf e devolve (resultado, métricas)."""
+    if hasattr(os, "setsid"):
+        # Grupo de processos próprio: poppler/tesseract são encerrados junto com este processo
+        os.setsid()
+    # Temporários deste processo (e dos que ele criar) no diretório que o servidor remove
+    settings.TEMP_DIR = diretorio_temp
+    os.environ["TEMP_DIR"] = os.environ["TMPDIR"] = diretorio_temp
+    tempfile.tempdir = diretorio_temp
+    from .pdf_processor import permitir_pool_paginas_em_worker
+    # O servidor continua tratando este processo como daemon; aqui a marca é retirada
+    # porque processos daemon não podem criar o pool de páginas
+    multiprocessing.current_process().daemon = False
+    permitir_pool_paginas_em_worker()
+    metricas.zerar()
+    conn.send(_PRONTO)
+    while True:
+        try:
+            tarefa = conn.recv()
+        except EOFError:
+            break
+        if tarefa is None:
+            break
+        args, kwargs, formato_perfil = tarefa
+        try:
+            result = _process_pdf(args, kwargs, formato_perfil, processar)
+        except Exception as e:
+            result = {"status": "Erro", "error": f"Erro inesperado: {str(e)}"}
+        conn.send((result, metricas.coletar_delta()))
+
+class _ProcessoIsolado:
+    """Um processo do pool de isolamento e o pipe usado para falar com ele."""
+    def __init__(self, processar=None):
+        contexto = multiprocessing.get_context("spawn")
+        os.makedirs(settings.TEMP_DIR, exist_ok=True)
+        self.diretorio_temp = tempfile.mkdtemp(prefix="isolamento-", dir=settings.TEMP_DIR)
+        self._conn, filho = contexto.Pipe()
+        self.processo = contexto.Process(target=_loop_processo, args=(filho, self.diretorio_temp, processar),
+                                         name="isolamento-pdf", daemon=True)
+        self.processo.start()
+        filho.close()
+        try:
+            pronto = self._conn.poll(ESPERA_INICIO_SEGUNDOS) and self._conn.recv() == _PRONTO
+        except (EOFError, OSError):
+            pronto = False
+        if not pronto:
+            self.encerrar()
+            raise RuntimeError("Processo de isolamento não ficou pronto")
+
+    def executar(self, args: tuple, kwargs: dict, prazo: float, formato_perfil: Optional[str] = None) -> Optional[tuple]:
+        """(resultado, métricas) de process_pdf, ou None se o prazo estourar."""
+        self._conn.send((args, kwargs, formato_perfil))
+        if not self._conn.poll(prazo):
+            return None
+        return self._conn.recv()
+
+    def encerrar(self):
+        """Encerra o processo e todo o seu grupo (inclusive poppler/tesseract em execução) e apaga seus temporários."""
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(self.processo.pid, signal.SIGKILL)
+            else:
+                self.processo.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+        self.processo.join(timeout=5)
+        self._conn.close()
+        shutil.rmtree(self.diretorio_temp, ignore_errors=True)
+
+class PoolIsolamento:
+    """
+    Processos isolados reaproveitados entre documentos (um por chamada simultânea).
+    `processar` substitui process_pdf (função de módulo, importável no processo filho).
+    """
+    def __init__(self, processar=None):
+        self._processar = processar
+        self._livres: "queue.Queue[_ProcessoIsolado]" = queue.Queue()
+
+    def _obter(self) -> _ProcessoIsolado:
+        while True:
+            try:
+                processo = self._livres.get_nowait()
+            except queue.Empty:
+                return _ProcessoIsolado(self._processar)
+            if processo.processo.is_alive():
+                return processo
+            processo.encerrar()
+
+    def executar(self, prazo: float, *args, formato_perfil: Optional[str] = None, **kwargs) -> Optional[dict]:
+        """
+        Roda process_pdf(*args, **kwargs) em um processo isolado (perfilado, com `formato_perfil`).
+        Retorna None se o prazo estourar (o processo é encerrado e descartado).
+        """
+        processo = self._obter()
+        try:
+            resposta = processo.executar(args, kwargs, prazo, formato_perfil)
+        except (EOFError, OSError) as e:
+            # O processo morreu durante o documento (ex.: OOM killer)
+            processo.encerrar()
+            return {"status": "Erro", "error": f"Processo de isolamento encerrado inesperadamente: {e}"}
+        except BaseException:
+            processo.encerrar()
+            raise
+        if resposta is None:
+            processo.encerrar()
+            return None
+        self._livres.put(processo)
+        result, delta = resposta
+        metricas.mesclar(delta)
+        return result
+
+    def encerrar(self):
+        """Encerra os processos ociosos (desligamento da aplicação)."""
+        while True:
+            try:
+                self._livres.get_nowait().encerrar()
+            except queue.Empty:
+                break
+
+pool_isolamento = PoolIsolamento()
+
+def processar_com_prazo(pdf_file: bytes, filename: str, multi_boleto: bool = False, fields=None,
+                        profile: Optional[str] = None, trace: bool = False, formato_perfil: Optional[str] = None) -> dict:
+    """
+    process_pdf com prazo de DOCUMENT_TIMEOUT segundos, em um processo isolado que é
+    encerrado se o prazo estourar (resultado com status "Tempo esgotado").
+    Com DOCUMENT_TIMEOUT=0, roda process_pdf na thread atual. Com `formato_perfil`, o
+    documento é perfilado onde process_pdf roda e o perfil vem em result["profiling"].
+    """
+    args = (pdf_file, filename, multi_boleto, fields, profile, trace)
+    if settings.DOCUMENT_TIMEOUT <= 0:
+        return _process_pdf(args, {}, formato_perfil)
+
+    inicio = time.monotonic()
+    result = pool_isolamento.executar(settings.DOCUMENT_TIMEOUT, *args, formato_perfil=formato_perfil)
+    if result is not None:
+        result.setdefault("filename", filename)
+        return result
+
+    decorrido = time.monotonic() - inicio
+    logger.error(f"{filename}: processamento interrompido após {decorrido:.1f}s (DOCUMENT_TIMEOUT={settings.DOCUMENT_TIMEOUT}s).")
+    TIMEOUTS.incrementar(etapa="documento")
+    DOCUMENTOS.incrementar(status=STATUS_TEMPO_ESGOTADO)
+    return {
+        "filename": filename,
+        "content_hash": hashlib.sha256(pdf_file).hexdigest(),
+        "status": STATUS_TEMPO_ESGOTADO,
+        "error": f"Processamento excedeu o prazo de {settings.DOCUMENT_TIMEOUT:g}s e foi interrompido.",
+        "profile": profile
+    }
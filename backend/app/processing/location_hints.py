@@ -0,0 +1,160 @@
+"""
+Dicas de localização do código de barras por fornecedor.
+
+Cada fornecedor costuma emitir o boleto sempre na mesma página e posição. Guardamos,
+por CNPJ (ou nome do fornecedor, na falta dele), onde o último código foi encontrado:
+página, região (frações da largura/altura da página) e origem (texto/pyzbar/ocr).
+No próximo documento do mesmo fornecedor o processador tenta primeiro só essa região.
+
+Os contadores de acerto ficam no SQLite: as dicas também são usadas nos processos
+isolados (DOCUMENT_TIMEOUT > 0), no processamento em lote e no daemon de pastas, e as
+estatísticas da API precisam somar todos eles.
+"""
+import logging
+import re
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from ..core.config import settings
+from ..core.database import get_connection
+
+logger = logging.getLogger("location_hints")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dicas_localizacao (
+    chave TEXT PRIMARY KEY,
+    pagina INTEGER NOT NULL,
+    x0 REAL,
+    y0 REAL,
+    x1 REAL,
+    y1 REAL,
+    origem TEXT NOT NULL,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    acertos INTEGER NOT NULL DEFAULT 0,
+    atualizado_em TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS contadores_dicas (
+    origem TEXT PRIMARY KEY,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    acertos INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+Regiao = Tuple[float, float, float, float]
+
+def chave_fornecedor(cnpj: Optional[str], fornecedor: Optional[str] = None) -> Optional[str]:
+    """Chave da dica: CNPJ/CPF só com dígitos ou, sem ele, o nome normalizado do fornecedor."""
+    digitos = re.sub(r"[^\d]", "", cnpj or "")
+    if len(digitos) in (11, 14):
+        return digitos
+    nome = re.sub(r"\s+", " ", (fornecedor or "").strip().lower())
+    return f"nome:{nome}" if nome else None
+
+class LocationHints:
+    """Dicas por fornecedor em SQLite, com cópia em memória; contadores de acerto só no banco."""
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._dicas: Optional[Dict[str, Dict]] = None
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        # Contadores por origem no início do serviço (ver marcar_inicio)
+        self._inicio: Dict[str, Dict[str, int]] = {}
+
+    def _conn(self):
+        conn = get_connection(self.db_path)
+        if not self._schema_ready:
+            conn.executescript(_SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    def _carregar(self) -> Dict[str, Dict]:
+        """Carrega as dicas persistidas (chamado sob o lock)."""
+        if self._dicas is None:
+            self._dicas = {row["chave"]: dict(row) for row in self._conn().execute("SELECT * FROM dicas_localizacao")}
+            logger.info(f"{len(self._dicas)} dica(s) de localização carregadas de {self.db_path}")
+        return self._dicas
+
+    def obter(self, chave: Optional[str]) -> Optional[Dict]:
+        """Retorna a dica do fornecedor ({pagina, bbox, origem}) ou None."""
+        if not chave or not settings.LOCATION_HINTS:
+            return None
+        with self._lock:
+            dica = self._carregar().get(chave)
+        if dica is None:
+            return None
+        bbox = None if dica["x0"] is None else (dica["x0"], dica["y0"], dica["x1"], dica["y1"])
+        return {"pagina": dica["pagina"], "bbox": bbox, "origem": dica["origem"]}
+
+    def registrar(self, chave: Optional[str], pagina: int, bbox: Optional[Regiao], origem: str):
+        """Grava onde o código vencedor foi encontrado no documento deste fornecedor."""
+        if not chave or not settings.LOCATION_HINTS:
+            return
+        x0, y0, x1, y1 = bbox if bbox else (None, None, None, None)
+        agora = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            dicas = self._carregar()
+            dicas[chave] = {
+                "chave": chave, "pagina": pagina, "x0": x0, "y0": y0, "x1": x1, "y1": y1, "origem": origem,
+                "atualizado_em": agora
+            }
+            self._conn().execute(
+                """INSERT INTO dicas_localizacao (chave, pagina, x0, y0, x1, y1, origem, atualizado_em)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(chave) DO UPDATE SET pagina = excluded.pagina, x0 = excluded.x0, y0 = excluded.y0,
+                       x1 = excluded.x1, y1 = excluded.y1, origem = excluded.origem, atualizado_em = excluded.atualizado_em""",
+                (chave, pagina, x0, y0, x1, y1, origem, agora)
+            )
+
+    def contabilizar(self, chave: str, origem: str, acerto: bool):
+        """Registra se a tentativa pela dica encontrou o código."""
+        conn = self._conn()
+        conn.execute(
+            "UPDATE dicas_localizacao SET tentativas = tentativas + 1, acertos = acertos + ? WHERE chave = ?",
+            (int(acerto), chave)
+        )
+        conn.execute(
+            """INSERT INTO contadores_dicas (origem, tentativas, acertos) VALUES (?, 1, ?)
+               ON CONFLICT(origem) DO UPDATE SET tentativas = tentativas + 1, acertos = acertos + excluded.acertos""",
+            (origem, int(acerto))
+        )
+
+    def _contadores_por_origem(self) -> Dict[str, Dict[str, int]]:
+        return {
+            row["origem"]: {"tentativas": row["tentativas"], "acertos": row["acertos"]}
+            for row in self._conn().execute("SELECT origem, tentativas, acertos FROM contadores_dicas")
+        }
+
+    def marcar_inicio(self):
+        """Guarda os contadores atuais: as estatísticas "desde o início" contam a partir daqui (início da API)."""
+        self._inicio = self._contadores_por_origem()
+
+    def estatisticas(self) -> Dict:
+        """
+        Taxa de acerto das dicas desde o início do serviço e acumulada no banco, lidas do
+        SQLite (inclui as tentativas feitas em outros processos).
+        """
+        por_origem = {}
+        for origem, contadores in self._contadores_por_origem().items():
+            inicio = self._inicio.get(origem, {})
+            tentativas = contadores["tentativas"] - inicio.get("tentativas", 0)
+            if tentativas:
+                por_origem[origem] = {"tentativas": tentativas, "acertos": contadores["acertos"] - inicio.get("acertos", 0)}
+        tentativas = sum(contadores["tentativas"] for contadores in por_origem.values())
+        acertos = sum(contadores["acertos"] for contadores in por_origem.values())
+        row = self._conn().execute(
+            "SELECT COUNT(*) AS fornecedores, COALESCE(SUM(tentativas), 0) AS tentativas, COALESCE(SUM(acertos), 0) AS acertos "
+            "FROM dicas_localizacao"
+        ).fetchone()
+        return {
+            "fornecedores": row["fornecedores"],
+            "tentativas": tentativas,
+            "acertos": acertos,
+            "taxa_acerto": round(acertos / tentativas, 4) if tentativas else None,
+            "por_origem": por_origem,
+            "tentativas_acumuladas": row["tentativas"],
+            "acertos_acumulados": row["acertos"],
+            "taxa_acerto_acumulada": round(row["acertos"] / row["tentativas"], 4) if row["tentativas"] else None
+        }
+
+location_hints = LocationHints(settings.LOCATION_HINTS_DB_PATH)
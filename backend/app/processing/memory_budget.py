@@ -0,0 +1,193 @@
+"""
+Contabilidade de memória por documento e limites para as imagens renderizadas.
+
+Cada documento tem uma ContaMemoria (em uma ContextVar, como o trace) com o RSS do
+processo no início, o pico observado após cada renderização e, com MEMORY_TRACEMALLOC,
+o pico de memória alocada pelo Python. Com vários documentos em paralelo no mesmo
+processo, RSS e tracemalloc são do processo inteiro e os valores por documento são
+aproximados; já o tamanho das imagens renderizadas (largura x altura x canais) é exato.
+
+O orçamento de memória das imagens (MEMORY_BUDGET_MB, limitado pela folga até
+MEMORY_RSS_LIMIT_MB) decide como renderizar: todas as páginas de uma vez, uma página
+por vez ou, se nem uma página cabe, com DPI menor (até MEMORY_MIN_DPI). Sem folga
+nenhuma no início do documento, ele é adiado (MemoryBudgetError, status "Adiado").
+"""
+import gc
+import logging
+import math
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from ..core.config import settings
+from ..core.metrics import AJUSTES_MEMORIA, MEMORIA_DOCUMENTO, RSS_PROCESSO
+from ..core.tracing import evento
+from .errors import MemoryBudgetError
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:  # Windows
+    RESOURCE_AVAILABLE = False
+
+logger = logging.getLogger("memory_budget")
+
+STATUS_ADIADO = "Adiado"
+
+# Ajustes feitos por falta de memória (rótulo "acao" de AJUSTES_MEMORIA)
+AJUSTE_DPI = "dpi_reduzido"
+AJUSTE_PAGINA_A_PAGINA = "pagina_a_pagina"
+AJUSTE_ADIADO = "adiado"
+
+MB = 1024 * 1024
+
+def rss_mb() -> Optional[float]:
+    """RSS atual do processo em MB (psutil ou /proc; na falta deles, o RSS máximo)."""
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss / MB
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / MB
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if RESOURCE_AVAILABLE:
+        # ru_maxrss em KB no Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return None
+
+def _rss_processo() -> dict:
+    atual = rss_mb()
+    return {(): round(atual, 1)} if atual is not None else {}
+
+RSS_PROCESSO.observar_funcao(_rss_processo)
+
+def estimar_mb(largura_pt: float, altura_pt: float, dpi: int, canais: int = 3) -> float:
+    """Memória (MB) da imagem de uma página de largura x altura pontos renderizada em `dpi`."""
+    return (largura_pt / 72 * dpi) * (altura_pt / 72 * dpi) * canais / MB
+
+def orcamento_imagens_mb() -> float:
+    """Memória disponível agora para imagens renderizadas: MEMORY_BUDGET_MB, limitado pela folga até MEMORY_RSS_LIMIT_MB."""
+    orcamento = float(settings.MEMORY_BUDGET_MB) if settings.MEMORY_BUDGET_MB > 0 else math.inf
+    if settings.MEMORY_RSS_LIMIT_MB > 0:
+        atual = rss_mb()
+        if atual is not None:
+            orcamento = min(orcamento, settings.MEMORY_RSS_LIMIT_MB - atual)
+    return max(orcamento, 0.0)
+
+def dpi_para_orcamento(dpi: int, largura_pt: float, altura_pt: float, canais: int, orcamento_mb: float) -> int:
+    """Maior DPI (até `dpi`, não menos que MEMORY_MIN_DPI) com que uma página cabe no orçamento."""
+    custo = estimar_mb(largura_pt, altura_pt, dpi, canais)
+    if custo <= orcamento_mb:
+        return dpi
+    reduzido = int(dpi * math.sqrt(orcamento_mb / custo)) if orcamento_mb > 0 else 0
+    return max(reduzido, min(settings.MEMORY_MIN_DPI, dpi))
+
+class ContaMemoria:
+    """Memória usada durante o processamento de um documento (MB)."""
+    def __init__(self):
+        self.rss_inicio = rss_mb()
+        self.rss_pico = self.rss_inicio
+        self.tracemalloc_inicio = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self.tracemalloc_pico = self.tracemalloc_inicio
+        self.imagens_mb = 0.0
+        self.imagens_pico_mb = 0.0
+        self.ajustes: Dict[str, int] = {}
+
+    def amostrar(self):
+        """Atualiza os picos de RSS e tracemalloc (chamado após cada renderização)."""
+        atual = rss_mb()
+        if atual is not None and (self.rss_pico is None or atual > self.rss_pico):
+            self.rss_pico = atual
+        if self.tracemalloc_inicio is not None and tracemalloc.is_tracing():
+            self.tracemalloc_pico = max(self.tracemalloc_pico, tracemalloc.get_traced_memory()[0])
+
+    def registrar_imagens(self, mb: float):
+        """Soma um lote de imagens renderizadas (mantidas em memória ao mesmo tempo)."""
+        self.imagens_mb += mb
+        self.imagens_pico_mb = max(self.imagens_pico_mb, mb)
+        self.amostrar()
+
+    def medidas(self) -> Dict[str, float]:
+        """{medida: MB} observadas em MEMORIA_DOCUMENTO."""
+        medidas = {"imagens": self.imagens_pico_mb}
+        if self.rss_inicio is not None:
+            medidas["rss"] = max(0.0, self.rss_pico - self.rss_inicio)
+        if self.tracemalloc_inicio is not None:
+            medidas["tracemalloc"] = (self.tracemalloc_pico - self.tracemalloc_inicio) / MB
+        return medidas
+
+    def resumo(self) -> dict:
+        nomes = {"rss": "rss_aumento_mb", "tracemalloc": "tracemalloc_pico_mb", "imagens": "imagens_pico_mb"}
+        resumo = {nomes[medida]: round(valor, 1) for medida, valor in self.medidas().items()}
+        resumo["imagens_total_mb"] = round(self.imagens_mb, 1)
+        if self.ajustes:
+            resumo["ajustes"] = dict(self.ajustes)
+        return resumo
+
+_conta_atual: ContextVar[Optional[ContaMemoria]] = ContextVar("conta_memoria", default=None)
+
+def conta_atual() -> Optional[ContaMemoria]:
+    """Conta de memória do documento em processamento nesta thread/contexto, ou None."""
+    return _conta_atual.get()
+
+@contextmanager
+def contabilizar() -> Iterator[ContaMemoria]:
+    """Contabiliza a memória do bloco (um documento) e a registra em MEMORIA_DOCUMENTO ao final."""
+    if settings.MEMORY_TRACEMALLOC and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    conta = ContaMemoria()
+    token = _conta_atual.set(conta)
+    try:
+        yield conta
+    finally:
+        _conta_atual.reset(token)
+        conta.amostrar()
+        for medida, valor in conta.medidas().items():
+            MEMORIA_DOCUMENTO.observar(valor, medida=medida)
+
+def registrar_imagens(mb: float):
+    """Registra imagens renderizadas na conta do documento atual, se houver."""
+    conta = _conta_atual.get()
+    if conta is not None:
+        conta.registrar_imagens(mb)
+
+def registrar_ajuste(acao: str):
+    """Conta um ajuste por falta de memória (métrica, conta do documento e trace)."""
+    AJUSTES_MEMORIA.incrementar(acao=acao)
+    conta = _conta_atual.get()
+    if conta is not None:
+        conta.ajustes[acao] = conta.ajustes.get(acao, 0) + 1
+    evento(f"memoria_{acao}")
+
+def aguardar_memoria(filename: str):
+    """
+    No início de um documento: se o RSS já passou de MEMORY_RSS_LIMIT_MB, coleta o lixo e
+    espera até MEMORY_DEFER_SECONDS que outros documentos liberem memória. Persistindo,
+    levanta MemoryBudgetError (o documento é adiado em vez de derrubar o worker).
+    """
+    if settings.MEMORY_RSS_LIMIT_MB <= 0:
+        return
+    limite = time.monotonic() + settings.MEMORY_DEFER_SECONDS
+    while True:
+        atual = rss_mb()
+        if atual is None or atual < settings.MEMORY_RSS_LIMIT_MB:
+            return
+        gc.collect()
+        if time.monotonic() >= limite:
+            break
+        time.sleep(0.5)
+    registrar_ajuste(AJUSTE_ADIADO)
+    logger.warning(f"{filename}: RSS de {atual:.0f} MB acima do limite de {settings.MEMORY_RSS_LIMIT_MB} MB; documento adiado.")
+    raise MemoryBudgetError(
+        f"Memória insuficiente (RSS {atual:.0f} MB, limite {settings.MEMORY_RSS_LIMIT_MB} MB); documento adiado.",
+        filename=filename
+    )
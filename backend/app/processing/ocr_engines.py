@@ -0,0 +1,142 @@
+"""
+Motores de OCR: tesserocr (API do Tesseract em processo) e pytesseract (subprocesso).
+
+O pytesseract grava a imagem em um arquivo temporário e executa o binário
+TESSERACT_CMD a cada página, recarregando o modelo "por" toda vez. Com o tesserocr,
+cada processo mantém um pool de handles do Tesseract já inicializados (criados sob
+demanda, até OCR_POOL_SIZE em uso ao mesmo tempo), e a imagem é passada em memória.
+Nos workers de páginas e nos processos isolados, cada processo tem o seu pool.
+
+OCR_ENGINE escolhe o motor: "auto" usa o tesserocr se estiver instalado e o modelo
+carregar, senão o pytesseract; "pytesseract" força o subprocesso. Se o tesserocr
+falhar ao inicializar, o processo passa a usar o pytesseract.
+"""
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from ..core.config import settings
+
+try:
+    import pytesseract
+    pytesseract.pytesseract.tesseract_cmd = settings.TESSERACT_CMD
+    PYTESSERACT_AVAILABLE = True
+except ImportError:
+    PYTESSERACT_AVAILABLE = False
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+logger = logging.getLogger("ocr_engines")
+
+MOTOR_AUTO = "auto"
+MOTOR_TESSEROCR = "tesserocr"
+MOTOR_PYTESSERACT = "pytesseract"
+
+IDIOMA = "por"
+
+class PoolTesseract:
+    """Handles do tesserocr inicializados, reaproveitados entre páginas (um por thread em uso)."""
+    def __init__(self):
+        self._livres: "queue.LifoQueue" = queue.LifoQueue()
+        self.criados = 0
+        self._lock = threading.Lock()
+        self.falha: Optional[Exception] = None
+
+    def _tamanho(self) -> int:
+        return max(1, settings.OCR_POOL_SIZE or settings.MAX_WORKERS)
+
+    def _criar(self):
+        kwargs = {"lang": IDIOMA}
+        if settings.TESSDATA_DIR:
+            kwargs["path"] = settings.TESSDATA_DIR
+        inicio = time.perf_counter()
+        api = tesserocr.PyTessBaseAPI(**kwargs)
+        logger.info(f"Handle do Tesseract ({IDIOMA}) inicializado em {time.perf_counter() - inicio:.2f}s.")
+        return api
+
+    @contextmanager
+    def handle(self) -> Iterator["tesserocr.PyTessBaseAPI"]:
+        """Handle livre do pool; cria um novo se o pool ainda não chegou a OCR_POOL_SIZE, senão espera."""
+        try:
+            api = self._livres.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                criar = self.criados < self._tamanho()
+                if criar:
+                    self.criados += 1
+            if criar:
+                try:
+                    api = self._criar()
+                except BaseException:
+                    with self._lock:
+                        self.criados -= 1
+                    raise
+            else:
+                api = self._livres.get()
+        try:
+            yield api
+        finally:
+            api.Clear()
+            self._livres.put(api)
+
+    def encerrar(self):
+        """Libera os handles ociosos (desligamento da aplicação)."""
+        while True:
+            try:
+                api = self._livres.get_nowait()
+            except queue.Empty:
+                break
+            api.End()
+            with self._lock:
+                self.criados -= 1
+
+pool_tesseract = PoolTesseract()
+
+def motor_ativo() -> str:
+    """Motor usado neste processo, conforme OCR_ENGINE e a disponibilidade do tesserocr."""
+    if settings.OCR_ENGINE == MOTOR_PYTESSERACT or not TESSEROCR_AVAILABLE or pool_tesseract.falha is not None:
+        return MOTOR_PYTESSERACT
+    return MOTOR_TESSEROCR
+
+def _definir_imagem(api, img):
+    """Passa a página em memória: matriz 2D uint8 (de _rasterizar) ou imagem PIL."""
+    if hasattr(img, "shape"):
+        altura, largura = img.shape[:2]
+        canais = img.shape[2] if img.ndim == 3 else 1
+        api.SetImageBytes(img.tobytes(), largura, altura, canais, largura * canais)
+    else:
+        api.SetImage(img)
+
+def _reconhecer_tesserocr(img, timeout: float) -> str:
+    with pool_tesseract.handle() as api:
+        _definir_imagem(api, img)
+        inicio = time.monotonic()
+        if not api.Recognize(timeout=int(timeout * 1000)):
+            if timeout and time.monotonic() - inicio >= timeout:
+                # Mesma mensagem do pytesseract, tratada como prazo estourado em _tesseract
+                raise RuntimeError("Tesseract process timeout")
+            raise RuntimeError("Falha no reconhecimento do Tesseract (tesserocr)")
+        return api.GetUTF8Text()
+
+def reconhecer(img, timeout: float = 0) -> str:
+    """
+    Texto da página em português. `timeout` em segundos (0 = sem prazo); estourado,
+    levanta RuntimeError com "timeout" na mensagem, nos dois motores.
+    """
+    if motor_ativo() == MOTOR_TESSEROCR:
+        try:
+            return _reconhecer_tesserocr(img, timeout)
+        except RuntimeError as e:
+            if "timeout" in str(e).lower() or pool_tesseract.criados:
+                raise
+            # Nenhum handle pôde ser criado (ex.: modelo "por" ausente do tessdata)
+            pool_tesseract.falha = e
+            logger.warning(f"tesserocr não inicializou ({e}); usando pytesseract ({settings.TESSERACT_CMD}).")
+    return pytesseract.image_to_string(img, lang=IDIOMA, timeout=timeout)
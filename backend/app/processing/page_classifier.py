@@ -0,0 +1,154 @@
+import logging
+import re
+import unicodedata
+from typing import Callable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger("page_classifier")
+
+PAGINA_BOLETO = "boleto"
+PAGINA_DANFE = "danfe"
+PAGINA_OUTRA = "outra"
+# Sem texto e sem imagem utilizável: a página precisa ser analisada
+PAGINA_INDEFINIDA = "indefinida"
+
+PALAVRAS_BOLETO = (
+    "ficha de compensacao", "recibo do pagador", "recibo do sacado", "linha digitavel",
+    "nosso numero", "local de pagamento", "pagavel em qualquer", "autenticacao mecanica",
+    "beneficiario", "cedente", "sacado", "data de vencimento", "valor do documento",
+    "codigo de barras", "agencia/codigo"
+)
+PALAVRAS_DANFE = (
+    "danfe", "documento auxiliar da nota fiscal", "nota fiscal eletronica", "chave de acesso",
+    "protocolo de autorizacao", "natureza da operacao", "calculo do imposto", "dados adicionais"
+)
+
+# Mínimo de caracteres (sem espaços) para a camada de texto ser considerada confiável
+MIN_CARACTERES_TEXTO = 30
+
+# Faixa de código de barras na imagem em baixa resolução
+MIN_TRANSICOES_LINHA = 40     # transições preto/branco em uma linha da faixa
+MAX_VARIACAO_LINHA = 0.5      # fração das transições que pode mudar de uma linha para a seguinte
+MIN_ALTURA_FAIXA_MM = 8.0     # o código do boleto tem 13 mm de altura
+INICIO_FICHA_COMPENSACAO = 0.45  # faixas abaixo desta fração da altura indicam boleto
+ALTURA_FICHA_COMPENSACAO = 0.40  # do topo da ficha (linha digitável) até o código de barras
+
+def _normalizar(texto: str) -> str:
+    sem_acentos = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"\s+", " ", sem_acentos.lower())
+
+def classificar_texto(texto: Optional[str]) -> Optional[str]:
+    """
+    Classifica a página pelo texto extraído (palavras-chave de boleto e de DANFE).
+
+    Returns:
+        PAGINA_BOLETO, PAGINA_DANFE, PAGINA_OUTRA ou None quando a camada de texto
+        é vazia/ilegível e a página precisa ser classificada pela imagem.
+    """
+    if not texto or len(re.sub(r"\s+", "", texto)) < MIN_CARACTERES_TEXTO:
+        return None
+    if len(re.findall(r"\(cid:\d+\)", texto)) > len(texto.split()) * 0.2:
+        return None
+
+    normalizado = _normalizar(texto)
+    pontos_boleto = sum(1 for palavra in PALAVRAS_BOLETO if palavra in normalizado)
+    pontos_danfe = sum(1 for palavra in PALAVRAS_DANFE if palavra in normalizado)
+
+    if pontos_boleto >= 2 and pontos_boleto >= pontos_danfe:
+        return PAGINA_BOLETO
+    if pontos_danfe >= 2:
+        return PAGINA_DANFE
+    if pontos_boleto:
+        return PAGINA_BOLETO
+    return PAGINA_OUTRA
+
+def localizar_faixas_codigo_barras(imagem, dpi: int) -> List[float]:
+    """
+    Procura faixas de código de barras em uma imagem de baixa resolução: sequências de
+    linhas com muitas transições preto/branco que se repetem quase iguais de uma linha
+    para a outra (texto muda de forma a cada linha; barras verticais não).
+
+    Returns:
+        Posição vertical do centro de cada faixa, como fração da altura da página (0 = topo).
+    """
+    if not isinstance(imagem, np.ndarray):
+        imagem = np.asarray(imagem.convert("L"))
+    pixels = imagem < 128
+    if pixels.shape[0] < 2:
+        return []
+    transicoes = np.count_nonzero(pixels[:, 1:] != pixels[:, :-1], axis=1)
+    variacao = np.count_nonzero(pixels[1:] != pixels[:-1], axis=1)
+
+    candidatas = np.zeros(pixels.shape[0], dtype=bool)
+    candidatas[:-1] = (transicoes[:-1] >= MIN_TRANSICOES_LINHA) & (variacao <= transicoes[:-1] * MAX_VARIACAO_LINHA)
+
+    min_linhas = max(2, int(MIN_ALTURA_FAIXA_MM / 25.4 * dpi))
+    faixas = []
+    inicio = None
+    for linha, candidata in enumerate(np.append(candidatas, False)):
+        if candidata and inicio is None:
+            inicio = linha
+        elif not candidata and inicio is not None:
+            if linha - inicio >= min_linhas:
+                faixas.append((inicio + linha) / 2 / pixels.shape[0])
+            inicio = None
+    return faixas
+
+def classificar_imagem(imagem, dpi: int) -> str:
+    """
+    Classifica uma página sem texto pela posição das faixas de código de barras:
+    a ficha de compensação do boleto fica na parte de baixo; o código da DANFE, no topo.
+    """
+    if not NUMPY_AVAILABLE:
+        return PAGINA_INDEFINIDA
+    faixas = localizar_faixas_codigo_barras(imagem, dpi)
+    if any(posicao >= INICIO_FICHA_COMPENSACAO for posicao in faixas):
+        return PAGINA_BOLETO
+    if faixas:
+        return PAGINA_DANFE
+    return PAGINA_OUTRA
+
+def regiao_linha_digitavel(imagem, dpi: int) -> Tuple[float, float]:
+    """
+    Faixa vertical (topo, base), em frações da altura, onde a linha digitável deve estar:
+    da ficha de compensação até o código de barras encontrado na parte de baixo da página.
+    Sem código de barras detectado, retorna a parte de baixo da página inteira.
+    """
+    faixas = []
+    if NUMPY_AVAILABLE:
+        faixas = [posicao for posicao in localizar_faixas_codigo_barras(imagem, dpi) if posicao >= INICIO_FICHA_COMPENSACAO]
+    if faixas:
+        base = max(faixas)
+        return max(0.0, base - ALTURA_FICHA_COMPENSACAO), min(1.0, base + 0.02)
+    return INICIO_FICHA_COMPENSACAO, 1.0
+
+def classificar_paginas(textos: Sequence[str], renderizar: Callable[[List[int]], list], dpi: int) -> List[str]:
+    """
+    Classifica todas as páginas: pelo texto quando há camada de texto e, nas demais,
+    pela imagem renderizada em baixa resolução.
+
+    Args:
+        textos: Texto de cada página (na ordem).
+        renderizar: Recebe os números (a partir de 1) das páginas sem texto e retorna suas imagens.
+        dpi: Resolução usada por `renderizar`.
+    """
+    classes: List[Optional[str]] = [classificar_texto(texto) for texto in textos]
+    sem_texto = [numero for numero, classe in enumerate(classes, start=1) if classe is None]
+    if sem_texto:
+        try:
+            imagens = renderizar(sem_texto)
+        except Exception as e:
+            logger.warning(f"Erro ao renderizar páginas para classificação: {e}")
+            imagens = [None] * len(sem_texto)
+        for numero, imagem in zip(sem_texto, imagens):
+            classes[numero - 1] = classificar_imagem(imagem, dpi) if imagem is not None else PAGINA_INDEFINIDA
+    return [classe or PAGINA_INDEFINIDA for classe in classes]
+
+def precisa_analise(classe: str) -> bool:
+    """True se a página deve passar pelo pyzbar/OCR (boleto ou não classificada)."""
+    return classe in (PAGINA_BOLETO, PAGINA_INDEFINIDA)
@@ -2,22 +2,25 @@
 import streamlit as st
 import sqlite3
 import datetime
+import hashlib
 import logging # Será configurado depois
 import sys
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, JsCode
 import pandas as pd
 import pdfplumber
 import re
 import os
-import tempfile
 import io # Necessário para BytesIO
 from io import BytesIO # Especificamente BytesIO
 import requests
 from requests.auth import HTTPBasicAuth
-from typing import Optional, List, Tuple # Adicionado List e Tuple
+from typing import Iterable, Iterator, Optional, List, Tuple # Adicionado List e Tuple
 
 from pdfminer.high_level import extract_text as pdfminer_extract_text
 from pdfminer.layout import LAParams
@@ -32,13 +35,35 @@ from .errors import (
     ConfigurationError,
     SOAPAPIError, # Adicionada para uso em enviar_dados_soap
     CNPJLookupError, # Adicionada para uso em get_idpgto_by_cnpj ou chamadores
-    InvalidDataError # Adicionada para uso geral
+    InvalidDataError, # Adicionada para uso geral
+    MemoryBudgetError
 )
+from .cnpj_index import cnpj_index
+from .idpgto_resolver import idpgto_resolver
+from .pdf_source import PDFSource
+from .location_hints import location_hints, chave_fornecedor
+from .page_classifier import (
+    PAGINA_DANFE, PAGINA_INDEFINIDA, classificar_paginas, classificar_texto, classificar_imagem, precisa_analise,
+    regiao_linha_digitavel
+)
+from .extraction_profiles import OCR_COMPLETO, OCR_REGIAO, OrcamentoExtracao, obter_perfil
+from .ocr_engines import reconhecer
+from .rasterizers import RASTERIZACAO_DISPONIVEL, obter_rasterizador
+from .text_extractors import obter_extrator
+from .memory_budget import (
+    AJUSTE_DPI, AJUSTE_PAGINA_A_PAGINA, MB, STATUS_ADIADO, aguardar_memoria, contabilizar, dpi_para_orcamento,
+    estimar_mb, orcamento_imagens_mb, registrar_ajuste, registrar_imagens
+)
+from ..core.config import settings
+from ..core.metrics import DOCUMENTOS, DURACAO_DOCUMENTO, DURACAO_ETAPA, FILA_EXECUTOR, ORIGEM_CODIGO, TIMEOUTS, etapa, metricas
+from ..core.tracing import evento, rastrear, trace_atual
+from ..core.profiling import encerrar_perfil_worker, iniciar_perfil_worker, sessao_atual
+
+logger = logging.getLogger("pdf_processor")
 
 # Adicione ao seu código de importação
 try:
     import pytesseract
-    import pdf2image
     from PIL import Image
     import numpy as np
     try:
@@ -47,7 +72,7 @@ try:
     except ImportError:
         BARCODE_DETECTION_AVAILABLE = False
         # logger.warning("pyzbar não instalado. Detecção direta de códigos de barras limitada.")
-    OCR_AVAILABLE = True
+    OCR_AVAILABLE = RASTERIZACAO_DISPONIVEL
 except ImportError:
     BARCODE_DETECTION_AVAILABLE = False
     OCR_AVAILABLE = False
@@ -87,27 +112,7 @@ def load_cnpj_idpgto_mapping():
     Carrega o mapeamento CNPJ → IDPGTO do arquivo CSV.
     Retorna um dicionário com CNPJs limpos (apenas números) como chaves e IDPGTO como valores.
     """
-    mapping = {}
-    try:
-        # Carregar o arquivo CSV com delimitador ";"
-        df = pd.read_csv("Listas_Fornecedores1.csv", sep=";", encoding="utf-8")
-        
-        for _, row in df.iterrows():
-            try:
-                idpgto = int(row["IDPGTO"])
-                cnpj = str(row["CNPJ/CPF"]).strip()
-                cnpj_clean = re.sub(r"[^\d]", "", cnpj)
-                if cnpj_clean:
-                    mapping[cnpj_clean] = idpgto
-            except (ValueError, KeyError) as e:
-                logger.warning(f"Erro ao processar linha do CSV de mapeamento CNPJ: {row} - {e}")
-                continue
-    except FileNotFoundError:
-        logger.error("Arquivo Listas_Fornecedores1.csv não encontrado. Mapeamento CNPJ->IDPGTO não carregado.")
-        # Poderia levantar uma ConfigurationError aqui se o arquivo for essencial
-    except Exception as e:
-        logger.error(f"Erro ao carregar o arquivo de mapeamento CNPJ: {e}", exc_info=True)
-    return mapping
+    return cnpj_index.as_dict()
 
 def get_idpgto_by_cnpj(cnpj):
     """
@@ -125,22 +130,22 @@ def get_idpgto_by_cnpj(cnpj):
     if not cnpj or cnpj == "Não encontrado":
         return None, False
     
-    # Limpar CNPJ (remover formatação)
-    cnpj_clean = re.sub(r'[^\d]', '', str(cnpj))
-    
-    if not cnpj_clean or len(cnpj_clean) not in [11, 14]:  # CPF tem 11, CNPJ tem 14
-        return None, False
-    
-    # Carregar mapeamento (com cache para melhor performance)
-    if not hasattr(get_idpgto_by_cnpj, "_mapping"):
-        get_idpgto_by_cnpj._mapping = load_cnpj_idpgto_mapping()
-    
-    # Buscar no mapeamento
-    if cnpj_clean in get_idpgto_by_cnpj._mapping:
-        return get_idpgto_by_cnpj._mapping[cnpj_clean], True
+    # Índice local → cache TTL → consulta ao TOTVS
+    idpgto, _ = idpgto_resolver.resolver(cnpj)
+    if idpgto is not None:
+        return idpgto, True
     
     return None, False
 
+def get_idpgto_by_cnpjs(cnpjs):
+    """
+    Obtém o IDPGTO de vários CNPJs de uma só vez.
+    
+    Returns:
+        Dicionário {cnpj_informado: idpgto ou None}
+    """
+    return cnpj_index.lookup_many(cnpjs)
+
 # Função para enviar dados via SOAP
 
 def enviar_dados_soap(idlan, ipte, idpgto=None, cnpj=None, origem_deteccao=None):
@@ -289,35 +294,34 @@ def has_cid_markers(text: Optional[str]) -> bool:
         return cid_count > 0
     return cid_count > 0 and (cid_count / total_words) > 0.2
 
-def _extract_text_from_pdf_page(page: pdfplumber.page.Page) -> str:
-    """Extrai texto de uma única página usando pdfplumber com tolerâncias ajustadas."""
+def _extract_text_pages(source: PDFSource, filename: str, paginas: Optional[List[int]] = None) -> List[str]:
+    """
+    Texto das páginas (None = todas) com o motor de TEXT_EXTRACTOR (ver text_extractors),
+    cronometrado como a etapa com o nome do motor.
+    """
+    extrator = obter_extrator()
     try:
-        return page.extract_text(x_tolerance=1, y_tolerance=1) or ""
+        with etapa(extrator.nome):
+            return extrator.extrair(source, paginas)
+    except (InvalidPDFError, ConfigurationError):
+        raise
     except Exception as e:
-        logger.warning(f"Erro ao extrair texto da página com pdfplumber: {e}")
-        return ""
+        raise PDFTextExtractionError(f"Erro ao abrir/processar PDF com {extrator.nome}: {e}", original_exception=e, filename=filename)
 
-def _extract_text_with_pdfplumber(pdf_path: str, filename: str) -> str:
-    """Extrai texto de um arquivo PDF usando pdfplumber."""
-    full_text = []
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for i, page in enumerate(pdf.pages):
-                # logger.debug(f"Extraindo texto da página {i+1}/{len(pdf.pages)} de {filename} com pdfplumber")
-                txt = _extract_text_from_pdf_page(page)
-                full_text.append(txt)
-        return "\n".join(full_text)
-    except pdfplumber.exceptions.PDFSyntaxError as e:
-        raise InvalidPDFError(f"Erro de sintaxe no PDF: {e}", original_exception=e, filename=filename)
-    except Exception as e:
-        raise PDFTextExtractionError(f"Erro ao abrir/processar PDF com pdfplumber: {e}", original_exception=e, filename=filename)
+def _extract_text_layer(source: PDFSource, filename: str) -> str:
+    """Extrai a camada de texto de todas as páginas, guardando o texto de cada uma no cache da fonte."""
+    textos = _extract_text_pages(source, filename)
+    source.cache["textos_pagina"] = textos
+    return "\n".join(textos)
 
-def _extract_text_with_pdfminer(pdf_path: str, filename: str) -> str:
-    """Extrai texto de um arquivo PDF usando pdfminer.six."""
+@etapa("pdfminer")
+def _extract_text_with_pdfminer(source: PDFSource, filename: str) -> str:
+    """Extrai texto de um PDF em memória usando pdfminer.six."""
     try:
         logger.debug(f"Tentando extração com pdfminer.six para {filename}")
         laparams = LAParams(all_texts=True, line_margin=0.2)
-        extracted_text = pdfminer_extract_text(pdf_path, laparams=laparams)
+        with source.open() as pdf_stream:
+            extracted_text = pdfminer_extract_text(pdf_stream, laparams=laparams)
         # logger.info(f"Texto extraído com pdfminer.six para {filename} (len: {len(extracted_text)})")
         return extracted_text
     except ImportError:
@@ -327,20 +331,26 @@ def _extract_text_with_pdfminer(pdf_path: str, filename: str) -> str:
     except Exception as e:
         raise PDFTextExtractionError(f"Erro ao usar pdfminer.six: {e}", original_exception=e, filename=filename)
 
-def _get_primary_text_extraction(pdf_path: str, filename: str) -> str:
-    """Tenta extrair texto usando pdfplumber e, se necessário, pdfminer como fallback."""
-    logger.info(f"Iniciando extração de texto primária para {filename}")
-    text_pdfplumber = _extract_text_with_pdfplumber(pdf_path, filename)
+def _get_primary_text_extraction(source: PDFSource, filename: str) -> str:
+    """Tenta extrair texto com o motor de TEXT_EXTRACTOR e, se necessário, pdfminer como fallback."""
+    if "texto_primario" not in source.cache:
+        source.cache["texto_primario"] = _extract_primary_text(source, filename)
+    return source.cache["texto_primario"]
 
-    if not text_pdfplumber.strip() or has_cid_markers(text_pdfplumber):
-        logger.warning(f"Texto de pdfplumber insatisfatório para {filename} (vazio ou muitos CIDs). Tentando pdfminer.six.")
-        text_pdfminer = _extract_text_with_pdfminer(pdf_path, filename)
-        # Usa pdfminer se extraiu algo e é significativamente diferente/melhor, ou se pdfplumber não retornou nada
-        if text_pdfminer and (len(text_pdfminer.strip()) > len(text_pdfplumber.strip()) + 10 or not text_pdfplumber.strip()):
+def _extract_primary_text(source: PDFSource, filename: str) -> str:
+    logger.info(f"Iniciando extração de texto primária para {filename}")
+    texto_camada = _extract_text_layer(source, filename)
+
+    if not texto_camada.strip() or has_cid_markers(texto_camada):
+        evento("cid" if texto_camada.strip() else "texto_vazio")
+        logger.warning(f"Camada de texto insatisfatória para {filename} (vazio ou muitos CIDs). Tentando pdfminer.six.")
+        text_pdfminer = _extract_text_with_pdfminer(source, filename)
+        # Usa pdfminer se extraiu algo e é significativamente diferente/melhor, ou se a camada de texto veio vazia
+        if text_pdfminer and (len(text_pdfminer.strip()) > len(texto_camada.strip()) + 10 or not texto_camada.strip()):
             logger.info(f"Usando resultado do pdfminer.six para {filename}.")
             return text_pdfminer
-        logger.info(f"Mantendo resultado do pdfplumber (ou vazio) para {filename} após tentativa com pdfminer.")
-    return text_pdfplumber
+        logger.info(f"Mantendo a camada de texto (ou vazio) para {filename} após tentativa com pdfminer.")
+    return texto_camada
 
 def validar_digito_mod10(campo, com_dv=True):
     """
@@ -514,10 +524,13 @@ def validar_codigo_barras(codigo):
     
     # Verificar o tipo de código baseado no comprimento e primeiro dígito
     if len(codigo_clean) == 44:
-        # Pode ser NFe (44 dígitos) ou código de barras de boleto (44 dígitos)
-        if codigo_clean[0] in "0123456789":
-            # Provavelmente NFe
-            return validar_digito_mod11_nfe(codigo_clean), "nfe"
+        # Pode ser NFe (44 dígitos) ou código de barras de boleto/arrecadação (44 dígitos)
+        # Só é tratado como NF-e se tiver o formato de chave e o DV de NF-e conferir
+        if is_nfe_access_key(codigo_clean) and validar_digito_mod11_nfe(codigo_clean):
+            return True, "nfe"
+        if validar_codigo_barras_44(codigo_clean):
+            return True, "arrecadacao" if codigo_clean[0] == "8" else "boleto"
+        return validar_digito_mod11_nfe(codigo_clean), "nfe"
         
     elif len(codigo_clean) == 47:
         # Linha digitável de boleto (47 dígitos)
@@ -530,6 +543,109 @@ def validar_codigo_barras(codigo):
     # Outros casos não implementados ainda
     return False, "desconhecido"
 
+def _dv_geral_boleto(codigo_sem_dv):
+    """
+    Calcula o DV geral do código de barras de boleto (Módulo 11 FEBRABAN).
+    Diferente do DV de campo, resultados 0, 10 e 11 viram 1.
+    """
+    soma = 0
+    peso = 2
+    for i in range(len(codigo_sem_dv)-1, -1, -1):
+        soma += int(codigo_sem_dv[i]) * peso
+        peso = peso + 1 if peso < 9 else 2
+    dv = 11 - (soma % 11)
+    return 1 if dv in (0, 10, 11) else dv
+
+def validar_codigo_barras_44(codigo):
+    """
+    Valida um código de barras (44 dígitos, lido pelo leitor) de boleto ou arrecadação.
+    
+    Args:
+        codigo: String com o código de barras normalizado (44 dígitos)
+    
+    Returns:
+        Boolean indicando se o DV geral do código é válido
+    """
+    if not codigo or len(codigo) != 44 or not codigo.isdigit():
+        return False
+    
+    if codigo[0] == "8":
+        # Arrecadação: DV geral na posição 4, módulo definido pelo 3º dígito
+        if codigo[2] in "67":
+            dv_calculado = validar_digito_mod10(codigo[:3] + codigo[4:], com_dv=False)
+        elif codigo[2] in "89":
+            dv_calculado = validar_digito_mod11_febraban(codigo[:3] + codigo[4:], com_dv=False)
+        else:
+            return False
+        return int(codigo[3]) == dv_calculado
+    
+    # Boleto: DV geral na posição 5
+    return int(codigo[4]) == _dv_geral_boleto(codigo[:4] + codigo[5:])
+
+def linha_digitavel_para_codigo_barras(codigo):
+    """
+    Converte uma linha digitável (47/48 dígitos) no código de barras de 44 dígitos.
+    Códigos de 44 dígitos são retornados sem alteração.
+
+    Args:
+        codigo: String com o código normalizado (apenas dígitos)
+
+    Returns:
+        String com o código de barras (44 dígitos) ou None se o tamanho não for suportado
+    """
+    if not codigo or not codigo.isdigit():
+        return None
+    if len(codigo) == 44:
+        return codigo
+    if len(codigo) == 47:
+        # Boleto: banco/moeda, DV geral, fator/valor e campo livre (sem os DVs dos campos)
+        return codigo[:4] + codigo[32] + codigo[33:47] + codigo[4:9] + codigo[10:20] + codigo[21:31]
+    if len(codigo) == 48:
+        # Arrecadação: quatro blocos de 11 dígitos, cada um seguido do seu DV
+        return codigo[:11] + codigo[12:23] + codigo[24:35] + codigo[36:47]
+    return None
+
+# Data base do fator de vencimento (FEBRABAN). O fator chegou a 9999 em 21/02/2025 e
+# recomeçou em 1000 no dia seguinte, então o mesmo fator aponta para datas 9000 dias distantes.
+DATA_BASE_FATOR_VENCIMENTO = datetime.date(1997, 10, 7)
+CICLO_FATOR_VENCIMENTO = 9000
+
+def extrair_valor_vencimento(codigo, referencia: Optional[datetime.date] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Lê o valor e o vencimento codificados no código de barras/linha digitável.
+
+    Args:
+        codigo: String com o código normalizado (44, 47 ou 48 dígitos)
+        referencia: Data usada para escolher o ciclo do fator de vencimento (padrão: hoje)
+
+    Returns:
+        Tupla (valor, vencimento): valor com duas casas decimais ("1234.56") e vencimento
+        no formato ISO ("2025-03-10"). Campos ausentes no código retornam None.
+    """
+    barras = linha_digitavel_para_codigo_barras(codigo)
+    if not barras:
+        return None, None
+
+    if barras[0] == "8":
+        # Arrecadação: valor efetivo apenas quando o identificador de valor é 6 ou 8
+        if barras[2] not in ("6", "8"):
+            return None, None
+        centavos = int(barras[4:15])
+        return (f"{centavos / 100:.2f}" if centavos else None), None
+
+    fator = int(barras[5:9])
+    centavos = int(barras[9:19])
+    valor = f"{centavos / 100:.2f}" if centavos else None
+    if fator < 1000:
+        return valor, None
+
+    referencia = referencia or datetime.date.today()
+    vencimento = DATA_BASE_FATOR_VENCIMENTO + datetime.timedelta(days=fator)
+    proximo_ciclo = vencimento + datetime.timedelta(days=CICLO_FATOR_VENCIMENTO)
+    if abs((proximo_ciclo - referencia).days) < abs((vencimento - referencia).days):
+        vencimento = proximo_ciclo
+    return valor, vencimento.isoformat()
+
 def validar_boleto(linha_digitavel):
     """
     Valida uma linha digitável de boleto de 47 dígitos.
@@ -571,7 +687,7 @@ def validar_boleto(linha_digitavel):
     # Validar DV geral (campo4) usando Módulo 11 FEBRABAN
     # O DV está na posição 4 do código de barras reconstruído
     campo_para_validar = codigo_barras[:4] + codigo_barras[5:]  # Todos exceto o DV
-    dv_calculado = validar_digito_mod11_febraban(campo_para_validar, com_dv=False)
+    dv_calculado = _dv_geral_boleto(campo_para_validar)
     
     return int(campo4) == dv_calculado
 
@@ -763,22 +879,26 @@ def _filtrar_codigos_por_validade(codigos_candidatos):
     return [codigo for codigo, _ in todos_codigos_priorizados]
 
 
-def extract_barcode_from_image(image):
+@etapa("pyzbar")
+def extract_barcodes_with_position(image) -> List[Tuple[str, Tuple[float, float, float, float]]]:
     """
-    Extrai diretamente códigos de barras de uma imagem usando pyzbar,
-    aplicando validação por checksum para filtrar códigos inválidos.
-    
+    Extrai diretamente códigos de barras de uma imagem usando pyzbar, com a região de cada
+    um (x0, y0, x1, y1 como frações da largura/altura da imagem).
+
     Args:
-        image: Imagem PIL ou numpy array
-        
+        image: Imagem PIL ou matriz numpy (as páginas de _rasterizar são 2D em tons de cinza)
+
     Returns:
-        Lista de códigos de barras encontrados, priorizados por tipo e validade,
-        ou lista vazia se nenhum for encontrado
+        Lista de (código, região) priorizada por tipo e validade (ver _filtrar_codigos_por_validade)
     """
     try:
         from pyzbar.pyzbar import decode
+        if hasattr(image, "shape"):
+            altura, largura = image.shape[:2]
+        else:
+            largura, altura = image.size
         barcodes = decode(image)
-        candidates = []
+        regioes = {}
         
         for barcode in barcodes:
             # Decodificar e limpar os dados do código de barras
@@ -791,11 +911,14 @@ def extract_barcode_from_image(image):
             
             # Verificar se o código tem o tamanho esperado (44, 47 ou 48 dígitos)
             if len(cleaned_data) in [44, 47, 48] and cleaned_data.isdigit():
-                candidates.append(cleaned_data)
+                rect = barcode.rect
+                regioes.setdefault(cleaned_data, (
+                    rect.left / largura, rect.top / altura,
+                    (rect.left + rect.width) / largura, (rect.top + rect.height) / altura
+                ))
         
         # Priorizar os códigos válidos e filtrar os inválidos
-        filtered_barcodes = _filtrar_codigos_por_validade(candidates)
-        return filtered_barcodes
+        return [(codigo, regioes[codigo]) for codigo in _filtrar_codigos_por_validade(list(regioes))]
         
     except ImportError:
         logger.warning("Módulo pyzbar não instalado. Detecção direta de códigos de barras indisponível.")
@@ -804,13 +927,27 @@ def extract_barcode_from_image(image):
         logger.error(f"Erro ao decodificar código de barras: {e}")
         return []
 
+def extract_barcode_from_image(image):
+    """
+    Extrai diretamente códigos de barras de uma imagem usando pyzbar,
+    aplicando validação por checksum para filtrar códigos inválidos.
+    
+    Args:
+        image: Imagem PIL ou numpy array
+        
+    Returns:
+        Lista de códigos de barras encontrados, priorizados por tipo e validade,
+        ou lista vazia se nenhum for encontrado
+    """
+    return [codigo for codigo, _ in extract_barcodes_with_position(image)]
+
 def extract_barcode_with_opencv(image):
     """
     Tenta extrair códigos de barras usando OpenCV.
     Útil como alternativa quando pyzbar não está disponível.
     
     Args:
-        image: Imagem em formato numpy array
+        image: Imagem em formato numpy array (em tons de cinza, usada sem conversão)
         
     Returns:
         Lista de códigos de barras encontrados ou lista vazia
@@ -852,7 +989,7 @@ def extract_barcode_with_opencv(image):
         logger.error(f"Erro ao processar imagem com OpenCV: {e}")
         return False
 
-def _extract_text_with_ocr_and_barcode(pdf_path: str, filename: str) -> Tuple[str, Optional[str], Optional[str]]:
+def _extract_text_with_ocr_and_barcode(source: PDFSource, filename: str) -> Tuple[str, Optional[str], Optional[str]]:
     """
     Extrai texto de um arquivo PDF usando OCR e tenta detectar códigos de barras diretamente.
     
@@ -863,16 +1000,16 @@ def _extract_text_with_ocr_and_barcode(pdf_path: str, filename: str) -> Tuple[st
         - origem_deteccao: "pyzbar" se detectado diretamente, "ocr" se detectado no texto, ou None
     """
     if not OCR_AVAILABLE:
-        raise ConfigurationError("OCR não está disponível (pytesseract/pdf2image não instalados)", filename=filename)
+        raise ConfigurationError("OCR não está disponível (pytesseract/rasterizador não instalados)", filename=filename)
 
     logger.info(f"Iniciando OCR e detecção de código de barras para {filename}...")
     direct_barcode = None
     detection_source = None
     
     try:
-        images = pdf2image.convert_from_path(pdf_path, dpi=300)
-    except pdf2image.exceptions.PDFInfoNotInstalledError as e:
-        raise ConfigurationError("Utilitários Poppler não encontrados", original_exception=e, filename=filename)
+        images = _rasterizar_paginas(source, None, dpi=300)
+    except ConfigurationError:
+        raise
     except Exception as e_conv:
         raise PDFOCRError(f"Erro ao converter PDF para imagem: {e_conv}", original_exception=e_conv, filename=filename)
 
@@ -881,29 +1018,24 @@ def _extract_text_with_ocr_and_barcode(pdf_path: str, filename: str) -> Tuple[st
 
     ocr_full_text = []
     
-    for i, img in enumerate(images):
-        page_num = i + 1
+    for page_num, img in images:
         try:
             # Primeiro tenta detectar códigos de barras diretamente na imagem
             if direct_barcode is None:  # Se ainda não encontrou um código de barras
-                # Converte para formato numpy para compatibilidade com OpenCV e pyzbar
-                np_image = np.array(img)
-                
-                # Tenta com pyzbar primeiro
-                barcodes = extract_barcode_from_image(np_image)
+                # A mesma matriz em tons de cinza serve ao pyzbar, ao OpenCV e ao Tesseract
+                barcodes = extract_barcode_from_image(img)
                 if barcodes:
                     direct_barcode = barcodes[0]  # Usa o primeiro código encontrado
                     detection_source = "pyzbar"  # Marcamos a fonte da detecção
                     # logger.info(f"Código de barras detectado diretamente na página {page_num} de {filename}: {direct_barcode}")
-                elif extract_barcode_with_opencv(np_image):
+                elif extract_barcode_with_opencv(img):
                     # OpenCV detectou possível região de código de barras,
                     # mas não conseguiu decodificar. Vamos tentar OCR específico nesta área.
                     # Aqui você pode adicionar lógica para recortar e processar a região.
                     pass
             
             # Continua com OCR normal para o texto
-            img_gray = img.convert("L")
-            page_text = pytesseract.image_to_string(img_gray, lang="por")
+            page_text = _tesseract(img, filename)
             ocr_full_text.append(page_text)
             
         except pytesseract.TesseractNotFoundError as e:
@@ -923,20 +1055,369 @@ def _extract_text_with_ocr_and_barcode(pdf_path: str, filename: str) -> Tuple[st
     
     return final_ocr_text, direct_barcode, detection_source
 
-def _extract_text_with_ocr(pdf_path: str, filename: str) -> str:
+def _tamanhos_paginas(source: PDFSource) -> List[Tuple[float, float]]:
+    """Largura e altura (pontos) de cada página, para estimar a memória das imagens renderizadas."""
+    if "tamanhos_pagina" not in source.cache:
+        try:
+            with pdfplumber.open(source.open()) as pdf:
+                source.cache["tamanhos_pagina"] = [(float(page.width), float(page.height)) for page in pdf.pages]
+        except Exception as e:
+            logger.debug(f"Tamanho das páginas de {source.filename} indisponível: {e}")
+            source.cache["tamanhos_pagina"] = []
+    return source.cache["tamanhos_pagina"]
+
+def _prazo_etapa() -> Optional[float]:
+    """Prazo (STAGE_TIMEOUT) de cada chamada ao poppler/tesseract; estourado, o subprocesso é encerrado."""
+    return settings.STAGE_TIMEOUT if settings.STAGE_TIMEOUT > 0 else None
+
+def _registrar_timeout(etapa_nome: str, filename: str):
+    TIMEOUTS.incrementar(etapa=etapa_nome)
+    evento(f"tempo_esgotado_{etapa_nome}")
+    logger.warning(f"{filename}: {etapa_nome} interrompido após {settings.STAGE_TIMEOUT:g}s (STAGE_TIMEOUT).")
+
+@etapa("rasterizacao")
+def _rasterizar(source: PDFSource, **kwargs) -> list:
+    """
+    Renderiza as páginas do PDF com o motor de RASTERIZER (ver rasterizers), direto em
+    tons de cinza, e devolve cada página como matriz 2D uint8 (1 byte por pixel). A mesma
+    matriz é entregue ao pyzbar, ao OpenCV e ao Tesseract, e recortes são fatias dela
+    (sem cópia). Se a maior página do trecho não couber na sua parte do orçamento de
+    memória, o DPI é reduzido.
+    """
+    tamanhos = _tamanhos_paginas(source)
+    trecho = tamanhos[kwargs.get("first_page", 1) - 1:kwargs.get("last_page", len(tamanhos))]
+    if kwargs.get("dpi") and trecho:
+        largura, altura = max(trecho, key=lambda tamanho: tamanho[0] * tamanho[1])
+        dpi = dpi_para_orcamento(kwargs["dpi"], largura, altura, 1, orcamento_imagens_mb() / len(trecho))
+        if dpi < kwargs["dpi"]:
+            registrar_ajuste(AJUSTE_DPI)
+            logger.warning(f"{source.filename}: memória insuficiente para {kwargs['dpi']} DPI; renderizando em {dpi} DPI.")
+            kwargs = dict(kwargs, dpi=dpi)
+    try:
+        imagens = obter_rasterizador().renderizar(source, timeout=_prazo_etapa(), **kwargs)
+    except TimeoutError:
+        _registrar_timeout("rasterizacao", source.filename)
+        raise
+    registrar_imagens(sum(matriz.nbytes for matriz in imagens) / MB)
+    trace = trace_atual()
+    if trace is not None:
+        trace.detalhar("rasterizacao", paginas=len(imagens), dpi=kwargs.get("dpi"))
+    return imagens
+
+class _PaginasSobDemanda:
+    """
+    Páginas renderizadas uma por vez durante a iteração, para quando as imagens de todas
+    não cabem juntas no orçamento de memória. Cada nova iteração renderiza as páginas de novo.
+    """
+    def __init__(self, source: PDFSource, paginas: List[int], kwargs: dict):
+        self.source = source
+        self.paginas = paginas
+        self.kwargs = kwargs
+
+    def __len__(self) -> int:
+        return len(self.paginas)
+
+    def __iter__(self) -> Iterator[Tuple[int, "np.ndarray"]]:
+        for numero in self.paginas:
+            for img in _rasterizar(self.source, first_page=numero, last_page=numero, **self.kwargs):
+                yield numero, img
+
+def _rasterizar_paginas(source: PDFSource, paginas: Optional[List[int]], **kwargs):
+    """
+    Renderiza apenas as páginas informadas (None = todas), uma chamada ao rasterizador por trecho contínuo.
+    Se as imagens de todas as páginas não couberem no orçamento de memória, devolve as
+    páginas sob demanda (_PaginasSobDemanda), renderizadas uma a uma durante a iteração.
+    """
+    tamanhos = _tamanhos_paginas(source)
+    numeros = paginas if paginas is not None else list(range(1, len(tamanhos) + 1))
+    if kwargs.get("dpi") and len(numeros) > 1:
+        custo = sum(estimar_mb(*tamanhos[numero - 1], kwargs["dpi"], 1)
+                    for numero in numeros if numero <= len(tamanhos))
+        if custo > orcamento_imagens_mb():
+            registrar_ajuste(AJUSTE_PAGINA_A_PAGINA)
+            logger.info(f"{source.filename}: {len(numeros)} página(s) em {kwargs['dpi']} DPI (~{custo:.0f} MB) "
+                        f"acima do orçamento de memória; renderizando uma página por vez.")
+            return _PaginasSobDemanda(source, numeros, kwargs)
+    if paginas is None:
+        return list(enumerate(_rasterizar(source, **kwargs), start=1))
+    imagens = []
+    inicio = None
+    for indice, numero in enumerate(paginas):
+        if inicio is None:
+            inicio = numero
+        if indice + 1 == len(paginas) or paginas[indice + 1] != numero + 1:
+            imagens.extend(enumerate(_rasterizar(source, first_page=inicio, last_page=numero, **kwargs), start=inicio))
+            inicio = None
+    return imagens
+
+def _classificar_paginas(source: PDFSource, filename: str) -> Optional[List[str]]:
+    """
+    Classifica as páginas do documento (boleto, DANFE, outra) pela camada de texto e, nas
+    páginas sem texto, pela imagem em baixa resolução. Retorna None se a classificação
+    estiver desativada ou o texto por página não estiver disponível.
     """
-    Extrai texto de um arquivo PDF usando OCR.
+    if not settings.PAGE_CLASSIFIER:
+        return None
+    if "classes_pagina" in source.cache:
+        return source.cache["classes_pagina"]
+
+    if "textos_pagina" not in source.cache:
+        try:
+            _extract_text_layer(source, filename)
+        except PDFProcessingError as e:
+            logger.warning(f"Não foi possível classificar as páginas de {filename}: {e}")
+            return None
+    textos = source.cache.get("textos_pagina")
+    if not textos:
+        return None
+
+    dpi = settings.PAGE_CLASSIFIER_DPI
+
+    def renderizar(paginas: List[int]) -> list:
+        imagens = dict(_rasterizar_paginas(source, paginas, dpi=dpi))
+        return [imagens.get(numero) for numero in paginas]
+
+    classes = classificar_paginas(textos, renderizar, dpi)
+    source.cache["classes_pagina"] = classes
+    dispensadas = sum(1 for classe in classes if not precisa_analise(classe))
+    if dispensadas:
+        evento("paginas_dispensadas", dispensadas)
+    logger.info(f"Classificação das páginas de {filename}: {classes}")
+    return classes
+
+def _grupos_de_paginas(source: PDFSource, filename: str) -> List[Optional[List[int]]]:
+    """
+    Ordem de análise por imagem (pyzbar/OCR): primeiro as páginas candidatas a boleto;
+    as demais (DANFE, contrato...) só se nada for encontrado nas candidatas.
+    """
+    classes = _classificar_paginas(source, filename)
+    if classes is None:
+        return [None]
+    candidatas = [numero for numero, classe in enumerate(classes, start=1) if precisa_analise(classe)]
+    demais = [numero for numero, classe in enumerate(classes, start=1) if not precisa_analise(classe)]
+    if demais:
+        logger.info(f"{filename}: {len(demais)} de {len(classes)} página(s) ficam fora do pyzbar/OCR, salvo se nada for encontrado.")
+    return [grupo for grupo in (candidatas, demais) if grupo]
+
+@etapa("tesseract")
+def _tesseract(img, filename: str) -> str:
+    """
+    Tesseract (português) sobre a página em tons de cinza (matriz de _rasterizar), pelo
+    motor de OCR_ENGINE (ver ocr_engines), interrompido se passar de STAGE_TIMEOUT.
+    """
+    if not isinstance(img, np.ndarray) and img.mode != "L":
+        img = img.convert("L")
+    try:
+        return reconhecer(img, timeout=_prazo_etapa() or 0)
+    except RuntimeError as e:
+        if "timeout" in str(e).lower():
+            _registrar_timeout("tesseract", filename)
+        raise
+
+def _ocr_pagina(source: PDFSource, numero: int, img) -> str:
+    """OCR de uma página já renderizada, reaproveitando o resultado se a página já passou pelo OCR."""
+    textos_ocr = source.cache.setdefault("textos_ocr", {})
+    if numero not in textos_ocr:
+        textos_ocr[numero] = _tesseract(img, source.filename)
+    return textos_ocr[numero]
+
+def _ocr_regiao_linha_digitavel(source: PDFSource, numero: int, img, dpi: int) -> str:
+    """
+    OCR só da região da linha digitável (perfil balanced). Se a página inteira já passou
+    pelo OCR (ex.: para os campos de cabeçalho), reaproveita esse texto.
+    """
+    if numero in source.cache.get("textos_ocr", {}):
+        return source.cache["textos_ocr"][numero]
+    textos_regiao = source.cache.setdefault("textos_ocr_regiao", {})
+    if numero not in textos_regiao:
+        topo, base = regiao_linha_digitavel(img, dpi)
+        altura = img.shape[0]
+        recorte = img[int(topo * altura):int(base * altura)]
+        textos_regiao[numero] = _tesseract(recorte, source.filename)
+    return textos_regiao[numero]
+
+def _ocr_para_codigo(source: PDFSource, numero: int, img, orcamento: OrcamentoExtracao) -> str:
+    """OCR usado na busca do código: página inteira ou só a região da linha digitável, conforme o perfil."""
+    if orcamento.perfil.ocr == OCR_REGIAO:
+        return _ocr_regiao_linha_digitavel(source, numero, img, orcamento.perfil.dpi_imagem)
+    return _ocr_pagina(source, numero, img)
+
+def _buscar_codigos_em_imagens(source: PDFSource, filename: str, paginas: Optional[List[int]],
+                               orcamento: OrcamentoExtracao) -> Tuple[List[str], dict, dict]:
+    """
+    Procura códigos nas páginas informadas (None = todas): pyzbar em todas e, se nenhuma
+    tiver código e o perfil permitir, OCR nas mesmas imagens até o orçamento de tempo acabar.
+
+    Returns:
+        Tupla (candidatos, origens, locais): origens mapeia candidato -> "pyzbar"/"ocr" e
+        locais mapeia candidato -> (página, região ou None)
+    """
+    candidatos = []
+    origens = {}
+    locais = {}
+    if not OCR_AVAILABLE:
+        logger.warning(f"Rasterizador/pytesseract indisponíveis: detecção por imagem ignorada para {filename}.")
+        return candidatos, origens, locais
+    try:
+        imagens = _rasterizar_paginas(source, paginas, dpi=orcamento.perfil.dpi_imagem)
+    except Exception as e_direct:
+        logger.warning(f"Erro na detecção direta de códigos: {e_direct}")
+        return candidatos, origens, locais
+
+    for numero, img in imagens:
+        for barcode, regiao in extract_barcodes_with_position(img):
+            # Verificar se não é uma chave NFe
+            if not is_nfe_access_key(barcode) and is_boleto_ou_arrecadacao(barcode):
+                candidatos.append(barcode)
+                origens[barcode] = "pyzbar"
+                locais.setdefault(barcode, (numero, regiao))
+                logger.debug(f"Candidato via pyzbar na página {numero}: {barcode}")
+    if candidatos or not orcamento.perfil.usa_ocr:
+        return candidatos, origens, locais
+    evento("pyzbar_sem_codigo")
+
+    # OCR como último recurso
+    for numero, img in imagens:
+        if orcamento.esgotado():
+            logger.warning(f"Orçamento de tempo do perfil '{orcamento.perfil.nome}' esgotado durante o OCR de {filename}.")
+            break
+        evento("ocr_codigo")
+        try:
+            texto = _ocr_para_codigo(source, numero, img, orcamento)
+        except pytesseract.TesseractNotFoundError as e:
+            logger.warning(f"Erro durante OCR: Tesseract não encontrado ({e})")
+            break
+        except Exception as e_ocr_page:
+            logger.warning(f"Erro no OCR da página {numero} de {filename}: {e_ocr_page}")
+            continue
+        for clean_item in _candidatos_no_texto(texto):
+            candidatos.append(clean_item)
+            origens[clean_item] = "ocr"
+            locais.setdefault(clean_item, (numero, None))
+            logger.debug(f"Candidato a boleto/arrecadação via OCR na página {numero}: {clean_item}")
+    return candidatos, origens, locais
+
+def _tentar_dica_localizacao(source: PDFSource, filename: str, dica: dict,
+                             orcamento: OrcamentoExtracao) -> Optional[Tuple[str, str, int, Optional[tuple]]]:
+    """
+    Procura o código só onde o fornecedor costuma colocá-lo: pyzbar no recorte da região
+    (e na página inteira, já renderizada) ou OCR apenas daquela página.
+
+    Returns:
+        (código, origem, página, região) se um boleto/arrecadação válido for encontrado, senão None
+    """
+    pagina = dica["pagina"]
+    textos = source.cache.get("textos_pagina")
+    if textos is not None and pagina > len(textos):
+        return None
+    try:
+        imagens = _rasterizar(source, dpi=orcamento.perfil.dpi_imagem, first_page=pagina, last_page=pagina)
+    except Exception as e:
+        logger.warning(f"Erro ao renderizar a página {pagina} indicada para {filename}: {e}")
+        return None
+    if not imagens:
+        return None
+    img = imagens[0]
+
+    if BARCODE_DETECTION_AVAILABLE:
+        tentativas = []
+        altura, largura = img.shape[:2]
+        if dica["bbox"]:
+            x0, y0, x1, y1 = dica["bbox"]
+            margem = settings.LOCATION_HINT_MARGIN
+            caixa = (
+                int(max(0.0, x0 - margem) * largura), int(max(0.0, y0 - margem) * altura),
+                int(min(1.0, x1 + margem) * largura), int(min(1.0, y1 + margem) * altura)
+            )
+            # Recorte como fatia da matriz da página (sem cópia)
+            tentativas.append((img[caixa[1]:caixa[3], caixa[0]:caixa[2]], caixa))
+        tentativas.append((img, (0, 0, largura, altura)))
+        for imagem, caixa in tentativas:
+            largura_caixa, altura_caixa = caixa[2] - caixa[0], caixa[3] - caixa[1]
+            for codigo, (rx0, ry0, rx1, ry1) in extract_barcodes_with_position(imagem):
+                if _codigos_validos([(codigo, "pyzbar")]):
+                    regiao = (
+                        (caixa[0] + rx0 * largura_caixa) / largura, (caixa[1] + ry0 * altura_caixa) / altura,
+                        (caixa[0] + rx1 * largura_caixa) / largura, (caixa[1] + ry1 * altura_caixa) / altura
+                    )
+                    return codigo, "pyzbar", pagina, regiao
+
+    if dica["origem"] == "ocr" and orcamento.perfil.usa_ocr:
+        try:
+            texto = _ocr_para_codigo(source, pagina, img, orcamento)
+        except Exception as e:
+            logger.warning(f"Erro no OCR da página {pagina} indicada para {filename}: {e}")
+            return None
+        validos = _codigos_validos([(codigo, "ocr") for codigo in _candidatos_no_texto(texto)])
+        if validos:
+            return validos[0][0], "ocr", pagina, None
+    return None
+
+def _pagina_do_codigo_no_texto(source: PDFSource, codigo: str) -> Optional[int]:
+    """Página (a partir de 1) cuja camada de texto contém o código."""
+    for numero, texto in enumerate(source.cache.get("textos_pagina") or [], start=1):
+        if codigo in _candidatos_no_texto(texto):
+            return numero
+    return None
+
+def _extract_text_with_ocr_for_fields(source: PDFSource, filename: str, campos: Optional[Iterable[str]] = None,
+                                      orcamento: Optional[OrcamentoExtracao] = None) -> str:
+    """
+    OCR para os campos de cabeçalho, página a página, parando assim que os `campos`
+    pedidos (padrão: todos os de cabeçalho) forem encontrados ou o orçamento de tempo
+    acabar. Páginas de DANFE ficam por último e só entram se ainda faltar ID.Fluxus ou CNPJ.
+    Levanta PDFOCRError se o perfil não usa OCR.
+    """
+    orcamento = orcamento or OrcamentoExtracao(obter_perfil())
+    if not orcamento.perfil.usa_ocr:
+        raise PDFOCRError(f"OCR desativado no perfil '{orcamento.perfil.nome}'.", filename=filename)
+    pendentes = set(campos or CAMPOS_CABECALHO)
+    classes = _classificar_paginas(source, filename)
+    if classes is None:
+        return _extract_text_with_ocr(source, filename)
+    danfe = [numero for numero, classe in enumerate(classes, start=1) if classe == PAGINA_DANFE]
+    demais = [numero for numero, classe in enumerate(classes, start=1) if classe != PAGINA_DANFE]
+
+    textos = []
+    def faltando() -> set:
+        return pendentes - set(_extract_header_fields("\n".join(textos)))
+
+    for numero in demais:
+        if not faltando() or orcamento.esgotado():
+            break
+        evento("ocr_cabecalho")
+        try:
+            textos.append(_extract_text_with_ocr(source, filename, [numero]))
+        except PDFOCRError:
+            continue
+    for numero in danfe:
+        if not faltando() & {"id_fluxus", "cnpj"} or orcamento.esgotado():
+            break
+        evento("ocr_cabecalho_danfe")
+        try:
+            textos.append(_extract_text_with_ocr(source, filename, [numero]))
+        except PDFOCRError:
+            continue
+
+    texto = "\n".join(textos)
+    if not texto.strip():
+        raise PDFOCRError("Nenhum texto foi extraído via OCR.", filename=filename)
+    return texto
+
+def _extract_text_with_ocr(source: PDFSource, filename: str, paginas: Optional[List[int]] = None) -> str:
+    """
+    Extrai texto de um arquivo PDF usando OCR (apenas das `paginas` informadas, se houver).
     Levanta ConfigurationError se OCR não estiver disponível/configurado.
     Levanta PDFOCRError em caso de falha no OCR.
     """
     if not OCR_AVAILABLE:
-        raise ConfigurationError("OCR não está disponível (pytesseract/pdf2image não instalados ou não importados corretamente).", filename=filename)
+        raise ConfigurationError("OCR não está disponível (pytesseract/rasterizador não instalados ou não importados corretamente).", filename=filename)
 
     # logger.info(f"Iniciando OCR para {filename}...")
     try:
-        images = pdf2image.convert_from_path(pdf_path, dpi=300) # DPI 300 é bom para OCR
-    except pdf2image.exceptions.PDFInfoNotInstalledError as e:
-        raise ConfigurationError("Utilitários Poppler (pdfinfo) não encontrados. pdf2image precisa deles.", original_exception=e, filename=filename)
+        images = _rasterizar_paginas(source, paginas, dpi=300) # DPI 300 é bom para OCR
+    except ConfigurationError:
+        raise
     except Exception as e_conv:
         raise PDFOCRError(f"Erro ao converter PDF para imagem para OCR: {e_conv}", original_exception=e_conv, filename=filename)
 
@@ -944,13 +1425,16 @@ def _extract_text_with_ocr(pdf_path: str, filename: str) -> str:
         raise PDFOCRError("Nenhuma imagem gerada a partir do PDF para OCR.", filename=filename)
 
     ocr_full_text = []
-    for i, img in enumerate(images):
-        page_num = i + 1
+    textos_ocr = source.cache.setdefault("textos_ocr", {})
+    for page_num, img in images:
         try:
+            if page_num in textos_ocr:
+                ocr_full_text.append(textos_ocr[page_num])
+                continue
             # logger.debug(f"Processando OCR da página {page_num}/{len(images)} de {filename}")
-            img_gray = img.convert("L")
             # config_ocr = "--psm 6 -l por -c tessedit_char_whitelist=0123456789." # Pode ser configurável
-            page_text = pytesseract.image_to_string(img_gray, lang="por") # lang="por" para português
+            page_text = _tesseract(img, filename) # lang="por" para português
+            textos_ocr[page_num] = page_text
             ocr_full_text.append(page_text)
         except pytesseract.TesseractNotFoundError as e:
             raise ConfigurationError("Tesseract não encontrado. Verifique a instalação e o PATH.", original_exception=e, filename=filename)
@@ -970,48 +1454,24 @@ def _extract_text_with_ocr(pdf_path: str, filename: str) -> str:
     logger.info(f"OCR concluído para {filename}. Texto extraído (len: {len(final_ocr_text)}).")
     return final_ocr_text
 
-def _find_and_clean_barcode_in_text(text_content: str, filename: str) -> Optional[str]:
-    """
-    Busca por padrões de código de barras em um texto, valida e retorna o código limpo.
-    """
-    if not text_content:
-        logger.debug(f"Texto vazio fornecido para busca de código de barras em {filename}.")
-        return None
-
-    normalized_text = re.sub(r"[\s.-]+", "", text_content)
-    logger.debug(f"Texto normalizado para busca de código de barras (primeiros 200 chars): {normalized_text[:200]}")
-
-    all_matches = []
-    
-    for pattern_idx, pattern in enumerate(BARCODE_PATTERNS):
-        logger.debug(f"Tentando padrão de regex #{pattern_idx + 1} para {filename}: {pattern}")
-        is_formatted_pattern = re.search(r"[\s\.\-]", pattern) is not None
-        text_to_search = text_content if is_formatted_pattern else normalized_text
-
+@etapa("regex_codigo")
+def _candidatos_no_texto(texto: str) -> List[str]:
+    """Retorna, na ordem em que aparecem, os códigos com formato de boleto/arrecadação (exceto chaves NFe) do texto."""
+    candidatos = []
+    for pattern in BARCODE_PATTERNS:
         try:
-            matches = re.findall(pattern, text_to_search)
-            if matches:
-                for match_idx, match in enumerate(matches):
-                    match_str = match[0] if isinstance(match, (tuple, list)) and match else str(match)
-                    clean_item = re.sub(r"[\s.-]+", "", match_str)
-                    logger.debug(f"Padrão #{pattern_idx+1} Match #{match_idx+1}: Original='{match_str}', Limpo='{clean_item}' (len: {len(clean_item)}) para {filename}")
-                    if len(clean_item) in [44, 47, 48]:
-                        all_matches.append(clean_item)
-        except re.error as e:
-            logger.warning(f"Regex inválido: {pattern} - Erro: {e} ao processar {filename}")
-            continue # Pula para o próximo padrão
-    
-    # Priorizar os códigos válidos
-    filtered_matches = _filtrar_codigos_por_validade(all_matches)
-    
-    if filtered_matches:
-        logger.info(f"Código de barras encontrado e validado para {filename}: {filtered_matches[0]}")
-        return filtered_matches[0]
-    
-    logger.info(f"Nenhum código de barras válido encontrado no texto fornecido para {filename}.")
-    return None
-
-def extract_and_clean_barcode(pdf_path: str, filename: str) -> Tuple[str, str]:
+            matches = re.findall(pattern, texto)
+        except re.error:
+            continue
+        for match in matches:
+            match_str = match[0] if isinstance(match, (tuple, list)) and match else str(match)
+            clean_item = re.sub(r"[\s.-]+", "", match_str)
+            if is_boleto_ou_arrecadacao(clean_item) and not is_nfe_access_key(clean_item):
+                candidatos.append(clean_item)
+    return candidatos
+
+def extract_and_clean_barcode(pdf, filename: str, cnpj: Optional[str] = None, fornecedor: Optional[str] = None,
+                              profile: Optional[str] = None) -> Tuple[str, str]:
     """
     Extrai a linha digitável (Boleto/Arrecadação - 47/48 dígitos) ou
     Chave de Acesso (44 dígitos) de um PDF. Tenta OCR como fallback.
@@ -1019,8 +1479,11 @@ def extract_and_clean_barcode(pdf_path: str, filename: str) -> Tuple[str, str]:
     Levanta exceções customizadas em caso de erros.
 
     Args:
-        pdf_path: Caminho para o arquivo PDF.
+        pdf: PDFSource, conteúdo do PDF (bytes) ou caminho para o arquivo.
         filename: Nome original do arquivo (para logging e erros).
+        cnpj, fornecedor: Identificam o fornecedor para usar/atualizar a dica de
+            localização do código (página e região onde ele costuma estar).
+        profile: Perfil de extração (fast, balanced, complete); None = EXTRACTION_STRATEGY.
 
     Returns:
         Tupla (código_barras_limpo, origem_deteccao) onde origem_deteccao é 
@@ -1031,7 +1494,22 @@ def extract_and_clean_barcode(pdf_path: str, filename: str) -> Tuple[str, str]:
         InvalidPDFError, ConfigurationError.
     """
 
-    logger.info(f"Iniciando extração de código de barras para: {filename}")
+    orcamento = OrcamentoExtracao(obter_perfil(profile))
+    source = PDFSource.coerce(pdf, filename)
+    try:
+        return _extract_and_clean_barcode(source, filename, cnpj, fornecedor, orcamento)
+    finally:
+        if source is not pdf:
+            source.close()
+
+def _extract_and_clean_barcode(source: PDFSource, filename: str, cnpj: Optional[str] = None,
+                               fornecedor: Optional[str] = None,
+                               orcamento: Optional[OrcamentoExtracao] = None) -> Tuple[str, str]:
+    """Implementação de extract_and_clean_barcode sobre uma fonte já aberta."""
+    orcamento = orcamento or OrcamentoExtracao(obter_perfil())
+    logger.info(f"Iniciando extração de código de barras para: {filename} (perfil {orcamento.perfil.nome})")
+    chave_dica = chave_fornecedor(cnpj, fornecedor)
+    candidate_locations = {}  # Mapeia candidato -> (página, região)
     barcode: Optional[str] = None
     detection_source: str = "texto"  # Valor padrão para extração via texto
     
@@ -1042,7 +1520,7 @@ def extract_and_clean_barcode(pdf_path: str, filename: str) -> Tuple[str, str]:
     
     # 1. Extração de texto primária (geralmente mais confiável para boletos)
     try:
-        extracted_text = _get_primary_text_extraction(pdf_path, filename)
+        extracted_text = _get_primary_text_extraction(source, filename)
         if extracted_text:
             # Primeiro detectar e descartar chaves de NFe
             for pattern in NFE_PATTERNS:
@@ -1059,64 +1537,46 @@ def extract_and_clean_barcode(pdf_path: str, filename: str) -> Tuple[str, str]:
                     continue
                 
             # Buscar códigos de boleto/arrecadação
-            for pattern_idx, pattern in enumerate(BARCODE_PATTERNS):
-                try:
-                    matches = re.findall(pattern, extracted_text)
-                    for match in matches:
-                        match_str = match[0] if isinstance(match, (tuple, list)) and match else str(match)
-                        clean_item = re.sub(r"[\s.-]+", "", match_str)
-                        
-                        # Verificar se é boleto ou arrecadação e não NFe
-                        if is_boleto_ou_arrecadacao(clean_item) and not is_nfe_access_key(clean_item):
-                            all_candidates.append(clean_item)
-                            candidate_sources[clean_item] = "texto"
-                            logger.debug(f"Candidato a boleto/arrecadação via texto: {clean_item}")
-                except re.error:
-                    continue
+            for clean_item in _candidatos_no_texto(extracted_text):
+                all_candidates.append(clean_item)
+                candidate_sources[clean_item] = "texto"
+                logger.debug(f"Candidato a boleto/arrecadação via texto: {clean_item}")
     except (InvalidPDFError, PDFTextExtractionError) as e:
         logger.warning(f"Erro na extração primária para {filename}: {e}. Tentando outros métodos.")
     
-    # 2. Tentativa de detecção direta de código de barras via pyzbar
-    if not all_candidates or len(all_candidates) == 0:
-        try:
-            # Converter PDF para imagens
-            images = pdf2image.convert_from_path(pdf_path, dpi=300)
-            
-            for i, img in enumerate(images):
-                # Tentar detectar códigos de barras diretamente na imagem
-                barcodes = extract_barcode_from_image(img)
-                
-                for barcode in barcodes:
-                    # Verificar se não é uma chave NFe
-                    if not is_nfe_access_key(barcode) and is_boleto_ou_arrecadacao(barcode):
-                        all_candidates.append(barcode)
-                        candidate_sources[barcode] = "pyzbar"
-                        logger.debug(f"Candidato via pyzbar na página {i+1}: {barcode}")
-        except Exception as e_direct:
-            logger.warning(f"Erro na detecção direta de códigos: {e_direct}")
-    
-    # 3. OCR como último recurso
-    if not all_candidates or len(all_candidates) == 0:
-        try:
-            ocr_text = _extract_text_with_ocr(pdf_path, filename)
-            if ocr_text:
-                # Buscar códigos de boleto/arrecadação
-                for pattern_idx, pattern in enumerate(BARCODE_PATTERNS):
-                    try:
-                        matches = re.findall(pattern, ocr_text)
-                        for match in matches:
-                            match_str = match[0] if isinstance(match, (tuple, list)) and match else str(match)
-                            clean_item = re.sub(r"[\s.-]+", "", match_str)
-                            
-                            # Verificar se é boleto ou arrecadação e não NFe
-                            if is_boleto_ou_arrecadacao(clean_item) and not is_nfe_access_key(clean_item):
-                                all_candidates.append(clean_item)
-                                candidate_sources[clean_item] = "ocr"
-                                logger.debug(f"Candidato a boleto/arrecadação via OCR: {clean_item}")
-                    except re.error:
-                        continue
-        except (ConfigurationError, PDFOCRError) as e:
-            logger.warning(f"Erro durante OCR: {e}")
+    trace = trace_atual()
+    if trace is not None:
+        trace.contar_candidatos("texto", len(all_candidates))
+
+    # Dica do fornecedor: tenta primeiro a página/região onde o código estava no último documento
+    if not all_candidates and not orcamento.esgotado():
+        dica = location_hints.obter(chave_dica)
+        if dica and dica["origem"] != "texto":
+            encontrado = _tentar_dica_localizacao(source, filename, dica, orcamento)
+            location_hints.contabilizar(chave_dica, dica["origem"], encontrado is not None)
+            evento("dica_acerto" if encontrado else "dica_erro")
+            if encontrado:
+                barcode, detection_source, pagina, regiao = encontrado
+                location_hints.registrar(chave_dica, pagina, regiao, detection_source)
+                logger.info(f"Código encontrado pela dica de localização (página {pagina}) em {filename}: {barcode}")
+                ORIGEM_CODIGO.incrementar(origem="dica")
+                return barcode, detection_source
+
+    # 2 e 3. pyzbar e, se nada for lido, OCR, começando pelas páginas candidatas a boleto
+    if not all_candidates:
+        for paginas in _grupos_de_paginas(source, filename):
+            if orcamento.esgotado():
+                break
+            candidatos, origens, locais = _buscar_codigos_em_imagens(source, filename, paginas, orcamento)
+            trace = trace_atual()
+            if trace is not None:
+                for origem in origens.values():
+                    trace.contar_candidatos(origem, 1)
+            all_candidates.extend(candidatos)
+            candidate_sources.update(origens)
+            candidate_locations.update(locais)
+            if all_candidates:
+                break
     
     # 4. Filtrar e validar todos os candidatos encontrados
     filtered_candidates = _filtrar_codigos_por_validade(all_candidates)
@@ -1126,123 +1586,518 @@ def extract_and_clean_barcode(pdf_path: str, filename: str) -> Tuple[str, str]:
         barcode = filtered_candidates[0]
         detection_source = candidate_sources.get(barcode, "desconhecido")
         logger.info(f"Código de barras de boleto/arrecadação válido encontrado via {detection_source} em {filename}: {barcode}")
+        if chave_dica:
+            if detection_source == "texto":
+                pagina, regiao = _pagina_do_codigo_no_texto(source, barcode), None
+            else:
+                pagina, regiao = candidate_locations.get(barcode, (None, None))
+            if pagina is not None:
+                location_hints.registrar(chave_dica, pagina, regiao, detection_source)
+        ORIGEM_CODIGO.incrementar(origem=detection_source)
         return barcode, detection_source
     
     # 5. Se chegamos aqui, nenhum código de boleto/arrecadação válido foi encontrado
+    ORIGEM_CODIGO.incrementar(origem="nao_encontrado")
+    if orcamento.esgotou:
+        perfil = orcamento.perfil
+        logger.warning(f"Orçamento de tempo do perfil '{perfil.nome}' ({perfil.orcamento_segundos:g}s) esgotado em {filename}.")
+        raise BarcodeNotFoundError(
+            f"Código de barras não encontrado em {filename} dentro do orçamento de tempo do perfil "
+            f"'{perfil.nome}' ({perfil.orcamento_segundos:g}s).", filename=filename
+        )
     logger.error(f"Código de barras de boleto/arrecadação não encontrado em {filename}. Chaves NFe encontradas (e descartadas): {nfe_keys_found}")
     raise BarcodeNotFoundError(f"Código de barras de boleto não encontrado em {filename}. DANFE/NFe encontrada, mas não boleto.", filename=filename)
 
 
-def process_pdf(pdf_file):
-    """Extrai informações (NF, Fornecedor, etc.) do PDF usando pdfplumber e, se necessário, OCR."""
+# Campos que podem ser pedidos a process_pdf e a etapa de extração que cada um exige
+ETAPA_CABECALHO = "cabecalho"
+ETAPA_CODIGO = "codigo"
+CAMPOS_CABECALHO = ("numero_nf", "id_nf", "id_fluxus", "fornecedor", "cnpj")
+CAMPOS_EXTRACAO = {
+    "barcode": ETAPA_CODIGO,
+    "valor": ETAPA_CODIGO,
+    "vencimento": ETAPA_CODIGO,
+    "idpgto": ETAPA_CABECALHO,
+    **{campo: ETAPA_CABECALHO for campo in CAMPOS_CABECALHO}
+}
+ALIASES_CAMPOS = {"fluxus": "id_fluxus", "codigo": "barcode", "nf": "numero_nf"}
+
+def normalizar_campos(fields) -> Optional[frozenset]:
+    """
+    Valida a seleção de campos (lista ou texto separado por vírgulas, com os aliases de
+    ALIASES_CAMPOS). Retorna None quando nenhum campo é informado, o que significa todos.
+    Levanta InvalidDataError para campos desconhecidos.
+    """
+    if fields is None:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    campos = set()
+    for campo in fields:
+        campo = ALIASES_CAMPOS.get(campo.strip().lower(), campo.strip().lower())
+        if not campo:
+            continue
+        if campo not in CAMPOS_EXTRACAO:
+            raise InvalidDataError(f"Campo desconhecido: '{campo}'. Disponíveis: {', '.join(sorted(CAMPOS_EXTRACAO))}.")
+        campos.add(campo)
+    return frozenset(campos) or None
+
+def _read_pdf_bytes(pdf_file) -> bytes:
+    """Obtém o conteúdo do PDF a partir de bytes ou de um objeto de arquivo (UploadedFile, BytesIO...)."""
+    if isinstance(pdf_file, (bytes, bytearray, memoryview)):
+        return bytes(pdf_file)
+    if hasattr(pdf_file, "getbuffer"):
+        return bytes(pdf_file.getbuffer())
+    return pdf_file.read()
+
+@etapa("regex_cabecalho")
+def _extract_header_fields(text: str) -> dict:
+    """Extrai ID.Fluxus, NF, Fornecedor e CNPJ do texto do documento."""
+    fields = {}
+
+    nf_match = re.search(r"Número da NF:\s*(\d+)", text)
+    if nf_match: fields["numero_nf"] = nf_match.group(1)
+
+    idnf_match = re.search(r"ID\. NF:\s*(\d+)", text)
+    if idnf_match: fields["id_nf"] = idnf_match.group(1)
+
+    fluxus_patterns = [r"ID\.Fluxus\s*(\d+)", r"ID.Fluxus\s+(\d+)", r"ID\s*Fluxus\s*(\d+)", r"Fluxus\s*(\d+)"]
+    for pattern in fluxus_patterns:
+        fluxus_match = re.search(pattern, text)
+        if fluxus_match: fields["id_fluxus"] = fluxus_match.group(1); break
+    if "id_fluxus" not in fields:
+        table_pattern = r"(\d{7})\s+\d{12}\s+\d{2}/\d{2}/\d{2}"
+        table_match = re.search(table_pattern, text)
+        if table_match: fields["id_fluxus"] = table_match.group(1)
+
+    fornecedor_patterns = [r"Fornecedor:\s*F\d+\s+([^\n]+)\s+CNPJ:", r"Fornecedor:\s*([^\n]+)", r"F\d+\s+([^CNPJ\n]+)"]
+    for fp in fornecedor_patterns:
+        f_match = re.search(fp, text)
+        if f_match: fields["fornecedor"] = f_match.group(1).strip(); break
+
+    cnpj_patterns = [r"CNPJ:\s*([\d\.\-/]+)", r"CNPJ\s+([\d\.\-/]+)", r"CNPJ/CPF:?\s*([\d\.\-/]+)", r"CPF/CNPJ:\s*([\d\.\-/]+)"]
+    for cp in cnpj_patterns:
+        c_match = re.search(cp, text)
+        if c_match: fields["cnpj"] = c_match.group(1); break
+
+    return fields
+
+# Pool de processos para o modo multi-boleto (criado no primeiro uso). Os workers são
+# criados com "spawn": um fork copiaria locks em uso por outras threads (logging, pool
+# do Tesseract, PDFIUM_LOCK, conexões SQLite) e poderia travar o worker. Sem fork, as
+# métricas do worker já começam zeradas (não há valores herdados a descartar)
+_page_executor: Optional[ProcessPoolExecutor] = None
+_page_executor_lock = threading.Lock()
+
+# Processos isolados (DOCUMENT_TIMEOUT > 0) distribuem as páginas no seu próprio pool:
+# os workers ficam no grupo do processo isolado e são encerrados com ele se o prazo estourar
+_pool_paginas_em_worker = False
+
+def permitir_pool_paginas_em_worker():
+    """Chamado pelos processos isolados: o modo multi-boleto continua paralelo dentro deles."""
+    global _pool_paginas_em_worker
+    _pool_paginas_em_worker = True
+
+def _get_page_executor() -> ProcessPoolExecutor:
+    global _page_executor
+    with _page_executor_lock:
+        if _page_executor is None:
+            _page_executor = ProcessPoolExecutor(max_workers=settings.PAGE_WORKERS,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        return _page_executor
+
+def _reset_page_executor():
+    global _page_executor
+    with _page_executor_lock:
+        _page_executor = None
+
+def _fila_paginas() -> dict:
+    """Itens pendentes no pool de páginas (para o medidor FILA_EXECUTOR)."""
+    executor = _page_executor
+    return {("paginas",): len(executor._pending_work_items)} if executor is not None else {}
+
+FILA_EXECUTOR.observar_funcao(_fila_paginas)
+
+def _codigos_validos(codigos: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """Mantém apenas boletos/arrecadações com dígitos verificadores válidos, sem repetir o mesmo código."""
+    validos = []
+    vistos = set()
+    for codigo, origem in codigos:
+        valido, tipo = validar_codigo_barras(codigo)
+        if not valido or tipo not in ("boleto", "arrecadacao"):
+            continue
+        chave = linha_digitavel_para_codigo_barras(codigo)
+        if chave in vistos:
+            continue
+        vistos.add(chave)
+        validos.append((codigo, origem))
+    return validos
+
+def _analisar_pagina_imagem(source: PDFSource, numero: int, filename: str, precisa_texto: bool,
+                            orcamento: OrcamentoExtracao) -> Tuple[List[Tuple[str, str]], str]:
+    """
+    Renderiza uma única página e procura códigos com pyzbar e, se necessário e o perfil
+    permitir, OCR (a página inteira quando ela não tem texto; senão, conforme o perfil).
+    """
+    perfil = orcamento.perfil
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file_obj: # Renomeado para evitar conflito
-            temp_file_obj.write(pdf_file.getbuffer())
-            temp_path = temp_file_obj.name
-        
-        # filename para logs e erros
-        original_filename = pdf_file.name
+        images = _rasterizar(source, dpi=perfil.dpi_imagem, first_page=numero, last_page=numero)
+    except Exception as e:
+        logger.warning(f"Erro ao renderizar a página {numero} de {filename}: {e}")
+        return [], ""
+    if not images:
+        return [], ""
+
+    img = images[0]
+    codigos = [(codigo, "pyzbar") for codigo in extract_barcode_from_image(img)]
+    texto_ocr = ""
+    if perfil.usa_ocr and (precisa_texto or not _codigos_validos(codigos)) and not orcamento.esgotado():
+        try:
+            if precisa_texto or perfil.ocr == OCR_COMPLETO:
+                texto_ocr = _tesseract(img, filename)
+                codigos += [(codigo, "ocr") for codigo in _candidatos_no_texto(texto_ocr)]
+            else:
+                texto_regiao = _ocr_regiao_linha_digitavel(source, numero, img, perfil.dpi_imagem)
+                codigos += [(codigo, "ocr") for codigo in _candidatos_no_texto(texto_regiao)]
+        except Exception as e:
+            logger.warning(f"Erro no OCR da página {numero} de {filename}: {e}")
+    return codigos, texto_ocr
+
+def _classe_pagina(source: PDFSource, numero: int, texto: str) -> str:
+    """Classifica uma página pelo texto ou, se não houver texto, pela imagem em baixa resolução."""
+    classe = classificar_texto(texto)
+    if classe is None and OCR_AVAILABLE:
+        dpi = settings.PAGE_CLASSIFIER_DPI
+        try:
+            imagens = _rasterizar(source, dpi=dpi, first_page=numero, last_page=numero)
+            classe = classificar_imagem(imagens[0], dpi) if imagens else None
+        except Exception as e:
+            logger.warning(f"Erro ao classificar a página {numero} de {source.filename}: {e}")
+    return classe or PAGINA_INDEFINIDA
+
+def _analisar_paginas(pdf, filename: str, paginas: List[int], classificar: bool = True,
+                      orcamento: Optional[OrcamentoExtracao] = None) -> List[dict]:
+    """
+    Procura boletos em um subconjunto das páginas (numeradas a partir de 1).
+    Executada nos workers do modo multi-boleto; cada chamada abre o PDF uma única vez.
+    Com `classificar`, páginas de DANFE/outros documentos não passam pelo pyzbar/OCR.
+    Esgotado o orçamento de tempo, as páginas restantes ficam só com a camada de texto.
+
+    Returns:
+        Lista de {"page", "codigos": [(codigo, origem)], "campos": campos de cabeçalho da página,
+        "pulada": True se a análise por imagem foi dispensada pelo classificador,
+        "sem_tempo": True se foi dispensada pelo orçamento de tempo}
+    """
+    orcamento = orcamento or OrcamentoExtracao(obter_perfil())
+    source = PDFSource.coerce(pdf, filename)
+    analises = []
+    try:
+        camada = source.cache.get("textos_pagina")
+        textos = [camada[numero - 1] for numero in paginas] if camada else _extract_text_pages(source, filename, paginas)
+        for numero, texto in zip(paginas, textos):
+            codigos = [(codigo, "texto") for codigo in _candidatos_no_texto(texto)]
+            sem_texto = not texto.strip()
+            pulada = sem_tempo = False
+            if OCR_AVAILABLE and (sem_texto or not _codigos_validos(codigos)):
+                if orcamento.esgotado():
+                    sem_tempo = True
+                elif classificar and settings.PAGE_CLASSIFIER and not precisa_analise(_classe_pagina(source, numero, texto)):
+                    pulada = True
+                else:
+                    codigos_imagem, texto_ocr = _analisar_pagina_imagem(source, numero, filename, sem_texto, orcamento)
+                    sem_tempo = orcamento.esgotou
+                    codigos += codigos_imagem
+                    if sem_texto:
+                        texto = texto_ocr
+            analises.append({
+                "page": numero,
+                "codigos": _codigos_validos(codigos),
+                "campos": _extract_header_fields(texto),
+                "pulada": pulada,
+                "sem_tempo": sem_tempo
+            })
+    finally:
+        if source is not pdf:
+            source.close()
+    return analises
 
-        # logger.info(f"Processando arquivo: {original_filename}")
+def _analisar_paginas_no_worker(pdf, filename: str, paginas: List[int], classificar: bool,
+                                orcamento: OrcamentoExtracao, motor_perfil: Optional[str] = None) -> Tuple[List[dict], dict, Optional[dict]]:
+    """
+    _analisar_paginas no worker de processo, devolvendo também as métricas coletadas nele
+    e, com `motor_perfil` (documento sendo perfilado), as pilhas perfiladas no worker.
+    """
+    perfilador = iniciar_perfil_worker(motor_perfil) if motor_perfil else None
+    try:
+        analises = _analisar_paginas(pdf, filename, paginas, classificar, orcamento)
+    finally:
+        pilhas = encerrar_perfil_worker(perfilador) if perfilador else None
+    return analises, metricas.coletar_delta(), pilhas
+
+def _distribuir_paginas(source: PDFSource, filename: str, paginas: List[int], classificar: bool = True,
+                        orcamento: Optional[OrcamentoExtracao] = None) -> List[dict]:
+    """Executa _analisar_paginas dividindo as páginas entre os workers de PAGE_WORKERS; resultado ordenado por página."""
+    workers = min(settings.PAGE_WORKERS, len(paginas))
+    # Dentro de um worker (ex.: CLI em lote) o paralelismo já vem de fora: processa em sequência
+    if workers <= 1 or (multiprocessing.parent_process() is not None and not _pool_paginas_em_worker):
+        analises = _analisar_paginas(source, filename, paginas, classificar, orcamento)
+    else:
+        # Os workers recebem o caminho se o PDF já estiver em disco, senão o conteúdo
+        pdf = source.read() if source.em_memoria else source.path()
+        sessao = sessao_atual()
+        try:
+            executor = _get_page_executor()
+            futures = [
+                executor.submit(_analisar_paginas_no_worker, pdf, filename, paginas[i::workers], classificar, orcamento,
+                                sessao.motor if sessao else None)
+                for i in range(workers)
+            ]
+            analises = []
+            for future in futures:
+                analises_worker, delta, pilhas = future.result()
+                analises.extend(analises_worker)
+                metricas.mesclar(delta)
+                if sessao is not None:
+                    sessao.mesclar(pilhas, prefixo="worker de páginas")
+                trace = trace_atual()
+                if trace is not None:
+                    trace.somar_etapas_worker(delta.get(DURACAO_ETAPA.nome))
+        except BrokenProcessPool as e:
+            logger.warning(f"Pool de páginas indisponível ({e}); processando {filename} em sequência.")
+            _reset_page_executor()
+            analises = _analisar_paginas(source, filename, paginas, classificar, orcamento)
+    analises.sort(key=lambda analise: analise["page"])
+    if orcamento is not None and any(analise.get("sem_tempo") for analise in analises):
+        # Os workers recebem uma cópia do orçamento: o esgotamento é repassado pelo resultado
+        orcamento.esgotou = True
+    return analises
+
+def _extrair_boletos(source: PDFSource, filename: str, orcamento: Optional[OrcamentoExtracao] = None) -> Tuple[List[dict], dict]:
+    """
+    Modo multi-boleto: retorna todos os boletos/arrecadações distintos do PDF, com a página
+    e os campos encontrados nela, e os campos de cabeçalho do documento.
+    As páginas são divididas entre os workers de PAGE_WORKERS.
+    """
+    try:
+        with pdfplumber.open(source.open()) as documento:
+            total_paginas = len(documento.pages)
+    except pdfplumber.exceptions.PDFSyntaxError as e:
+        raise InvalidPDFError(f"Erro de sintaxe no PDF: {e}", original_exception=e, filename=filename)
+    except Exception as e:
+        raise PDFTextExtractionError(f"Erro ao abrir PDF com pdfplumber: {e}", original_exception=e, filename=filename)
+
+    orcamento = orcamento or OrcamentoExtracao(obter_perfil())
+    trace = trace_atual()
+    if trace is not None:
+        trace.definir(paginas=total_paginas)
+    analises = _distribuir_paginas(source, filename, list(range(1, total_paginas + 1)), orcamento=orcamento)
+    puladas = [analise["page"] for analise in analises if analise.get("pulada")]
+    if puladas and not any(analise["codigos"] for analise in analises) and not orcamento.esgotado():
+        # O classificador não pode custar boletos: sem nenhum encontrado, analisa também as páginas dispensadas
+        logger.info(f"Nenhum boleto nas páginas candidatas de {filename}; analisando as {len(puladas)} página(s) dispensadas.")
+        refeitas = {analise["page"]: analise for analise in _distribuir_paginas(source, filename, puladas, False, orcamento)}
+        analises = [refeitas.get(analise["page"], analise) for analise in analises]
+
+    campos_documento = {}
+    for analise in analises:
+        for campo, valor in analise["campos"].items():
+            campos_documento.setdefault(campo, valor)
+
+    idpgto_por_cnpj = {}
+    boletos = []
+    vistos = set()
+    for analise in analises:
+        campos = {**campos_documento, **analise["campos"]}
+        for codigo, origem in analise["codigos"]:
+            chave = linha_digitavel_para_codigo_barras(codigo)
+            if chave in vistos:
+                continue
+            vistos.add(chave)
+
+            cnpj = campos.get("cnpj")
+            if cnpj and cnpj not in idpgto_por_cnpj:
+                idpgto, encontrado = get_idpgto_by_cnpj(cnpj)
+                idpgto_por_cnpj[cnpj] = str(idpgto) if encontrado else None
+            valor, vencimento = extrair_valor_vencimento(codigo)
+            ORIGEM_CODIGO.incrementar(origem=origem)
+            trace = trace_atual()
+            if trace is not None:
+                trace.contar_candidatos(origem, 1)
+            boletos.append({
+                "page": analise["page"],
+                "barcode": codigo,
+                "barcode_source": origem,
+                "valor": valor,
+                "vencimento": vencimento,
+                "id_fluxus": campos.get("id_fluxus"),
+                "numero_nf": campos.get("numero_nf"),
+                "cnpj": cnpj,
+                "fornecedor": campos.get("fornecedor"),
+                "idpgto": idpgto_por_cnpj.get(cnpj)
+            })
+
+    logger.info(f"{len(boletos)} boleto(s) encontrados em {total_paginas} página(s) de {filename}.")
+    return boletos, campos_documento
+
+def process_pdf(pdf_file, filename: Optional[str] = None, multi_boleto: bool = False, fields=None,
+                profile: Optional[str] = None, trace: bool = False) -> dict:
+    """
+    Extrai informações (ID.Fluxus, Fornecedor, CNPJ, código de barras) do PDF
+    usando pdfplumber e, se necessário, OCR.
 
-        # A extração de texto para outros campos (NF, CNPJ etc.) também deve ser refatorada
-        # para usar _get_primary_text_extraction e _extract_text_with_ocr se necessário.
-        # Por enquanto, vamos manter a lógica original de process_pdf para esses campos,
-        # mas idealmente ela seria modularizada também.
+    Args:
+        pdf_file: Conteúdo do PDF (bytes) ou objeto de arquivo (getbuffer()/read()).
+        filename: Nome original do arquivo. Se omitido, usa pdf_file.name.
+        multi_boleto: Se True, retorna em "boletos" todos os boletos distintos do PDF
+            (um por página, por exemplo), processando as páginas em paralelo. Os campos
+            principais (barcode, valor, vencimento...) recebem os dados do primeiro boleto.
+        fields: Campos desejados (ver CAMPOS_EXTRACAO); None = todos. Só as etapas
+            necessárias rodam: sem campos de cabeçalho não há OCR para eles, e sem
+            barcode/valor/vencimento a busca do código é dispensada.
+        profile: Perfil de extração (fast, balanced ou complete, ver extraction_profiles);
+            None = EXTRACTION_STRATEGY. Define o alcance do pyzbar/OCR e o orçamento de tempo.
+        trace: Se True, inclui em "trace" o resumo do processamento deste documento
+            (etapas com duração, páginas/DPI renderizados, fallbacks, candidatos e memória).
 
-        # Simulação da extração de texto principal para outros campos (simplificado)
+    Returns:
+        Dicionário com os campos de PDFResult (id_fluxus, barcode, barcode_source, cnpj,
+        fornecedor, valor, vencimento, idpgto, status, error, profile, budget_exhausted) e o
+        content_hash (SHA-256) do PDF. Com `fields`, os campos não pedidos ficam de fora.
+        Sem memória disponível (MEMORY_RSS_LIMIT_MB), o status é "Adiado" e o documento
+        deve ser reenviado depois.
+    """
+    with rastrear(trace) as rastro, contabilizar() as memoria:
+        results = _process_pdf(pdf_file, filename, multi_boleto, fields, profile)
+        if rastro is not None:
+            rastro.definir(perfil=results.get("profile"), origem=results.get("barcode_source") if results.get("barcode") else None,
+                           status=results.get("status"), memoria=memoria.resumo())
+            results["trace"] = rastro.resumo()
+    return results
+
+def _process_pdf(pdf_file, filename: Optional[str], multi_boleto: bool, fields, profile: Optional[str]) -> dict:
+    """Implementação de process_pdf (fora do trace)."""
+    original_filename = filename or getattr(pdf_file, "name", "documento.pdf")
+    campos = normalizar_campos(fields) or frozenset(CAMPOS_EXTRACAO)
+    orcamento = OrcamentoExtracao(obter_perfil(profile))
+    precisa_codigo = any(CAMPOS_EXTRACAO[campo] == ETAPA_CODIGO for campo in campos)
+    campos_cabecalho = {campo for campo in campos if campo in CAMPOS_CABECALHO}
+    if "idpgto" in campos:
+        campos_cabecalho.add("cnpj")
+    source = None
+    results = {
+        "filename": original_filename,
+        "content_hash": None,
+        "status": "Processado",
+        "error": None,
+        "profile": orcamento.perfil.nome
+    }
+    if precisa_codigo:
+        results.update(barcode=None, barcode_source="texto")
+    try:
+        content = _read_pdf_bytes(pdf_file)
+        results["content_hash"] = hashlib.sha256(content).hexdigest()
+        aguardar_memoria(original_filename)
+
+        # O PDF fica em memória; só o poppler (OCR/pyzbar) gera uma cópia temporária, sob demanda
+        source = PDFSource(content, original_filename)
+        rastro = trace_atual()
+        if rastro is not None:
+            rastro.definir(tamanho_kb=round(len(content) / 1024, 1), em_memoria=source.em_memoria)
+
+        if multi_boleto:
+            boletos, campos_documento = _extrair_boletos(source, original_filename, orcamento)
+            results.update({campo: valor for campo, valor in campos_documento.items() if campo in campos_cabecalho})
+            results["boletos"] = boletos
+            if boletos:
+                primeiro = boletos[0]
+                for campo in ("barcode", "barcode_source", "valor", "vencimento", "idpgto"):
+                    if campo in campos or campo == "barcode_source":
+                        results[campo] = primeiro[campo]
+            else:
+                ORIGEM_CODIGO.incrementar(origem="nao_encontrado")
+                results["status"] = "Código não encontrado"
+                results["error"] = f"Nenhum boleto encontrado em {original_filename}."
+            return results
+
+        # Extração do texto usado para os campos de cabeçalho (ID.Fluxus, CNPJ etc.).
+        # Sem campos de cabeçalho pedidos, o texto só alimenta a dica de localização (sem OCR).
         all_text_for_fields = ""
         try:
-            all_text_for_fields = _get_primary_text_extraction(temp_path, original_filename)
-            if not all_text_for_fields.strip(): # Se texto primário for vazio, tenta OCR
+            all_text_for_fields = _get_primary_text_extraction(source, original_filename)
+            if not all_text_for_fields.strip() and campos_cabecalho: # Se texto primário for vazio, tenta OCR
                 logger.info(f"Texto primário vazio para campos em {original_filename}, tentando OCR.")
                 try:
-                    all_text_for_fields = _extract_text_with_ocr(temp_path, original_filename)
+                    all_text_for_fields = _extract_text_with_ocr_for_fields(source, original_filename, campos_cabecalho, orcamento)
                 except (ConfigurationError, PDFOCRError) as e_ocr_fields:
                     logger.warning(f"Falha no OCR para campos de {original_filename}: {e_ocr_fields}. Alguns campos podem não ser extraídos.")
                     pass # Continua com texto vazio se OCR falhar
         except (InvalidPDFError, PDFTextExtractionError) as e_text_fields:
-            logger.warning(f"Erro na extração de texto para campos de {original_filename}: {e_text_fields}. Tentando OCR.")
-            try:
-                all_text_for_fields = _extract_text_with_ocr(temp_path, original_filename)
-            except (ConfigurationError, PDFOCRError) as e_ocr_fields_fallback:
-                logger.warning(f"Falha no OCR de fallback para campos de {original_filename}: {e_ocr_fields_fallback}. Alguns campos podem não ser extraídos.")
-                pass # Continua com texto vazio
+            logger.warning(f"Erro na extração de texto para campos de {original_filename}: {e_text_fields}.")
+            if campos_cabecalho:
+                try:
+                    all_text_for_fields = _extract_text_with_ocr_for_fields(source, original_filename, campos_cabecalho, orcamento)
+                except (ConfigurationError, PDFOCRError) as e_ocr_fields_fallback:
+                    logger.warning(f"Falha no OCR de fallback para campos de {original_filename}: {e_ocr_fields_fallback}. Alguns campos podem não ser extraídos.")
+                    pass # Continua com texto vazio
         
         logger.debug(f"Texto final para extração de campos em {original_filename} (len: {len(all_text_for_fields)})." )
 
-        results = {
-            "Arquivo": original_filename,
-            "Código de Barras": "Não encontrado" # Default
-        }
-
-        # Extração de outros campos (usando all_text_for_fields)
-        nf_match = re.search(r"Número da NF:\s*(\d+)", all_text_for_fields)
-        if nf_match: results["Número da NF"] = nf_match.group(1)
-
-        idnf_match = re.search(r"ID\. NF:\s*(\d+)", all_text_for_fields)
-        if idnf_match: results["ID. NF"] = idnf_match.group(1)
-
-        fluxus_patterns = [r"ID\.Fluxus\s*(\d+)", r"ID.Fluxus\s+(\d+)", r"ID\s*Fluxus\s*(\d+)", r"Fluxus\s*(\d+)"]
-        for pattern in fluxus_patterns:
-            fluxus_match = re.search(pattern, all_text_for_fields)
-            if fluxus_match: results["ID.Fluxus"] = fluxus_match.group(1); break
-        if "ID.Fluxus" not in results:
-            table_pattern = r"(\d{7})\s+\d{12}\s+\d{2}/\d{2}/\d{2}"
-            table_match = re.search(table_pattern, all_text_for_fields)
-            if table_match: results["ID.Fluxus"] = table_match.group(1)
-
-        fornecedor_patterns = [r"Fornecedor:\s*F\d+\s+([^\n]+)\s+CNPJ:", r"Fornecedor:\s*([^\n]+)", r"F\d+\s+([^CNPJ\n]+)"]
-        for fp in fornecedor_patterns:
-            f_match = re.search(fp, all_text_for_fields)
-            if f_match: results["Fornecedor"] = f_match.group(1).strip(); break
-
-        cnpj_patterns = [r"CNPJ:\s*([\d\.\-/]+)", r"CNPJ\s+([\d\.\-/]+)", r"CNPJ/CPF:?\s*([\d\.\-/]+)", r"CPF/CNPJ:\s*([\d\.\-/]+)"]
-        for cp in cnpj_patterns:
-            c_match = re.search(cp, all_text_for_fields)
-            if c_match: results["CNPJ"] = c_match.group(1); break
+        cabecalho = _extract_header_fields(all_text_for_fields)
+        results.update({campo: valor for campo, valor in cabecalho.items() if campo in campos_cabecalho})
+        if "idpgto" in campos and results.get("cnpj"):
+            idpgto, encontrado = get_idpgto_by_cnpj(results["cnpj"])
+            if encontrado:
+                results["idpgto"] = str(idpgto)
+
+        if not precisa_codigo:
+            return results
     
         # Extração do código de barras usando a função refatorada
         try:
-            barcode, detection_source = extract_and_clean_barcode(temp_path, original_filename)
-            results["Código de Barras"] = barcode
-            results["Origem Detecção"] = detection_source
+            barcode, detection_source = _extract_and_clean_barcode(
+                source, original_filename, cabecalho.get("cnpj"), cabecalho.get("fornecedor"), orcamento
+            )
+            results["barcode"] = barcode
+            results["barcode_source"] = detection_source
+            if "valor" in campos or "vencimento" in campos:
+                valor, vencimento = extrair_valor_vencimento(barcode)
+                results.update({campo: dado for campo, dado in (("valor", valor), ("vencimento", vencimento)) if campo in campos})
             logger.info(f"Código de barras extraído para {original_filename}: {barcode}, origem: {detection_source}")
         except BarcodeNotFoundError as e:
-            results["Código de Barras"] = "Não encontrado"
-            results["Erro_CodigoBarras"] = str(e) # Adiciona info do erro específico
+            results["status"] = "Código não encontrado"
+            results["error"] = str(e)
             logger.warning(f"Código de barras não encontrado para {original_filename}: {e}")
         except PDFProcessingError as e: # Captura outros erros da extração de barcode
-            results["Código de Barras"] = "Erro na Extração"
-            results["Erro_CodigoBarras"] = str(e)
+            results["status"] = "Erro"
+            results["error"] = str(e)
             logger.error(f"Erro ao extrair código de barras de {original_filename}: {e}", exc_info=True)
 
         return results
 
+    except MemoryBudgetError as e: # Sem memória agora: o documento deve ser reenviado depois
+        results.update(status=STATUS_ADIADO, error=str(e))
+        return results
     except PDFProcessingError as e: # Erros customizados esperados
-        logger.error(f"Erro de processamento de PDF para {pdf_file.name}: {e}", exc_info=True)
-        return {
-            "Arquivo": pdf_file.name,
-            "Código de Barras": "Erro no Processamento",
-            "Origem Detecção": "texto",  # Default para compatibilidade
-            "Erro": str(e)
-        }
+        logger.error(f"Erro de processamento de PDF para {original_filename}: {e}", exc_info=True)
+        results.update(status="Erro", error=str(e))
+        return results
     except Exception as e_geral: # Erros inesperados
-        logger.critical(f"Erro inesperado e não tratado ao processar {pdf_file.name}: {e_geral}", exc_info=True)
-        return {
-            "Arquivo": pdf_file.name,
-            "Código de Barras": "Erro Crítico",
-            "Origem Detecção": "texto",  # Default para compatibilidade
-            "Erro": f"Erro inesperado: {str(e_geral)}"
-        }
+        logger.critical(f"Erro inesperado e não tratado ao processar {original_filename}: {e_geral}", exc_info=True)
+        results.update(status="Erro", error=f"Erro inesperado: {str(e_geral)}")
+        return results
     finally:
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.unlink(temp_path)
-                logger.debug(f"Arquivo temporário {temp_path} removido.")
-            except Exception as e_unlink:
-                logger.error(f"Erro ao remover arquivo temporário {temp_path}: {e_unlink}")
-                pass
+        results["budget_exhausted"] = orcamento.esgotou
+        DURACAO_DOCUMENTO.observar(orcamento.decorrido(), perfil=orcamento.perfil.nome)
+        DOCUMENTOS.incrementar(status=results["status"])
+        if orcamento.esgotou:
+            evento("orcamento_esgotado")
+            logger.warning(f"{original_filename}: orçamento do perfil '{orcamento.perfil.nome}' esgotado "
+                           f"({orcamento.decorrido():.1f}s); resultado pode estar incompleto.")
+        if source is not None:
+            rastro = trace_atual()
+            if rastro is not None and source.cache.get("textos_pagina") is not None:
+                rastro.definir(paginas=len(source.cache["textos_pagina"]))
+            source.close()
 
 if __name__ == "__main__":
     # Configuração do logging principal aqui
@@ -1258,9 +2113,8 @@ if __name__ == "__main__":
     logger = logging.getLogger("PDFProcessorApp") # Logger principal da aplicação
     logger.info(f"Aplicação iniciada com nível de log: {log_level_str}")
 
-    # global cnpj_global_mapping
-    cnpj_global_mapping = load_cnpj_idpgto_mapping()
-    logger.info(f"{len(cnpj_global_mapping)} mapeamentos CNPJ->IDPGTO carregados.")
+    logger.info(f"{len(cnpj_index)} mapeamentos CNPJ->IDPGTO carregados.")
 
-    # main() # A função main original precisa ser chamada aqui
-    pass # A chamada a main() será restaurada após todas as refatorações.
+    # Processamento em lote pela linha de comando (diretórios, globs e ZIPs)
+    from .batch_cli import main
+    main()
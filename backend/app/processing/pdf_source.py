@@ -0,0 +1,120 @@
+"""
+Conteúdo de um PDF ao longo do pipeline (PDFSource), lido uma única vez.
+
+O upload, o membro do ZIP ou o arquivo da pasta monitorada chegam como bytes e ficam em
+memória: pdfplumber, pdfminer e pdfium leem direto deles, sem cópias temporárias. Só
+quem precisa de um caminho (pdftoppm, via pdf2image) ganha uma cópia em TEMP_DIR, criada
+sob demanda e apagada com o documento; PDFs acima de PDF_SPOOL_THRESHOLD_MB vão para
+disco logo na criação. O `cache` guarda resultados intermediários (texto por página,
+classificação, OCR) reaproveitados entre as etapas do mesmo documento.
+"""
+import io
+import logging
+import os
+import tempfile
+import threading
+from typing import BinaryIO, Optional, Union
+
+from ..core.config import settings
+
+logger = logging.getLogger("pdf_source")
+
+class PDFSource:
+    """
+    Conteúdo de um PDF mantido em memória durante todo o pipeline.
+
+    pdfplumber e pdfminer leem de um BytesIO. Só o poppler (pdf2image) exige um
+    caminho: nesse caso uma única cópia temporária é criada sob demanda e
+    reutilizada por todas as rasterizações do documento. PDFs maiores que
+    `spool_threshold` bytes vão direto para disco, para não manter o conteúdo
+    inteiro em memória.
+    """
+    def __init__(self, content: bytes, filename: str = "documento.pdf",
+                 spool_threshold: Optional[int] = None):
+        self.filename = filename
+        self.size = len(content)
+        self._content: Optional[bytes] = content
+        self._path: Optional[str] = None
+        self._owns_path = False
+        self._lock = threading.Lock()
+        # Resultados intermediários reaproveitados entre etapas do mesmo documento
+        self.cache: dict = {}
+        if spool_threshold is None:
+            spool_threshold = settings.PDF_SPOOL_THRESHOLD_MB * 1024 * 1024
+        if spool_threshold > 0 and self.size > spool_threshold:
+            self._spool()
+            self._content = None
+            logger.debug(f"{filename}: {self.size} bytes acima do limite; conteúdo mantido em disco.")
+
+    @classmethod
+    def from_path(cls, path: str, filename: Optional[str] = None) -> "PDFSource":
+        """Cria uma fonte que lê de um arquivo existente (sem cópia temporária)."""
+        source = cls.__new__(cls)
+        source.filename = filename or os.path.basename(path)
+        source.size = os.path.getsize(path)
+        source._content = None
+        source._path = path
+        source._owns_path = False
+        source._lock = threading.Lock()
+        source.cache = {}
+        return source
+
+    @classmethod
+    def coerce(cls, pdf: Union["PDFSource", bytes, str], filename: Optional[str] = None) -> "PDFSource":
+        """Aceita PDFSource, bytes ou caminho de arquivo."""
+        if isinstance(pdf, PDFSource):
+            return pdf
+        if isinstance(pdf, (bytes, bytearray, memoryview)):
+            return cls(bytes(pdf), filename or "documento.pdf")
+        return cls.from_path(os.fspath(pdf), filename)
+
+    def _spool(self):
+        os.makedirs(settings.TEMP_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=".pdf", dir=settings.TEMP_DIR)
+        with os.fdopen(fd, "wb") as f:
+            f.write(self._content)
+        self._path = path
+        self._owns_path = True
+
+    @property
+    def em_memoria(self) -> bool:
+        """True se o conteúdo está em memória (não foi mantido em disco por ser grande)."""
+        return self._content is not None
+
+    def open(self) -> BinaryIO:
+        """Retorna um objeto de arquivo novo, posicionado no início, para leitura do PDF."""
+        if self._content is not None:
+            return io.BytesIO(self._content)
+        return open(self._path, "rb")
+
+    def read(self) -> bytes:
+        """Conteúdo completo do PDF."""
+        if self._content is not None:
+            return self._content
+        with open(self._path, "rb") as f:
+            return f.read()
+
+    def path(self) -> str:
+        """Caminho em disco (criado sob demanda) para ferramentas que só aceitam arquivos, como o poppler."""
+        with self._lock:
+            if self._path is None:
+                self._spool()
+            return self._path
+
+    def close(self):
+        """Remove a cópia temporária, se tiver sido criada."""
+        with self._lock:
+            if self._owns_path and self._path and os.path.exists(self._path):
+                try:
+                    os.unlink(self._path)
+                except OSError as e:
+                    logger.error(f"Erro ao remover arquivo temporário {self._path}: {e}")
+            if self._owns_path:
+                self._path = None
+                self._owns_path = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,213 @@
+"""
+Registro local (SQLite/WAL) de todos os resultados de process_pdf.
+
+As gravações são enfileiradas e feitas em lote por uma única thread escritora,
+para que os workers de processamento nunca disputem o lock do banco. As
+consultas usam índices compostos (coluna, id) e paginação por cursor, com
+custo O(log n) mesmo com milhões de registros.
+"""
+import json
+import logging
+import queue
+import re
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from ..core.config import settings
+from ..core.database import get_connection
+
+logger = logging.getLogger("processing_ledger")
+
+# Colunas gravadas a partir do resultado de process_pdf
+_COLUNAS = (
+    "content_hash", "filename", "id_fluxus", "barcode", "barcode_source", "cnpj",
+    "fornecedor", "valor", "vencimento", "idpgto", "status", "error", "duracao_ms", "trace"
+)
+
+# Colunas acrescentadas depois da primeira versão do schema (migradas com ALTER TABLE)
+_COLUNAS_NOVAS = {"duracao_ms": "REAL", "trace": "TEXT"}
+
+# Filtros aceitos na consulta (todos indexados)
+FILTROS = ("content_hash", "id_fluxus", "barcode", "cnpj")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS processamentos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    content_hash TEXT,
+    filename TEXT,
+    id_fluxus TEXT,
+    barcode TEXT,
+    barcode_source TEXT,
+    cnpj TEXT,
+    fornecedor TEXT,
+    valor TEXT,
+    vencimento TEXT,
+    idpgto TEXT,
+    status TEXT,
+    error TEXT,
+    duracao_ms REAL,
+    trace TEXT,
+    processado_em TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_proc_content_hash ON processamentos (content_hash, id);
+CREATE INDEX IF NOT EXISTS idx_proc_id_fluxus ON processamentos (id_fluxus, id);
+CREATE INDEX IF NOT EXISTS idx_proc_barcode ON processamentos (barcode, id);
+CREATE INDEX IF NOT EXISTS idx_proc_cnpj ON processamentos (cnpj, id);
+"""
+
+def _normalizar_filtro(campo: str, valor: str) -> str:
+    if campo in ("barcode", "cnpj"):
+        return re.sub(r"[^\d]", "", valor)
+    return valor.strip()
+
+class ProcessingLedger:
+    """Armazena e consulta os resultados de processamento de PDFs."""
+    def __init__(self, db_path: str, batch_size: int = 200, flush_interval: float = 0.5):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Optional[Tuple]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _conn(self):
+        conn = get_connection(self.db_path)
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    colunas = {row["name"] for row in conn.execute("PRAGMA table_info(processamentos)")}
+                    for coluna, tipo in _COLUNAS_NOVAS.items():
+                        if coluna not in colunas:
+                            conn.execute(f"ALTER TABLE processamentos ADD COLUMN {coluna} {tipo}")
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_proc_duracao ON processamentos (duracao_ms, id)")
+                    self._schema_ready = True
+        return conn
+
+    def _linha(self, result: Dict) -> Tuple:
+        trace = result.get("trace")
+        valores = []
+        for coluna in _COLUNAS:
+            if coluna == "duracao_ms":
+                # Com trace, a duração total vai para uma coluna própria (consulta de documentos lentos)
+                valores.append(trace.get("total_ms") if trace else None)
+                continue
+            valor = result.get(coluna)
+            if valor is not None and coluna == "cnpj":
+                valor = re.sub(r"[^\d]", "", str(valor)) or None
+            if valor is not None and coluna == "trace":
+                valor = json.dumps(valor, ensure_ascii=False, separators=(",", ":"))
+            valores.append(None if valor is None else str(valor))
+        valores.append(datetime.now().isoformat(timespec="seconds"))
+        return tuple(valores)
+
+    def _garantir_escritor(self):
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._loop_escritor, name="processing-ledger-writer", daemon=True)
+                self._writer.start()
+
+    def _gravar_lote(self, linhas: List[Tuple]):
+        conn = self._conn()
+        colunas = ", ".join(_COLUNAS + ("processado_em",))
+        marcadores = ", ".join("?" * (len(_COLUNAS) + 1))
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(f"INSERT INTO processamentos ({colunas}) VALUES ({marcadores})", linhas)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _loop_escritor(self):
+        while True:
+            item = self._queue.get()
+            pendentes = [item]
+            # Agrupa o que chegar em seguida em uma única transação
+            while len(pendentes) < self.batch_size:
+                try:
+                    pendentes.append(self._queue.get(timeout=self.flush_interval))
+                except queue.Empty:
+                    break
+            linhas = [p for p in pendentes if isinstance(p, tuple)]
+            try:
+                if linhas:
+                    self._gravar_lote(linhas)
+            except Exception as e:
+                logger.error(f"Erro ao gravar {len(linhas)} resultados no ledger: {e}", exc_info=True)
+            finally:
+                for p in pendentes:
+                    if isinstance(p, threading.Event):
+                        p.set()
+                    self._queue.task_done()
+
+    def registrar(self, result: Dict):
+        """
+        Enfileira um resultado de process_pdf para gravação (não bloqueia o chamador).
+        Com multi_boleto, grava uma linha por item de "boletos" (campos do boleto sobre os
+        do documento); o trace e a duração ficam só na primeira, para não contar o
+        documento várias vezes na consulta de documentos lentos.
+        """
+        self._garantir_escritor()
+        boletos = result.get("boletos")
+        if not boletos:
+            self._queue.put(self._linha(result))
+            return
+        for indice, boleto in enumerate(boletos):
+            linha = {**result, **{campo: valor for campo, valor in boleto.items() if valor is not None}}
+            if indice:
+                linha["trace"] = None
+            self._queue.put(self._linha(linha))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Aguarda a gravação de tudo que já foi enfileirado."""
+        self._garantir_escritor()
+        evento = threading.Event()
+        self._queue.put(evento)
+        return evento.wait(timeout)
+
+    def consultar(self, filtros: Optional[Dict[str, str]] = None, limit: int = 50,
+                  cursor: Optional[int] = None, min_duracao_ms: Optional[float] = None) -> Tuple[List[Dict], Optional[int]]:
+        """
+        Consulta resultados do mais recente para o mais antigo.
+
+        Args:
+            filtros: {campo: valor} com campos de FILTROS
+            limit: Quantidade máxima de registros retornados
+            cursor: Retorna apenas registros com id menor que o cursor (próxima página)
+            min_duracao_ms: Apenas documentos processados com trace que levaram ao menos esse tempo
+
+        Returns:
+            Tupla (registros, próximo_cursor) - próximo_cursor é None na última página
+        """
+        condicoes, parametros = [], []
+        for campo, valor in (filtros or {}).items():
+            if campo not in FILTROS:
+                raise ValueError(f"Filtro não suportado: {campo}")
+            if valor:
+                condicoes.append(f"{campo} = ?")
+                parametros.append(_normalizar_filtro(campo, valor))
+        if min_duracao_ms is not None:
+            condicoes.append("duracao_ms >= ?")
+            parametros.append(min_duracao_ms)
+        if cursor is not None:
+            condicoes.append("id < ?")
+            parametros.append(cursor)
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+        rows = self._conn().execute(
+            f"SELECT * FROM processamentos {where} ORDER BY id DESC LIMIT ?",
+            parametros + [limit + 1]
+        ).fetchall()
+        registros = [dict(row) for row in rows[:limit]]
+        for registro in registros:
+            if registro.get("trace"):
+                registro["trace"] = json.loads(registro["trace"])
+        proximo = registros[-1]["id"] if len(rows) > limit else None
+        return registros, proximo
+
+processing_ledger = ProcessingLedger(settings.PROCESSING_LEDGER_DB_PATH)
@@ -0,0 +1,144 @@
+"""
+Renderização de páginas de PDF em matrizes 2D uint8 (tons de cinza).
+
+Dois motores, escolhidos por RASTERIZER:
+- poppler (pdf2image): executa pdftoppm a cada chamada, que grava PPMs em um diretório
+  temporário, relidos pelo PIL e convertidos em matriz. Exige os binários do poppler
+  e um arquivo em disco (PDFSource.path()); o subprocesso é encerrado ao estourar
+  STAGE_TIMEOUT.
+- pdfium (pypdfium2): renderiza no próprio processo, a partir dos bytes em memória,
+  direto em um buffer que vira a matriz da página (sem cópia). Não precisa do poppler
+  (hosts Windows). O pdfium não é thread-safe: as chamadas são serializadas por um
+  lock do processo, e não há como interromper uma renderização (fica o DOCUMENT_TIMEOUT).
+
+"auto" decide pelo modo de execução dos documentos:
+- DOCUMENT_TIMEOUT > 0: pdfium. Cada documento roda em um processo isolado, com lock
+  próprio (sem fila entre as threads do executor) e encerrado ao estourar o prazo, o
+  que cobre a renderização que o pdfium não deixa interromper.
+- DOCUMENT_TIMEOUT = 0 (documentos nas threads do executor): poppler, se o pdftoppm
+  estiver instalado. Cada chamada é um subprocesso próprio, em paralelo com as demais
+  e encerrado ao estourar STAGE_TIMEOUT; com o pdfium, as MAX_WORKERS threads
+  renderizariam uma de cada vez e uma renderização travada não teria limite.
+- Sem o poppler (ou sem o pypdfium2), o motor que estiver disponível.
+"""
+import functools
+import logging
+import shutil
+import threading
+from typing import List, Optional
+
+from ..core.config import settings
+from .errors import ConfigurationError
+from .pdf_source import PDFSource
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    import pdf2image
+    POPPLER_AVAILABLE = True
+except ImportError:
+    POPPLER_AVAILABLE = False
+
+try:
+    import pypdfium2 as pdfium
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    PDFIUM_AVAILABLE = False
+
+logger = logging.getLogger("rasterizers")
+
+RASTERIZADOR_AUTO = "auto"
+RASTERIZADOR_POPPLER = "poppler"
+RASTERIZADOR_PDFIUM = "pdfium"
+
+RASTERIZACAO_DISPONIVEL = NUMPY_AVAILABLE and (POPPLER_AVAILABLE or PDFIUM_AVAILABLE)
+
+# O pdfium tem estado global e não aceita chamadas simultâneas de threads diferentes
+# (vale também para a extração de texto, ver text_extractors)
+PDFIUM_LOCK = threading.Lock()
+
+def para_matriz(img) -> "np.ndarray":
+    """Imagem PIL como matriz 2D uint8 em tons de cinza (já vem em cinza do poppler; sem conversão)."""
+    return np.asarray(img if img.mode == "L" else img.convert("L"))
+
+class RasterizadorPoppler:
+    """pdf2image/pdftoppm em subprocesso, lendo a cópia em disco do PDF."""
+    nome = RASTERIZADOR_POPPLER
+
+    def renderizar(self, source: PDFSource, dpi: int, first_page: Optional[int] = None,
+                   last_page: Optional[int] = None, timeout: Optional[float] = None) -> List["np.ndarray"]:
+        try:
+            imagens = pdf2image.convert_from_path(
+                source.path(), dpi=dpi, first_page=first_page, last_page=last_page,
+                grayscale=True, timeout=timeout
+            )
+        except pdf2image.exceptions.PDFInfoNotInstalledError as e:
+            raise ConfigurationError("Utilitários Poppler (pdfinfo) não encontrados. pdf2image precisa deles.",
+                                     original_exception=e, filename=source.filename)
+        except pdf2image.exceptions.PDFPopplerTimeoutError as e:
+            raise TimeoutError(f"poppler excedeu {timeout:g}s") from e
+        for indice, img in enumerate(imagens):
+            # Converte uma página por vez, liberando a imagem PIL logo em seguida
+            imagens[indice] = para_matriz(img)
+            img.close()
+        return imagens
+
+class RasterizadorPdfium:
+    """pypdfium2 no próprio processo, renderizando direto na matriz da página."""
+    nome = RASTERIZADOR_PDFIUM
+
+    def renderizar(self, source: PDFSource, dpi: int, first_page: Optional[int] = None,
+                   last_page: Optional[int] = None, timeout: Optional[float] = None) -> List["np.ndarray"]:
+        entrada = source.read() if source.em_memoria else source.path()
+        matrizes = []
+        with PDFIUM_LOCK:
+            documento = pdfium.PdfDocument(entrada)
+            try:
+                ultima = min(last_page or len(documento), len(documento))
+                for indice in range(max(first_page or 1, 1) - 1, ultima):
+                    pagina = documento[indice]
+                    try:
+                        bitmap = pagina.render(scale=dpi / 72, grayscale=True)
+                        # A matriz aponta para o buffer do bitmap, que continua vivo por ela
+                        matrizes.append(bitmap.to_numpy())
+                        bitmap.close()
+                    finally:
+                        pagina.close()
+            finally:
+                documento.close()
+        return matrizes
+
+_RASTERIZADORES = {
+    RASTERIZADOR_POPPLER: RasterizadorPoppler(),
+    RASTERIZADOR_PDFIUM: RasterizadorPdfium()
+}
+
+@functools.lru_cache(maxsize=1)
+def _poppler_instalado() -> bool:
+    """pdf2image e os binários do poppler (pdftoppm no PATH)."""
+    return POPPLER_AVAILABLE and shutil.which("pdftoppm") is not None
+
+def _escolher_auto() -> str:
+    """Motor usado por "auto" (ver docstring do módulo)."""
+    if not PDFIUM_AVAILABLE:
+        return RASTERIZADOR_POPPLER
+    if settings.DOCUMENT_TIMEOUT > 0 or not _poppler_instalado():
+        return RASTERIZADOR_PDFIUM
+    return RASTERIZADOR_POPPLER
+
+def obter_rasterizador(nome: Optional[str] = None):
+    """Motor de RASTERIZER (ou `nome`); "auto" escolhe pelo DOCUMENT_TIMEOUT e pelos motores instalados."""
+    nome = (nome or settings.RASTERIZER).lower()
+    if nome == RASTERIZADOR_AUTO:
+        nome = _escolher_auto()
+    if nome not in _RASTERIZADORES:
+        raise ConfigurationError(f"Rasterizador desconhecido: {nome} (use auto, poppler ou pdfium)")
+    if nome == RASTERIZADOR_PDFIUM and not PDFIUM_AVAILABLE:
+        raise ConfigurationError("Rasterizador pdfium selecionado, mas o pypdfium2 não está instalado.")
+    if nome == RASTERIZADOR_POPPLER and not POPPLER_AVAILABLE:
+        raise ConfigurationError("Rasterizador poppler selecionado, mas o pdf2image não está instalado.")
+    return _RASTERIZADORES[nome]
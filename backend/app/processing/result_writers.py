@@ -0,0 +1,174 @@
+"""
+Gravação de resultados de process_pdf em arquivos (usada pelos modos sem API).
+"""
+import csv
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# Colunas dos arquivos de resultado, na ordem em que são gravadas
+RESULT_FIELDS = [
+    "filename", "content_hash", "id_fluxus", "barcode", "barcode_source", "cnpj",
+    "fornecedor", "valor", "vencimento", "idpgto", "status", "error", "duplicate", "duplicate_of"
+]
+
+def _valor_coluna(result: Dict, campo: str):
+    valor = result.get(campo)
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor, ensure_ascii=False)
+    return valor
+
+def _criar_diretorio(path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+class CSVResultWriter:
+    """Acrescenta resultados a um CSV (delimitador ';'), gravando o cabeçalho se o arquivo for novo."""
+    def __init__(self, path: str, fields: Optional[List[str]] = None):
+        self.path = path
+        self.fields = fields or RESULT_FIELDS
+        self._lock = threading.Lock()
+        _criar_diretorio(path)
+        novo = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fields, delimiter=";", extrasaction="ignore")
+        if novo:
+            self._writer.writeheader()
+            self._file.flush()
+
+    def write(self, result: Dict):
+        with self._lock:
+            self._writer.writerow({campo: _valor_coluna(result, campo) for campo in self.fields})
+            self._file.flush()
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class JSONLResultWriter:
+    """Acrescenta um objeto JSON por linha."""
+    def __init__(self, path: str, fields: Optional[List[str]] = None):
+        self.path = path
+        self.fields = fields or RESULT_FIELDS
+        self._lock = threading.Lock()
+        _criar_diretorio(path)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, result: Dict):
+        linha = json.dumps({campo: result.get(campo) for campo in self.fields}, ensure_ascii=False)
+        with self._lock:
+            self._file.write(linha + "\n")
+            self._file.flush()
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class ParquetResultWriter:
+    """
+    Grava resultados em Parquet, em row groups de `batch_size` linhas.
+
+    O rodapé de um Parquet só existe depois de close(): um arquivo aberto durante uma
+    queda fica ilegível. Por isso a saída é dividida em partes: flush() fecha a parte
+    atual (gravada como .tmp, sincronizada em disco e renomeada), e o próximo write()
+    abre outra. O que foi confirmado por flush() está sempre em partes completas, o que
+    permite retomar o lote pelo checkpoint. As partes são `path` (se não existir) e
+    <base>.partN<ext>, legíveis em conjunto com pyarrow.dataset ou pandas.read_parquet.
+    """
+    def __init__(self, path: str, fields: Optional[List[str]] = None, batch_size: int = 5000):
+        if not PARQUET_AVAILABLE:
+            raise RuntimeError("pyarrow não instalado. Saída Parquet indisponível.")
+        self.fields = fields or RESULT_FIELDS
+        self.batch_size = batch_size
+        _criar_diretorio(path)
+        self._base, self._ext = os.path.splitext(path)
+        self.path = self._proximo_caminho()
+        self.partes: List[str] = []
+        self._schema = pa.schema([
+            (campo, pa.bool_() if campo == "duplicate" else pa.string()) for campo in self.fields
+        ])
+        self._writer = None
+        self._destino: Optional[str] = None
+        self._buffer: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def _proximo_caminho(self) -> str:
+        """Primeiro nome livre: `path` e depois <base>.partN<ext> (Parquet não aceita append)."""
+        caminho = f"{self._base}{self._ext}"
+        n = 1
+        while os.path.exists(caminho):
+            caminho = f"{self._base}.part{n}{self._ext}"
+            n += 1
+        return caminho
+
+    def _gravar_buffer(self):
+        if not self._buffer:
+            return
+        colunas = {campo: [] for campo in self.fields}
+        for result in self._buffer:
+            for campo in self.fields:
+                valor = _valor_coluna(result, campo)
+                if campo == "duplicate":
+                    colunas[campo].append(bool(valor))
+                else:
+                    colunas[campo].append(None if valor is None else str(valor))
+        if self._writer is None:
+            self._destino = self._proximo_caminho()
+            self._writer = pq.ParquetWriter(f"{self._destino}.tmp", self._schema)
+        self._writer.write_table(pa.table(colunas, schema=self._schema))
+        self._buffer = []
+
+    def _fechar_parte(self):
+        """Grava o rodapé da parte atual e a publica com o nome definitivo."""
+        if self._writer is None:
+            return
+        self._writer.close()
+        temporario = f"{self._destino}.tmp"
+        fd = os.open(temporario, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(temporario, self._destino)
+        self.partes.append(self._destino)
+        self._writer = None
+
+    def write(self, result: Dict):
+        with self._lock:
+            self._buffer.append(result)
+            if len(self._buffer) >= self.batch_size:
+                self._gravar_buffer()
+
+    def flush(self):
+        with self._lock:
+            self._gravar_buffer()
+            self._fechar_parte()
+
+    def close(self):
+        self.flush()
+
+def criar_writer(path: str, formato: Optional[str] = None, fields: Optional[List[str]] = None):
+    """Cria o writer adequado ao formato ("csv", "jsonl", "parquet") ou à extensão do arquivo."""
+    formato = (formato or os.path.splitext(path)[1].lstrip(".")).lower()
+    if formato == "csv":
+        return CSVResultWriter(path, fields)
+    if formato in ("jsonl", "ndjson"):
+        return JSONLResultWriter(path, fields)
+    if formato == "parquet":
+        return ParquetResultWriter(path, fields)
+    raise ValueError(f"Formato de saída não suportado: {formato}")
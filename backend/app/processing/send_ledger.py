@@ -0,0 +1,118 @@
+import json
+import logging
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from ..core.config import settings
+from ..core.database import get_connection
+
+logger = logging.getLogger("send_ledger")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS envios_realizados (
+    idlan TEXT NOT NULL,
+    barcode TEXT NOT NULL,
+    idpgto TEXT NOT NULL,
+    message TEXT,
+    logs TEXT,
+    enviado_em TEXT NOT NULL,
+    PRIMARY KEY (idlan, barcode, idpgto)
+);
+CREATE TABLE IF NOT EXISTS envios_em_andamento (
+    idlan TEXT NOT NULL,
+    barcode TEXT NOT NULL,
+    idpgto TEXT NOT NULL,
+    iniciado_em TEXT NOT NULL,
+    PRIMARY KEY (idlan, barcode, idpgto)
+);
+"""
+
+class SendLedger:
+    """
+    Registro local dos envios bem-sucedidos ao TOTVS, indexado por
+    (IDLAN, código de barras, IDPGTO). Usado para evitar SaveRecord repetidos.
+    """
+    def __init__(self, db_path: str, window_hours: float):
+        self.db_path = db_path
+        self.window = timedelta(hours=window_hours)
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _conn(self):
+        conn = get_connection(self.db_path)
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    @staticmethod
+    def _chave(idlan, barcode, idpgto):
+        return str(idlan).strip(), re.sub(r"[^\d]", "", str(barcode)), str(idpgto).strip()
+
+    def buscar(self, idlan, barcode, idpgto) -> Optional[Dict]:
+        """Retorna o envio anterior idêntico se ainda estiver dentro da janela configurada."""
+        if self.window.total_seconds() <= 0:
+            return None
+        limite = (datetime.now() - self.window).isoformat(timespec="seconds")
+        row = self._conn().execute(
+            "SELECT message, logs, enviado_em FROM envios_realizados "
+            "WHERE idlan = ? AND barcode = ? AND idpgto = ? AND enviado_em >= ?",
+            self._chave(idlan, barcode, idpgto) + (limite,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "message": row["message"],
+            "logs": json.loads(row["logs"]) if row["logs"] else [],
+            "enviado_em": row["enviado_em"]
+        }
+
+    def reservar(self, idlan, barcode, idpgto, validade_s: float) -> bool:
+        """
+        Marca o envio como em andamento antes do SaveRecord. Retorna False se um envio
+        idêntico já estiver em curso (em qualquer thread ou processo). Reservas mais
+        antigas que validade_s são de envios interrompidos e são descartadas.
+        """
+        chave = self._chave(idlan, barcode, idpgto)
+        agora = datetime.now()
+        conn = self._conn()
+        conn.execute(
+            "DELETE FROM envios_em_andamento WHERE idlan = ? AND barcode = ? AND idpgto = ? AND iniciado_em < ?",
+            chave + ((agora - timedelta(seconds=validade_s)).isoformat(timespec="seconds"),)
+        )
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO envios_em_andamento (idlan, barcode, idpgto, iniciado_em) VALUES (?, ?, ?, ?)",
+            chave + (agora.isoformat(timespec="seconds"),)
+        )
+        return cursor.rowcount == 1
+
+    def liberar(self, idlan, barcode, idpgto):
+        """Remove a reserva feita por reservar (com sucesso ou falha do envio)."""
+        try:
+            self._conn().execute(
+                "DELETE FROM envios_em_andamento WHERE idlan = ? AND barcode = ? AND idpgto = ?",
+                self._chave(idlan, barcode, idpgto)
+            )
+        except Exception as e:
+            # A reserva expira sozinha; não deve mascarar o resultado do envio
+            logger.error(f"Erro ao liberar reserva do envio IDLAN={idlan}: {e}", exc_info=True)
+
+    def registrar(self, idlan, barcode, idpgto, message: str, logs: List[str]):
+        """Registra (ou atualiza) um envio bem-sucedido."""
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO envios_realizados (idlan, barcode, idpgto, message, logs, enviado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                self._chave(idlan, barcode, idpgto) + (
+                    message, json.dumps(logs, ensure_ascii=False), datetime.now().isoformat(timespec="seconds")
+                )
+            )
+        except Exception as e:
+            # Falha no registro não deve transformar um envio bem-sucedido em erro
+            logger.error(f"Erro ao registrar envio IDLAN={idlan} no ledger: {e}", exc_info=True)
+
+send_ledger = SendLedger(settings.SEND_LEDGER_DB_PATH, settings.SEND_LEDGER_WINDOW_HOURS)
@@ -0,0 +1,226 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from ..core.config import settings
+from ..core.database import get_connection
+from .soap_service import enviar_dados_soap
+
+logger = logging.getLogger("send_outbox")
+
+# Estados possíveis de um envio na fila
+STATUS_PENDENTE = "pendente"
+STATUS_ENVIANDO = "enviando"
+STATUS_CONCLUIDO = "concluido"
+STATUS_ERRO = "erro"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS envios (
+    send_id TEXT PRIMARY KEY,
+    id_fluxus TEXT NOT NULL,
+    barcode TEXT NOT NULL,
+    idpgto TEXT,
+    cnpj TEXT,
+    barcode_source TEXT,
+    force INTEGER NOT NULL DEFAULT 0,
+    tag TEXT,
+    status TEXT NOT NULL,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    success INTEGER,
+    message TEXT,
+    logs TEXT,
+    criado_em TEXT NOT NULL,
+    atualizado_em TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_envios_status ON envios (status, criado_em);
+"""
+
+def _agora() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+class _RateLimiter:
+    """Token bucket simples: limita a quantidade de envios por segundo."""
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                espera = (1 - self.tokens) / self.rate
+            time.sleep(espera)
+
+class SendOutbox:
+    """
+    Fila durável de envios SOAP.
+
+    Os envios são gravados em SQLite e confirmados imediatamente com um send_id.
+    Uma thread despachante consome a fila com concorrência limitada e rate limit,
+    gravando o resultado final e os logs de cada envio.
+    """
+    def __init__(self, db_path: str, max_concurrency: int, rate_per_second: float, poll_interval: float):
+        self.db_path = db_path
+        self.max_concurrency = max(1, max_concurrency)
+        self.poll_interval = poll_interval
+        self._rate_limiter = _RateLimiter(rate_per_second)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _conn(self):
+        conn = get_connection(self.db_path)
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    colunas = {row["name"] for row in conn.execute("PRAGMA table_info(envios)")}
+                    if "force" not in colunas:
+                        conn.execute("ALTER TABLE envios ADD COLUMN force INTEGER NOT NULL DEFAULT 0")
+                    if "tag" not in colunas:
+                        conn.execute("ALTER TABLE envios ADD COLUMN tag TEXT")
+                    self._schema_ready = True
+        return conn
+
+    def enfileirar(self, id_fluxus: str, barcode: str, idpgto: Optional[str] = None,
+                   cnpj: Optional[str] = None, barcode_source: Optional[str] = None,
+                   force: bool = False, tag: Optional[str] = None) -> str:
+        """Grava um envio na fila e retorna o send_id gerado."""
+        send_id = uuid.uuid4().hex
+        agora = _agora()
+        self._conn().execute(
+            "INSERT INTO envios (send_id, id_fluxus, barcode, idpgto, cnpj, barcode_source, force, tag, status, criado_em, atualizado_em) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (send_id, id_fluxus, barcode, idpgto, cnpj, barcode_source, int(force), tag, STATUS_PENDENTE, agora, agora)
+        )
+        self._wakeup.set()
+        return send_id
+
+    def obter(self, send_id: str) -> Optional[Dict]:
+        """Retorna o estado atual de um envio (ou None se não existir)."""
+        row = self._conn().execute("SELECT * FROM envios WHERE send_id = ?", (send_id,)).fetchone()
+        if row is None:
+            return None
+        envio = dict(row)
+        envio["success"] = None if envio["success"] is None else bool(envio["success"])
+        envio["logs"] = json.loads(envio["logs"]) if envio["logs"] else []
+        return envio
+
+    def _reservar_pendentes(self, limite: int) -> List[Dict]:
+        """Marca até `limite` envios pendentes como 'enviando' e os retorna."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT * FROM envios WHERE status = ? ORDER BY criado_em LIMIT ?",
+                (STATUS_PENDENTE, limite)
+            ).fetchall()
+            agora = _agora()
+            for row in rows:
+                conn.execute(
+                    "UPDATE envios SET status = ?, tentativas = tentativas + 1, atualizado_em = ? WHERE send_id = ?",
+                    (STATUS_ENVIANDO, agora, row["send_id"])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [dict(row) for row in rows]
+
+    def _processar(self, envio: Dict):
+        try:
+            success, message, logs = enviar_dados_soap(
+                envio["id_fluxus"],
+                envio["barcode"],
+                envio["idpgto"],
+                envio["cnpj"],
+                envio["barcode_source"],
+                force=bool(envio["force"]),
+                tag=envio["tag"]
+            )
+        except Exception as e:
+            logger.error(f"Erro inesperado ao enviar {envio['send_id']}: {e}", exc_info=True)
+            success, message, logs = False, f"Erro inesperado: {str(e)}", []
+        try:
+            self._conn().execute(
+                "UPDATE envios SET status = ?, success = ?, message = ?, logs = ?, atualizado_em = ? WHERE send_id = ?",
+                (STATUS_CONCLUIDO if success else STATUS_ERRO, int(success), message,
+                 json.dumps(logs, ensure_ascii=False), _agora(), envio["send_id"])
+            )
+        finally:
+            self._slots.release()
+            self._wakeup.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            livres = 0
+            while self._slots.acquire(blocking=False):
+                livres += 1
+            try:
+                envios = self._reservar_pendentes(livres) if livres else []
+            except Exception as e:
+                logger.error(f"Erro ao ler a fila de envios: {e}", exc_info=True)
+                envios = []
+            for _ in range(livres - len(envios)):
+                self._slots.release()
+
+            for envio in envios:
+                self._rate_limiter.acquire()
+                self._executor.submit(self._processar, envio)
+
+            if not envios:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def iniciar(self):
+        """Inicia o despachante. Envios interrompidos por queda do processo voltam para a fila."""
+        if self._thread is not None:
+            return
+        recuperados = self._conn().execute(
+            "UPDATE envios SET status = ?, atualizado_em = ? WHERE status = ?",
+            (STATUS_PENDENTE, _agora(), STATUS_ENVIANDO)
+        ).rowcount
+        if recuperados:
+            logger.warning(f"{recuperados} envios interrompidos foram devolvidos à fila.")
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="soap-outbox")
+        self._thread = threading.Thread(target=self._loop, name="soap-outbox-dispatcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Despachante de envios iniciado (concorrência={self.max_concurrency}).")
+
+    def parar(self):
+        """Interrompe o despachante aguardando os envios em andamento."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+        self._thread = None
+        self._executor = None
+
+outbox = SendOutbox(
+    settings.OUTBOX_DB_PATH,
+    settings.SOAP_MAX_CONCURRENCY,
+    settings.SOAP_RATE_LIMIT,
+    settings.OUTBOX_POLL_INTERVAL
+)
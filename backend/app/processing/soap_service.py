@@ -1,42 +1,74 @@
 import requests
 import re
 import logging
+import time
 from typing import Dict, List, Tuple
 
 from ..core.config import settings
+from ..core.metrics import etapa
+from .send_ledger import send_ledger
+from .pdf_processor import get_idpgto_by_cnpj, validar_codigo_barras, validar_codigo_barras_44
 
 logger = logging.getLogger("soap_service")
 
-def enviar_dados_soap(idlan, ipte, idpgto=None, cnpj=None, origem_deteccao=None):
+# Status retornado quando o envio é recusado pela validação local (sem chamada ao TOTVS)
+STATUS_REJEITADO = "rejeitado"
+
+# Tag do SaveRecord conforme o tamanho do código
+TAG_CODIGO_BARRAS = "CODIGOBARRA"  # 44 dígitos
+TAG_IPTE = "IPTE"  # linha digitável, 47/48 dígitos
+
+# Intervalo entre tentativas de reservar um envio idêntico que está em andamento
+_ESPERA_RESERVA_S = 0.2
+
+def validar_envio_local(ipte, idpgto=None, cnpj=None, origem_deteccao=None, logs=None, resolver_cnpj=True, tag=None):
     """
-    Envia dados via SOAP para o sistema TOTVS e retorna logs detalhados.
+    Valida localmente o código e o IDPGTO antes de qualquer chamada de rede.
     
     Args:
-        idlan: ID do lançamento (ID.Fluxus)
         ipte: Código de barras ou linha digitável
         idpgto: IDPGTO fornecido diretamente (opcional)
         cnpj: CNPJ do fornecedor (usado se idpgto não for fornecido)
-        origem_deteccao: Como o código foi detectado ("pyzbar", "texto", "ocr")
+        origem_deteccao: Como o código foi detectado ("pyzbar", "texto", "ocr"); só para os logs
+        logs: Lista onde os logs da validação são acrescentados (opcional)
+        resolver_cnpj: Se False, não resolve o IDPGTO pelo CNPJ (pode consultar o TOTVS);
+            basta um CNPJ/CPF com 11 ou 14 dígitos, e a resolução fica para o envio
+        tag: Tag pedida pelo chamador ("IPTE" ou "CODIGOBARRA", opcional). Sem ela, a tag
+            vem do tamanho do código; informada, precisa ser compatível com ele
         
     Returns:
-        Tupla (sucesso, mensagem, logs)
+        Tupla (erro, tag, idpgto) onde:
+        - erro: mensagem de erro (None se o envio for válido)
+        - tag: "IPTE" ou "CODIGOBARRA"
+        - idpgto: IDPGTO resolvido (None se não encontrado)
     """
-    url = "http://10.131.0.13:8051/wsDataServer/IwsDataServer"
-    username = "douglas.vermil"
-    password = "Chouest123@"
+    if logs is None:
+        logs = []
+    tag = tag.strip().upper() if tag else None
     
-    logs = []  # Lista para armazenar logs detalhados
-    logs.append(f"Iniciando envio para IDLAN={idlan}, Código={ipte}")
+    # 1. Validar o código (tamanho, tipo e dígitos verificadores)
+    codigo = re.sub(r"[^\d]", "", str(ipte or ""))
+    if len(codigo) not in (44, 47, 48):
+        return f"Código com {len(codigo)} dígitos. Esperado 44 (código de barras) ou 47/48 (linha digitável).", tag, None
+    
+    # A tag depende só do tamanho: a linha digitável lida pelo pyzbar continua sendo IPTE
+    tag_a_usar = TAG_CODIGO_BARRAS if len(codigo) == 44 else TAG_IPTE
+    if tag is not None and tag != tag_a_usar:
+        return f"Tag {tag} incompatível com código de {len(codigo)} dígitos (esperado {tag_a_usar}).", tag, None
+    logs.append(f"Usando tag {tag_a_usar} (código de {len(codigo)} dígitos, detectado via {origem_deteccao or 'não informado'})")
     
-    # Determinar qual tag usar com base na origem da detecção
-    tag_a_usar = "IPTE"  # Padrão
-    if origem_deteccao == "pyzbar":
-        tag_a_usar = "CODIGOBARRA"
-        logs.append("Usando tag CODIGOBARRA pois código foi detectado via leitor de código de barras")
+    if len(codigo) == 44:
+        valido = validar_codigo_barras_44(codigo)
+        tipo = "codigo de barras"
     else:
-        logs.append("Usando tag IPTE pois código foi detectado via extração de texto/OCR")
+        valido, tipo = validar_codigo_barras(codigo)
+        if tipo not in ("boleto", "arrecadacao"):
+            valido = False
+    if not valido:
+        return "Código de barras inválido. Verifique os dígitos informados.", tag_a_usar, None
+    logs.append(f"Código validado localmente ({tipo}, {len(codigo)} dígitos)")
     
-    # 1. Determinar o IDPGTO (com prioridade para o valor direto)
+    # 2. Determinar o IDPGTO (com prioridade para o valor direto)
     idpgto_value = None
     
     # Tentativa 1: Usar idpgto direto (se válido)
@@ -48,6 +80,11 @@ def enviar_dados_soap(idlan, ipte, idpgto=None, cnpj=None, origem_deteccao=None)
             logs.append(f"IDPGTO fornecido inválido: {idpgto}")
     
     # Tentativa 2: Buscar via CNPJ (se idpgto direto não for válido)
+    if idpgto_value is None and cnpj and cnpj != "Não encontrado" and not resolver_cnpj:
+        if len(re.sub(r"[^\d]", "", str(cnpj))) not in (11, 14):
+            return f"CNPJ/CPF inválido: {cnpj}", tag_a_usar, None
+        logs.append(f"IDPGTO será resolvido pelo CNPJ {cnpj} no envio")
+        return None, tag_a_usar, None
     if idpgto_value is None and cnpj and cnpj != "Não encontrado":
         logs.append(f"Tentando buscar IDPGTO pelo CNPJ: {cnpj}")
         idpgto_found, encontrado = get_idpgto_by_cnpj(cnpj)
@@ -59,8 +96,96 @@ def enviar_dados_soap(idlan, ipte, idpgto=None, cnpj=None, origem_deteccao=None)
     
     # 3. Falha se nenhum IDPGTO válido foi encontrado
     if idpgto_value is None:
-        logs.append("ERRO: IDPGTO não disponível. Verifique o CNPJ ou preencha manualmente.")
-        return False, "IDPGTO não disponível. Verifique o CNPJ ou preencha manualmente.", logs
+        return "IDPGTO não disponível. Verifique o CNPJ ou preencha manualmente.", tag_a_usar, None
+    
+    return None, tag_a_usar, idpgto_value
+
+def _resultado_anterior(anterior, logs):
+    logs.append(f"Envio idêntico já realizado com sucesso em {anterior['enviado_em']}. TOTVS não foi chamado.")
+    logs.append("Logs do envio original:")
+    logs.extend(anterior["logs"])
+    return True, f"{anterior['message']} (já enviado em {anterior['enviado_em']})", logs
+
+def _reservar_envio(idlan, ipte, idpgto_value, force, logs):
+    """
+    Reserva (IDLAN, código, IDPGTO) antes do SaveRecord. Se um envio idêntico estiver
+    em andamento, espera por ele: quando termina com sucesso, devolve o resultado
+    registrado; quando falha, a reserva fica livre e este envio segue.
+    
+    Returns:
+        None se a reserva foi obtida; senão a tupla (sucesso, mensagem, logs) a devolver
+    """
+    # Uma reserva dura no máximo o POST (com folga); depois disso é de um envio interrompido
+    validade = settings.SOAP_TIMEOUT * 2
+    prazo = time.monotonic() + validade
+    aguardando = False
+    while not send_ledger.reservar(idlan, ipte, idpgto_value, validade):
+        if not aguardando:
+            logs.append("Envio idêntico em andamento. Aguardando o resultado...")
+            aguardando = True
+        if time.monotonic() >= prazo:
+            logs.append("ERRO: envio idêntico continua em andamento")
+            return False, "Envio idêntico em andamento. Tente novamente em instantes.", logs
+        time.sleep(_ESPERA_RESERVA_S)
+        if not force:
+            anterior = send_ledger.buscar(idlan, ipte, idpgto_value)
+            if anterior:
+                return _resultado_anterior(anterior, logs)
+    return None
+
+@etapa("soap")
+def enviar_dados_soap(idlan, ipte, idpgto=None, cnpj=None, origem_deteccao=None, force=False, tag=None):
+    """
+    Envia dados via SOAP para o sistema TOTVS e retorna logs detalhados.
+    
+    Args:
+        idlan: ID do lançamento (ID.Fluxus)
+        ipte: Código de barras ou linha digitável
+        idpgto: IDPGTO fornecido diretamente (opcional)
+        cnpj: CNPJ do fornecedor (usado se idpgto não for fornecido)
+        origem_deteccao: Como o código foi detectado ("pyzbar", "texto", "ocr")
+        force: Se True, envia mesmo que um envio idêntico já tenha sido realizado
+        tag: Tag pedida pelo chamador (ver validar_envio_local); None = pelo tamanho do código
+        
+    Returns:
+        Tupla (sucesso, mensagem, logs)
+    """
+    logs = []  # Lista para armazenar logs detalhados
+    logs.append(f"Iniciando envio para IDLAN={idlan}, Código={ipte}")
+    
+    # Validação local (código, tag e IDPGTO) antes de qualquer chamada de rede
+    erro, tag_a_usar, idpgto_value = validar_envio_local(ipte, idpgto, cnpj, origem_deteccao, logs, tag=tag)
+    if erro:
+        logs.append(f"ERRO: {erro}")
+        return False, erro, logs
+
+    # Envio idêntico recente: devolve o resultado registrado sem chamar o TOTVS
+    if force:
+        logs.append("Reenvio forçado: verificação de envio duplicado ignorada")
+    else:
+        anterior = send_ledger.buscar(idlan, ipte, idpgto_value)
+        if anterior:
+            return _resultado_anterior(anterior, logs)
+    
+    # Só um envio idêntico por vez chega ao TOTVS (cliques duplos, itens repetidos na fila)
+    bloqueio = _reservar_envio(idlan, ipte, idpgto_value, force, logs)
+    if bloqueio is not None:
+        return bloqueio
+    try:
+        if not force:
+            # O envio idêntico pode ter terminado entre a consulta acima e a reserva
+            anterior = send_ledger.buscar(idlan, ipte, idpgto_value)
+            if anterior:
+                return _resultado_anterior(anterior, logs)
+        return _enviar_save_record(idlan, ipte, idpgto_value, tag_a_usar, logs)
+    finally:
+        send_ledger.liberar(idlan, ipte, idpgto_value)
+
+def _enviar_save_record(idlan, ipte, idpgto_value, tag_a_usar, logs):
+    """Monta e envia o SaveRecord; registra o envio no ledger em caso de sucesso."""
+    url = settings.SOAP_URL
+    username = settings.SOAP_USERNAME
+    password = settings.SOAP_PASSWORD
     
     # 4. Construção do SOAP Request
     headers = {
@@ -87,7 +212,7 @@ def enviar_dados_soap(idlan, ipte, idpgto=None, cnpj=None, origem_deteccao=None)
                         </FLAN>
                     </FinLAN>
                 ]]></tot:XML>
-                <tot:Contexto>CODSISTEMA=F;CODCOLIGADA=4;CODUSUARIO=douglas.vermil</tot:Contexto>
+                <tot:Contexto>CODSISTEMA=F;CODCOLIGADA=4;CODUSUARIO={username}</tot:Contexto>
             </tot:SaveRecord>
         </soapenv:Body>
     </soapenv:Envelope>"""
@@ -96,7 +221,7 @@ def enviar_dados_soap(idlan, ipte, idpgto=None, cnpj=None, origem_deteccao=None)
     
     # 5. Envio e tratamento da resposta
     try:
-        response = requests.post(url, headers=headers, data=body, auth=(username, password))
+        response = requests.post(url, headers=headers, data=body, auth=(username, password), timeout=settings.SOAP_TIMEOUT)
         status_code = response.status_code
         logs.append(f"Status code: {status_code}")
         
@@ -136,6 +261,7 @@ def enviar_dados_soap(idlan, ipte, idpgto=None, cnpj=None, origem_deteccao=None)
             return False, f"Erro: {error_msg}", logs
             
         logs.append("Envio realizado com sucesso!")
+        send_ledger.registrar(idlan, ipte, idpgto_value, "Sucesso!", logs)
         return True, "Sucesso!", logs
         
     except requests.exceptions.RequestException as e:
@@ -0,0 +1,211 @@
+"""
+Extração da camada de texto, página a página, com motores intercambiáveis.
+
+- pdfplumber: page.extract_text(x_tolerance=1, y_tolerance=1), o motor original. Monta
+  os objetos de layout completos do pdfminer e agrupa os caracteres em linhas.
+- pdfminer: pdfminer.six com análise de layout (LAParams), como o fallback de CIDs.
+- pdfminer_raw: pdfminer.six sem análise de layout (laparams=None). Os caracteres saem
+  na ordem do conteúdo da página, com quebra de linha quando a linha de base muda e
+  espaço quando há distância entre eles. É o que basta para linhas digitáveis e rótulos.
+- pdfium: API de texto do pdfium (pypdfium2), em C, serializada pelo PDFIUM_LOCK.
+
+TEXT_EXTRACTOR escolhe o motor. "auto" usa o motor da calibração salva em
+TEXT_EXTRACTOR_CALIBRATION_PATH: o mais rápido que deu os mesmos códigos de barras do
+pdfplumber no corpus de referência (ver benchmarks/text_extractors.py). Sem calibração,
+fica o pdfplumber. A calibração é lida uma vez por processo.
+"""
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Sequence
+
+import pdfplumber
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams, LTChar, LTContainer, LTText, LTTextBox
+from pdfminer.pdfexceptions import PDFException
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfplumber.utils.exceptions import PdfminerException
+
+from ..core.config import settings
+from .errors import ConfigurationError, InvalidPDFError
+from .pdf_source import PDFSource
+from .rasterizers import PDFIUM_AVAILABLE, PDFIUM_LOCK
+
+if PDFIUM_AVAILABLE:
+    import pypdfium2 as pdfium
+
+logger = logging.getLogger("text_extractors")
+
+EXTRATOR_AUTO = "auto"
+EXTRATOR_PDFPLUMBER = "pdfplumber"
+EXTRATOR_PDFMINER = "pdfminer"
+EXTRATOR_PDFMINER_RAW = "pdfminer_raw"
+EXTRATOR_PDFIUM = "pdfium"
+
+# Distância (pontos) acima da qual dois caracteres ficam em linhas/palavras diferentes,
+# como as tolerâncias usadas com o pdfplumber
+TOLERANCIA = 1.0
+
+def _numeros_pagina(total: int, paginas: Optional[Sequence[int]]) -> List[int]:
+    return list(paginas) if paginas is not None else list(range(1, total + 1))
+
+class ExtratorPdfplumber:
+    """pdfplumber com tolerâncias de 1 ponto (texto agrupado em linhas)."""
+    nome = EXTRATOR_PDFPLUMBER
+
+    def extrair(self, source: PDFSource, paginas: Optional[Sequence[int]] = None) -> List[str]:
+        try:
+            with pdfplumber.open(source.open()) as pdf:
+                return [self._texto_pagina(pdf.pages[numero - 1]) for numero in _numeros_pagina(len(pdf.pages), paginas)]
+        except PdfminerException as e:
+            raise InvalidPDFError(f"Erro de sintaxe no PDF: {e}", original_exception=e, filename=source.filename)
+
+    @staticmethod
+    def _texto_pagina(page) -> str:
+        try:
+            return page.extract_text(x_tolerance=TOLERANCIA, y_tolerance=TOLERANCIA) or ""
+        except Exception as e:
+            logger.warning(f"Erro ao extrair texto da página com pdfplumber: {e}")
+            return ""
+
+class ExtratorPdfminer:
+    """pdfminer.six página a página; com `laparams`, o texto sai como no extract_text do pdfminer."""
+    def __init__(self, nome: str, laparams: Optional[LAParams]):
+        self.nome = nome
+        self.laparams = laparams
+
+    def extrair(self, source: PDFSource, paginas: Optional[Sequence[int]] = None) -> List[str]:
+        gerenciador = PDFResourceManager(caching=True)
+        dispositivo = PDFPageAggregator(gerenciador, laparams=self.laparams)
+        interpretador = PDFPageInterpreter(gerenciador, dispositivo)
+        textos: Dict[int, str] = {}
+        desejadas = set(paginas) if paginas is not None else None
+        try:
+            with source.open() as stream:
+                for numero, pagina in enumerate(PDFPage.get_pages(stream), start=1):
+                    if desejadas is not None and numero not in desejadas:
+                        continue
+                    interpretador.process_page(pagina)
+                    textos[numero] = self._texto(dispositivo.get_result())
+                    if desejadas is not None and len(textos) == len(desejadas):
+                        break
+        except PDFException as e:
+            raise InvalidPDFError(f"Erro de sintaxe no PDF: {e}", original_exception=e, filename=source.filename)
+        return [textos.get(numero, "") for numero in _numeros_pagina(len(textos), paginas)]
+
+    def _texto(self, layout) -> str:
+        partes: List[str] = []
+        if self.laparams is not None:
+            _texto_layout(layout, partes)
+        else:
+            _texto_sem_layout(layout, partes)
+        return "".join(partes)
+
+def _texto_layout(item, partes: List[str]):
+    """Mesma saída do TextConverter do pdfminer (extract_text)."""
+    if isinstance(item, LTContainer):
+        for filho in item:
+            _texto_layout(filho, partes)
+    elif isinstance(item, LTText):
+        partes.append(item.get_text())
+    if isinstance(item, LTTextBox):
+        partes.append("\n")
+
+def _caracteres(item):
+    if isinstance(item, LTChar):
+        yield item
+    elif isinstance(item, LTContainer):
+        for filho in item:
+            yield from _caracteres(filho)
+
+def _texto_sem_layout(layout, partes: List[str]):
+    """Caracteres na ordem do conteúdo, separados por quebra de linha/espaço conforme a posição."""
+    anterior = None
+    for caractere in _caracteres(layout):
+        if anterior is not None:
+            if abs(caractere.y0 - anterior.y0) > TOLERANCIA:
+                partes.append("\n")
+            elif caractere.x0 - anterior.x1 > TOLERANCIA:
+                partes.append(" ")
+        partes.append(caractere.get_text())
+        anterior = caractere
+
+class ExtratorPdfium:
+    """API de texto do pdfium (quebras de linha do próprio pdfium)."""
+    nome = EXTRATOR_PDFIUM
+
+    def extrair(self, source: PDFSource, paginas: Optional[Sequence[int]] = None) -> List[str]:
+        entrada = source.read() if source.em_memoria else source.path()
+        textos = []
+        with PDFIUM_LOCK:
+            try:
+                documento = pdfium.PdfDocument(entrada)
+            except pdfium.PdfiumError as e:
+                raise InvalidPDFError(f"Erro ao abrir o PDF com o pdfium: {e}", original_exception=e, filename=source.filename)
+            try:
+                for numero in _numeros_pagina(len(documento), paginas):
+                    pagina = documento[numero - 1]
+                    texto_pagina = pagina.get_textpage()
+                    try:
+                        textos.append(texto_pagina.get_text_range().replace("\r\n", "\n"))
+                    finally:
+                        texto_pagina.close()
+                        pagina.close()
+            finally:
+                documento.close()
+        return textos
+
+EXTRATORES = {
+    EXTRATOR_PDFPLUMBER: ExtratorPdfplumber(),
+    EXTRATOR_PDFMINER: ExtratorPdfminer(EXTRATOR_PDFMINER, LAParams(all_texts=True, line_margin=0.2)),
+    EXTRATOR_PDFMINER_RAW: ExtratorPdfminer(EXTRATOR_PDFMINER_RAW, None),
+}
+if PDFIUM_AVAILABLE:
+    EXTRATORES[EXTRATOR_PDFIUM] = ExtratorPdfium()
+
+_calibracao: Optional[dict] = None
+
+def carregar_calibracao() -> Optional[dict]:
+    """Calibração salva em TEXT_EXTRACTOR_CALIBRATION_PATH (lida uma vez por processo), ou None."""
+    global _calibracao
+    if _calibracao is None:
+        try:
+            with open(settings.TEXT_EXTRACTOR_CALIBRATION_PATH, encoding="utf-8") as f:
+                _calibracao = json.load(f)
+        except FileNotFoundError:
+            _calibracao = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Calibração de extração de texto ilegível ({settings.TEXT_EXTRACTOR_CALIBRATION_PATH}): {e}")
+            _calibracao = {}
+    return _calibracao or None
+
+def salvar_calibracao(motor: str, tempos_ms: Dict[str, float], documentos: int):
+    """Grava o motor escolhido pela calibração (usado com TEXT_EXTRACTOR=auto)."""
+    global _calibracao
+    _calibracao = {
+        "motor": motor,
+        "tempos_ms": tempos_ms,
+        "documentos": documentos,
+        "data": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(settings.TEXT_EXTRACTOR_CALIBRATION_PATH)), exist_ok=True)
+    temporario = settings.TEXT_EXTRACTOR_CALIBRATION_PATH + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(_calibracao, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, settings.TEXT_EXTRACTOR_CALIBRATION_PATH)
+
+def obter_extrator(nome: Optional[str] = None):
+    """Motor de TEXT_EXTRACTOR (ou `nome`); "auto" usa a calibração salva, se houver, senão o pdfplumber."""
+    nome = (nome or settings.TEXT_EXTRACTOR).lower()
+    if nome == EXTRATOR_AUTO:
+        calibracao = carregar_calibracao()
+        nome = calibracao.get("motor") if calibracao else EXTRATOR_PDFPLUMBER
+        if nome not in EXTRATORES:
+            logger.warning(f"Motor calibrado '{nome}' indisponível; usando pdfplumber.")
+            nome = EXTRATOR_PDFPLUMBER
+    if nome not in EXTRATORES:
+        raise ConfigurationError(f"Extrator de texto desconhecido ou indisponível: {nome} "
+                                 f"(disponíveis: auto, {', '.join(EXTRATORES)})")
+    return EXTRATORES[nome]
@@ -0,0 +1,240 @@
+"""
+Daemon de ingestão de pastas monitoradas.
+
+Observa as pastas configuradas (WATCH_FOLDERS) com watchdog, espera cada PDF
+parar de crescer (debounce), processa com o mesmo pipeline da API, grava o
+resultado no ledger/CSV e move o arquivo para as subpastas de processados ou
+de erros. Apenas a varredura inicial lista o diretório; depois disso, só os
+eventos do sistema de arquivos são usados.
+
+Uso (a partir de backend/):
+    python -m app.processing.watch_folder --pasta //servidor/scanner
+"""
+import argparse
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
+
+from ..core.config import settings
+from .duplicate_index import duplicate_index
+from .memory_budget import STATUS_ADIADO
+from .isolation import processar_com_prazo
+from .processing_ledger import processing_ledger
+from .result_writers import CSVResultWriter
+
+logger = logging.getLogger("watch_folder")
+
+class _PDFEventHandler(FileSystemEventHandler):
+    """Repassa ao daemon os PDFs criados, alterados ou movidos para a pasta."""
+    def __init__(self, daemon: "WatchFolderDaemon"):
+        self.daemon = daemon
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.daemon.notificar(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.daemon.notificar(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.daemon.notificar(event.dest_path)
+
+class WatchFolderDaemon:
+    """Monitora pastas e processa os PDFs que chegam nelas."""
+    def __init__(self, folders: List[str], done_subdir: str, error_subdir: str,
+                 results_csv: Optional[str], debounce: float, max_workers: int, polling: bool = False):
+        self.folders = [os.path.abspath(f) for f in folders]
+        self.done_subdir = done_subdir
+        self.error_subdir = error_subdir
+        self.debounce = debounce
+        self.max_workers = max(1, max_workers)
+        self.polling = polling
+        self._csv = CSVResultWriter(results_csv) if results_csv else None
+        # caminho -> (tamanho, mtime, instante da última mudança)
+        self._pendentes: Dict[str, Tuple[int, float, float]] = {}
+        self._em_processamento = set()
+        self._lock = threading.Lock()
+        # Limita os arquivos lidos em memória ao mesmo tempo (rajadas de milhares de arquivos)
+        self._slots = threading.BoundedSemaphore(self.max_workers * 2)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="watch-folder")
+        self._stop = threading.Event()
+        self._observer = None
+
+    def notificar(self, path: str):
+        """Registra (ou renova) um arquivo candidato; ele só é processado após o debounce."""
+        path = os.path.abspath(path)
+        if not path.lower().endswith(".pdf") or os.path.dirname(path) not in self.folders:
+            return
+        with self._lock:
+            if path in self._em_processamento:
+                return
+            self._pendentes[path] = (-1, 0.0, time.monotonic())
+
+    def _arquivos_estaveis(self) -> List[str]:
+        """Retorna os arquivos cujo tamanho/mtime não mudou durante o intervalo de debounce."""
+        agora = time.monotonic()
+        prontos = []
+        with self._lock:
+            itens = list(self._pendentes.items())
+        for path, (tamanho, mtime, desde) in itens:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                with self._lock:
+                    self._pendentes.pop(path, None)
+                continue
+            if (stat.st_size, stat.st_mtime) != (tamanho, mtime) or stat.st_size == 0:
+                with self._lock:
+                    if path in self._pendentes:
+                        self._pendentes[path] = (stat.st_size, stat.st_mtime, agora)
+                continue
+            if agora - desde >= self.debounce:
+                prontos.append(path)
+        return prontos
+
+    def _destino(self, path: str, subdir: str) -> str:
+        pasta = os.path.join(os.path.dirname(path), subdir)
+        os.makedirs(pasta, exist_ok=True)
+        destino = os.path.join(pasta, os.path.basename(path))
+        if os.path.exists(destino):
+            nome, ext = os.path.splitext(os.path.basename(path))
+            destino = os.path.join(pasta, f"{nome}_{datetime.now():%Y%m%d%H%M%S%f}{ext}")
+        return destino
+
+    def _processar(self, path: str):
+        filename = os.path.basename(path)
+        try:
+            try:
+                with open(path, "rb") as f:
+                    content = f.read()
+            except OSError as e:
+                # Arquivo ainda bloqueado pelo scanner (comum no Windows): tenta de novo depois
+                logger.warning(f"Não foi possível ler {path}: {e}. Nova tentativa após o debounce.")
+                with self._lock:
+                    self._em_processamento.discard(path)
+                self.notificar(path)
+                return
+
+            result = processar_com_prazo(content, filename)
+            del content
+            if result.get("status") == STATUS_ADIADO:
+                # Sem memória agora: o arquivo fica na pasta e é processado de novo após o debounce
+                logger.warning(f"{filename}: {result.get('error')} Nova tentativa após o debounce.")
+                with self._lock:
+                    self._em_processamento.discard(path)
+                self.notificar(path)
+                return
+            duplicate_index.marcar_resultado(result)
+            processing_ledger.registrar(result)
+            if self._csv:
+                self._csv.write(result)
+
+            subdir = self.done_subdir if result.get("status") == "Processado" else self.error_subdir
+            destino = self._destino(path, subdir)
+            shutil.move(path, destino)
+            logger.info(f"{filename}: {result.get('status')} -> {destino}")
+        except Exception as e:
+            logger.error(f"Erro ao processar {path}: {e}", exc_info=True)
+            try:
+                shutil.move(path, self._destino(path, self.error_subdir))
+            except OSError:
+                pass
+        finally:
+            with self._lock:
+                self._em_processamento.discard(path)
+            self._slots.release()
+
+    def _despachar(self):
+        for path in self._arquivos_estaveis():
+            if not self._slots.acquire(timeout=0.1):
+                break  # Todos os workers ocupados: o restante espera a próxima rodada
+            with self._lock:
+                self._pendentes.pop(path, None)
+                self._em_processamento.add(path)
+            self._executor.submit(self._processar, path)
+
+    def _varredura_inicial(self):
+        for pasta in self.folders:
+            with os.scandir(pasta) as entradas:
+                for entrada in entradas:
+                    if entrada.is_file():
+                        self.notificar(entrada.path)
+
+    def iniciar(self):
+        for pasta in self.folders:
+            os.makedirs(pasta, exist_ok=True)
+        self._observer = PollingObserver() if self.polling else Observer()
+        handler = _PDFEventHandler(self)
+        for pasta in self.folders:
+            # Não recursivo: arquivos movidos para processados/erros não geram novos eventos
+            self._observer.schedule(handler, pasta, recursive=False)
+        self._observer.start()
+        self._varredura_inicial()
+        logger.info(f"Monitorando {len(self.folders)} pasta(s): {', '.join(self.folders)}")
+
+    def executar(self):
+        """Loop principal: despacha arquivos estáveis até parar() ser chamado."""
+        self.iniciar()
+        try:
+            while not self._stop.is_set():
+                self._despachar()
+                self._stop.wait(min(0.5, self.debounce / 2 or 0.5))
+        finally:
+            self.parar()
+
+    def parar(self):
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        self._executor.shutdown(wait=True)
+        processing_ledger.flush(timeout=10)
+        if self._csv:
+            self._csv.close()
+            self._csv = None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Processa PDFs que chegam nas pastas monitoradas.")
+    parser.add_argument("--pasta", action="append", dest="pastas",
+                        help="Pasta a monitorar (pode ser repetido). Padrão: WATCH_FOLDERS")
+    parser.add_argument("--csv", default=settings.WATCH_RESULTS_CSV, help="CSV onde os resultados são acrescentados")
+    parser.add_argument("--debounce", type=float, default=settings.WATCH_DEBOUNCE_SECONDS,
+                        help="Segundos sem alteração antes de processar um arquivo")
+    parser.add_argument("--workers", type=int, default=settings.MAX_WORKERS)
+    parser.add_argument("--polling", action="store_true", default=settings.WATCH_POLLING,
+                        help="Usa observador por polling (compartilhamentos de rede sem eventos nativos)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    pastas = args.pastas or [p for p in settings.WATCH_FOLDERS.split(os.pathsep) if p]
+    if not pastas:
+        parser.error("Nenhuma pasta informada (use --pasta ou WATCH_FOLDERS).")
+
+    daemon = WatchFolderDaemon(
+        pastas,
+        settings.WATCH_DONE_SUBDIR,
+        settings.WATCH_ERROR_SUBDIR,
+        args.csv,
+        args.debounce,
+        args.workers,
+        polling=args.polling
+    )
+    try:
+        daemon.executar()
+    except KeyboardInterrupt:
+        logger.info("Encerrando monitoramento.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark dos rasterizadores (app/processing/rasterizers.py): latência por página e
+memória de cada motor disponível, renderizando uma página por chamada, como no modo
+página a página e nas dicas de localização.
+
+Memória: aumento do RSS do processo (o pdfium renderiza no próprio processo) e RSS
+máximo dos subprocessos (pdftoppm do poppler, que fica fora do RSS do processo).
+O RSS máximo dos subprocessos só cresce, então vale para o primeiro motor que os usa.
+
+Uso (a partir de backend/):
+    python -m benchmarks.rasterizers boleto.pdf contrato.pdf --dpi 300
+    python -m benchmarks.rasterizers lote/*.pdf --motores pdfium
+"""
+import argparse
+import statistics
+import time
+
+from app.processing.memory_budget import rss_mb
+from app.processing.pdf_source import PDFSource
+from app.processing.rasterizers import (
+    PDFIUM_AVAILABLE, POPPLER_AVAILABLE, RASTERIZADOR_PDFIUM, RASTERIZADOR_POPPLER, obter_rasterizador
+)
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:  # Windows
+    RESOURCE_AVAILABLE = False
+
+def _rss_subprocessos_mb() -> float:
+    if not RESOURCE_AVAILABLE:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+def _numero_paginas(caminho: str) -> int:
+    import pdfplumber
+    with pdfplumber.open(caminho) as pdf:
+        return len(pdf.pages)
+
+def medir(nome: str, caminhos, dpi: int, max_paginas: int) -> dict:
+    rasterizador = obter_rasterizador(nome)
+    latencias = []
+    pixels_mb = []
+    rss_inicio = rss_mb() or 0.0
+    rss_pico = rss_inicio
+    for caminho in caminhos:
+        source = PDFSource.from_path(caminho)
+        for pagina in range(1, min(_numero_paginas(caminho), max_paginas) + 1):
+            inicio = time.perf_counter()
+            matrizes = rasterizador.renderizar(source, dpi, first_page=pagina, last_page=pagina)
+            latencias.append(time.perf_counter() - inicio)
+            pixels_mb.append(sum(matriz.nbytes for matriz in matrizes) / (1024 * 1024))
+            rss_pico = max(rss_pico, rss_mb() or 0.0)
+            del matrizes
+    latencias.sort()
+    return {
+        "paginas": len(latencias),
+        "mediana_ms": statistics.median(latencias) * 1000 if latencias else 0.0,
+        "p95_ms": latencias[int(0.95 * (len(latencias) - 1))] * 1000 if latencias else 0.0,
+        "matriz_mb": statistics.median(pixels_mb) if pixels_mb else 0.0,
+        "rss_aumento_mb": rss_pico - rss_inicio,
+        "rss_subprocessos_mb": _rss_subprocessos_mb()
+    }
+
+def main(argv=None):
+    disponiveis = [nome for nome, ok in ((RASTERIZADOR_PDFIUM, PDFIUM_AVAILABLE), (RASTERIZADOR_POPPLER, POPPLER_AVAILABLE)) if ok]
+    parser = argparse.ArgumentParser(description="Compara latência e memória dos rasterizadores.")
+    parser.add_argument("pdfs", nargs="+", help="PDFs de referência")
+    parser.add_argument("--dpi", type=int, default=300, help="Resolução de renderização (padrão: 300)")
+    parser.add_argument("--paginas", type=int, default=10, help="Máximo de páginas por PDF (padrão: 10)")
+    parser.add_argument("--motores", nargs="+", default=disponiveis, choices=[RASTERIZADOR_PDFIUM, RASTERIZADOR_POPPLER],
+                        help="Motores medidos (padrão: os instalados)")
+    args = parser.parse_args(argv)
+
+    print(f"{'motor':<8} {'páginas':>7} {'mediana ms':>11} {'p95 ms':>8} {'matriz MB':>10} {'RSS +MB':>8} {'subproc. MB':>12}  ({args.dpi} dpi)")
+    for nome in args.motores:
+        try:
+            r = medir(nome, args.pdfs, args.dpi, args.paginas)
+        except Exception as e:
+            print(f"{nome:<8} indisponível: {e}")
+            continue
+        print(f"{nome:<8} {r['paginas']:>7} {r['mediana_ms']:>11.1f} {r['p95_ms']:>8.1f} {r['matriz_mb']:>10.1f} "
+              f"{r['rss_aumento_mb']:>8.1f} {r['rss_subprocessos_mb']:>12.1f}")
+
+if __name__ == "__main__":
+    main()
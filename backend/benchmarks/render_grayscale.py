@@ -0,0 +1,99 @@
+"""
+Benchmark da preparação das páginas para pyzbar/OpenCV/Tesseract: caminho antigo
+(render RGB, img.convert("L") para o Tesseract, np.array(img) para o pyzbar e
+cvtColor para o OpenCV) contra o atual (render direto em tons de cinza e uma única
+matriz 2D compartilhada).
+
+Para cada página mede o tempo de renderização, o tempo de preparação e os bytes
+alocados: buffers de imagem do PIL (calculados, o PIL aloca fora do tracemalloc)
+mais o pico do tracemalloc (cópias numpy e bytes intermediários).
+
+Uso (a partir de backend/; requer o poppler):
+    python -m benchmarks.render_grayscale boleto.pdf contrato.pdf --dpi 300
+"""
+import argparse
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+import pdf2image
+
+try:
+    import cv2
+    OPENCV_AVAILABLE = True
+except ImportError:
+    OPENCV_AVAILABLE = False
+
+MB = 1024 * 1024
+
+def _bytes_imagem(img) -> int:
+    return img.width * img.height * len(img.getbands())
+
+def caminho_antigo(caminho: str, pagina: int, dpi: int):
+    """Render RGB e três cópias da página: L para o Tesseract, array RGB e cinza do OpenCV."""
+    inicio = time.perf_counter()
+    img = pdf2image.convert_from_path(caminho, dpi=dpi, first_page=pagina, last_page=pagina)[0]
+    render = time.perf_counter() - inicio
+
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    img_gray = img.convert("L")
+    np_image = np.array(img)
+    if OPENCV_AVAILABLE:
+        gray = cv2.cvtColor(np_image, cv2.COLOR_RGB2GRAY)
+    else:
+        gray = np.asarray(img_gray).copy()
+    preparo = time.perf_counter() - inicio
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    alocado = _bytes_imagem(img) + _bytes_imagem(img_gray) + pico
+    retido = _bytes_imagem(img) + _bytes_imagem(img_gray) + np_image.nbytes + gray.nbytes
+    return render, preparo, alocado, retido
+
+def caminho_cinza(caminho: str, pagina: int, dpi: int):
+    """Render em tons de cinza e uma matriz 2D usada por todos (como em _rasterizar)."""
+    inicio = time.perf_counter()
+    img = pdf2image.convert_from_path(caminho, dpi=dpi, first_page=pagina, last_page=pagina, grayscale=True)[0]
+    render = time.perf_counter() - inicio
+
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    bytes_pil = _bytes_imagem(img)
+    matriz = np.asarray(img if img.mode == "L" else img.convert("L"))
+    img.close()
+    preparo = time.perf_counter() - inicio
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return render, preparo, bytes_pil + pico, matriz.nbytes
+
+def _numero_paginas(caminho: str) -> int:
+    import pdfplumber
+    with pdfplumber.open(caminho) as pdf:
+        return len(pdf.pages)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara a preparação de páginas em RGB e em tons de cinza.")
+    parser.add_argument("pdfs", nargs="+", help="PDFs de referência")
+    parser.add_argument("--dpi", type=int, default=300, help="Resolução de renderização (padrão: 300)")
+    parser.add_argument("--paginas", type=int, default=5, help="Páginas medidas por PDF (padrão: 5)")
+    args = parser.parse_args(argv)
+
+    caminhos = {"rgb (antigo)": caminho_antigo, "cinza (atual)": caminho_cinza}
+    medidas = {nome: [] for nome in caminhos}
+    for caminho in args.pdfs:
+        for pagina in range(1, min(_numero_paginas(caminho), args.paginas) + 1):
+            for nome, funcao in caminhos.items():
+                medidas[nome].append(funcao(caminho, pagina, args.dpi))
+
+    print(f"{'caminho':<15} {'render ms':>10} {'preparo ms':>11} {'alocado MB':>11} {'retido MB':>10}  (mediana por página, {args.dpi} dpi)")
+    for nome, valores in medidas.items():
+        if not valores:
+            continue
+        render, preparo, alocado, retido = (statistics.median(coluna) for coluna in zip(*valores))
+        print(f"{nome:<15} {render * 1000:>10.1f} {preparo * 1000:>11.1f} {alocado / MB:>11.1f} {retido / MB:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Calibração dos extratores de texto (app/processing/text_extractors.py).
+
+Extrai a camada de texto de um corpus de referência com cada motor disponível, mede o
+tempo e compara, página a página, com o pdfplumber (a referência): os códigos de barras
+válidos encontrados no texto e os campos de cabeçalho (ID.Fluxus, NF, CNPJ, Fornecedor)
+de _extract_header_fields, cujas expressões dependem das quebras de linha. O motor
+escolhido é o mais rápido sem nenhuma divergência; com --salvar, ele é gravado em TEXT_EXTRACTOR_CALIBRATION_PATH e passa a
+ser usado com TEXT_EXTRACTOR=auto (na próxima inicialização dos processos).
+
+Uso (a partir de backend/):
+    python -m benchmarks.text_extractors /dados/boletos/referencia --salvar
+    python -m benchmarks.text_extractors a.pdf b.pdf --repeticoes 3
+"""
+import argparse
+import glob
+import os
+import time
+from typing import Dict, List
+
+from app.core.config import settings
+from app.processing.pdf_processor import _candidatos_no_texto, _extract_header_fields, _filtrar_codigos_por_validade
+from app.processing.pdf_source import PDFSource
+from app.processing.text_extractors import EXTRATOR_PDFPLUMBER, EXTRATORES, salvar_calibracao
+
+def _expandir(entradas: List[str]) -> List[str]:
+    caminhos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            caminhos.extend(sorted(glob.glob(os.path.join(entrada, "**", "*.pdf"), recursive=True)))
+        else:
+            caminhos.append(entrada)
+    return caminhos
+
+def _resultado_por_pagina(textos: List[str]) -> List[dict]:
+    """Códigos válidos e campos de cabeçalho de cada página, como o processador os extrai do texto."""
+    return [
+        {"codigos": _filtrar_codigos_por_validade(_candidatos_no_texto(texto)), "campos": _extract_header_fields(texto)}
+        for texto in textos
+    ]
+
+def _divergencia(paginas, referencia) -> str:
+    """Primeira diferença entre o resultado do motor e o do pdfplumber (vazio se forem iguais)."""
+    if paginas == referencia:
+        return ""
+    if "erro" in (paginas, referencia) or len(paginas) != len(referencia):
+        descrever = lambda r: "erro na extração" if r == "erro" else f"{len(r)} página(s)"
+        return f"{descrever(paginas)} (pdfplumber: {descrever(referencia)})"
+    for numero, (pagina, pagina_ref) in enumerate(zip(paginas, referencia), start=1):
+        for chave in ("codigos", "campos"):
+            if pagina[chave] != pagina_ref[chave]:
+                return f"página {numero}, {chave}: {pagina[chave]} (pdfplumber: {pagina_ref[chave]})"
+    return ""
+
+def medir(nome: str, documentos: Dict[str, bytes], repeticoes: int) -> dict:
+    """Tempo total (melhor de `repeticoes` por documento), páginas e, por documento, códigos e campos de cada página."""
+    extrator = EXTRATORES[nome]
+    total = 0.0
+    paginas = 0
+    resultados = {}
+    for caminho, conteudo in documentos.items():
+        melhor = None
+        try:
+            for _ in range(repeticoes):
+                source = PDFSource(conteudo, os.path.basename(caminho), spool_threshold=0)
+                inicio = time.perf_counter()
+                textos = extrator.extrair(source)
+                decorrido = time.perf_counter() - inicio
+                melhor = decorrido if melhor is None else min(melhor, decorrido)
+        except Exception as e:
+            # Falhar no mesmo documento que a referência não conta como divergência
+            resultados[caminho] = "erro"
+            print(f"{nome}: {caminho}: {e}")
+            continue
+        total += melhor
+        paginas += len(textos)
+        resultados[caminho] = _resultado_por_pagina(textos)
+    return {"total_s": total, "paginas": paginas, "resultados": resultados}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Escolhe o extrator de texto mais rápido com os mesmos códigos e campos do pdfplumber.")
+    parser.add_argument("entradas", nargs="+", help="PDFs ou diretórios do corpus de referência")
+    parser.add_argument("--repeticoes", type=int, default=1, help="Extrações por documento; vale a mais rápida (padrão: 1)")
+    parser.add_argument("--salvar", action="store_true", help=f"Grava o motor escolhido em {settings.TEXT_EXTRACTOR_CALIBRATION_PATH}")
+    args = parser.parse_args(argv)
+
+    documentos = {}
+    for caminho in _expandir(args.entradas):
+        with open(caminho, "rb") as f:
+            documentos[caminho] = f.read()
+    if not documentos:
+        parser.error("nenhum PDF encontrado")
+
+    resultados = {nome: medir(nome, documentos, max(1, args.repeticoes)) for nome in EXTRATORES}
+    referencia = resultados[EXTRATOR_PDFPLUMBER]["resultados"]
+
+    print(f"{'motor':<13} {'total ms':>9} {'ms/página':>10} {'divergências':>13}  ({len(documentos)} documento(s))")
+    equivalentes = []
+    for nome, r in resultados.items():
+        divergentes = {}
+        for caminho in documentos:
+            divergencia = _divergencia(r["resultados"][caminho], referencia[caminho])
+            if divergencia:
+                divergentes[caminho] = divergencia
+        if not divergentes:
+            equivalentes.append(nome)
+        por_pagina = r["total_s"] * 1000 / r["paginas"] if r["paginas"] else 0.0
+        print(f"{nome:<13} {r['total_s'] * 1000:>9.1f} {por_pagina:>10.2f} {len(divergentes):>13}")
+        for caminho, divergencia in list(divergentes.items())[:5]:
+            print(f"    {caminho}: {divergencia}")
+
+    escolhido = min(equivalentes, key=lambda nome: resultados[nome]["total_s"])
+    print(f"Motor escolhido: {escolhido}")
+    if args.salvar:
+        tempos = {nome: round(r["total_s"] * 1000, 1) for nome, r in resultados.items()}
+        salvar_calibracao(escolhido, tempos, len(documentos))
+        print(f"Calibração salva em {settings.TEXT_EXTRACTOR_CALIBRATION_PATH}")
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,18 @@ import uvicorn
 import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 import os
 
 from app.api.api import api_router
 from app.core.config import settings
+from app.core.metrics import metricas
+from app.processing.send_outbox import outbox
+from app.processing.cnpj_index import cnpj_index
+from app.processing.isolation import pool_isolamento
+from app.processing.location_hints import location_hints
+from app.processing.ocr_engines import pool_tesseract
 
 # Configurar logging
 logging.basicConfig(
@@ -34,6 +41,44 @@ app.add_middleware(
 # Incluir rotas da API
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+# Métricas no formato texto do Prometheus
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4")
+
+# Despachante da fila de envios SOAP
+@app.on_event("startup")
+def start_outbox():
+    outbox.iniciar()
+
+@app.on_event("shutdown")
+def stop_outbox():
+    outbox.parar()
+
+# Índice CNPJ -> IDPGTO recarregado automaticamente quando o CSV muda
+@app.on_event("startup")
+def start_cnpj_index():
+    cnpj_index.iniciar_monitoramento()
+
+@app.on_event("shutdown")
+def stop_cnpj_index():
+    cnpj_index.parar_monitoramento()
+
+# Estatísticas das dicas de localização "desde o início" contam a partir daqui
+@app.on_event("startup")
+def start_location_hints():
+    location_hints.marcar_inicio()
+
+# Processos isolados (DOCUMENT_TIMEOUT) encerrados junto com a aplicação
+@app.on_event("shutdown")
+def stop_isolation_pool():
+    pool_isolamento.encerrar()
+
+# Handles do Tesseract (tesserocr) liberados junto com a aplicação
+@app.on_event("shutdown")
+def stop_tesseract_pool():
+    pool_tesseract.encerrar()
+
 # Montar diretório de uploads (opcional)
 os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
 app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
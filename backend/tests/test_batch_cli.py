@@ -0,0 +1,101 @@
+"""Processamento em lote (batch_cli): retomada pelo checkpoint e saída Parquet em partes."""
+import csv
+import glob
+import os
+
+import pytest
+
+from app.processing.batch_cli import executar_lote
+from app.processing.result_writers import ParquetResultWriter
+
+LINHAS = [
+    "34196.60489 76475.938247 21948.924119 6 98000000885540",
+    "34199.14175 77631.706692 07439.150009 6 98000000140991",
+    "34190.11527 44939.092662 85878.400572 7 98000000905135",
+]
+
+def _pdf(texto: str) -> bytes:
+    """PDF mínimo de uma página com `texto` em Helvetica."""
+    conteudo = f"BT /F1 10 Tf 40 700 Td ({texto}) Tj ET".encode("latin-1")
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(conteudo) + conteudo + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = b"%PDF-1.4\n"
+    posicoes = []
+    for numero, objeto in enumerate(objetos, start=1):
+        posicoes.append(len(pdf))
+        pdf += b"%d 0 obj\n" % numero + objeto + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % posicao for posicao in posicoes)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, xref)
+    return pdf
+
+@pytest.fixture
+def entrada(tmp_path):
+    diretorio = tmp_path / "entrada"
+    diretorio.mkdir()
+    for numero, linha in enumerate(LINHAS[:2]):
+        (diretorio / f"boleto{numero}.pdf").write_bytes(_pdf(linha))
+    return diretorio
+
+def _ler_csv(caminho):
+    with open(caminho, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f, delimiter=";"))
+
+def test_retomada_processa_apenas_os_itens_novos(entrada, tmp_path):
+    saida = str(tmp_path / "resultados.csv")
+    assert executar_lote([str(entrada)], saida, workers=1, registrar=False) == 2
+    with open(f"{saida}.checkpoint", encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 2
+
+    # Nada a fazer: tudo já está no checkpoint
+    assert executar_lote([str(entrada)], saida, workers=1, registrar=False) == 0
+
+    (entrada / "boleto2.pdf").write_bytes(_pdf(LINHAS[2]))
+    assert executar_lote([str(entrada)], saida, workers=1, registrar=False) == 1
+
+    linhas = _ler_csv(saida)
+    assert sorted(os.path.basename(linha["source"]) for linha in linhas) == ["boleto0.pdf", "boleto1.pdf", "boleto2.pdf"]
+    assert all(linha["status"] == "Processado" for linha in linhas)
+    assert {linha["barcode"].replace(" ", "").replace(".", "") for linha in linhas} == \
+        {linha.replace(" ", "").replace(".", "") for linha in LINHAS}
+
+def test_retomada_com_parquet_grava_partes(entrada, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    saida = str(tmp_path / "resultados.parquet")
+    assert executar_lote([str(entrada)], saida, workers=1, registrar=False) == 2
+    (entrada / "boleto2.pdf").write_bytes(_pdf(LINHAS[2]))
+    assert executar_lote([str(entrada)], saida, workers=1, registrar=False) == 1
+
+    partes = sorted(glob.glob(str(tmp_path / "resultados*.parquet")))
+    assert [os.path.basename(parte) for parte in partes] == ["resultados.parquet", "resultados.part1.parquet"]
+    fontes = [fonte for parte in partes for fonte in pq.read_table(parte).column("source").to_pylist()]
+    assert sorted(os.path.basename(fonte) for fonte in fontes) == ["boleto0.pdf", "boleto1.pdf", "boleto2.pdf"]
+
+def test_parquet_confirmado_por_flush_sobrevive_a_uma_queda(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    saida = str(tmp_path / "saida.parquet")
+    writer = ParquetResultWriter(saida, batch_size=1)
+    for numero in range(3):
+        writer.write({"filename": f"{numero}.pdf", "status": "Processado"})
+    writer.flush()
+    # Depois do flush (checkpoint), mais linhas ficam em uma parte aberta; o processo "cai" sem close()
+    writer.write({"filename": "perdido.pdf", "status": "Processado"})
+    assert os.path.exists(f"{tmp_path / 'saida.part1.parquet'}.tmp")
+
+    partes = glob.glob(str(tmp_path / "*.parquet"))
+    assert partes == [saida]
+    assert pq.read_table(saida).column("filename").to_pylist() == ["0.pdf", "1.pdf", "2.pdf"]
+
+    # A retomada grava em uma parte nova, sem tocar nas já confirmadas
+    retomada = ParquetResultWriter(saida)
+    retomada.write({"filename": "perdido.pdf", "status": "Processado"})
+    retomada.close()
+    assert retomada.partes == [str(tmp_path / "saida.part1.parquet")]
+    assert pq.read_table(retomada.partes[0]).column("filename").to_pylist() == ["perdido.pdf"]
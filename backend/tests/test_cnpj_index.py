@@ -0,0 +1,75 @@
+"""Índice CNPJ/CPF → IDPGTO (CNPJIndex): carga do CSV, índice compacto e recarga."""
+import os
+
+import pytest
+
+from app.processing.cnpj_index import CNPJIndex
+
+CABECALHO = "IDPGTO;CNPJ/CPF\n"
+
+def _gravar_csv(caminho, linhas):
+    with open(caminho, "w", encoding="utf-8") as f:
+        f.write(CABECALHO + "".join(f"{idpgto};{cnpj}\n" for idpgto, cnpj in linhas))
+    # mtime diferente a cada gravação (o índice compacto é validado por mtime e tamanho)
+    os.utime(caminho, ns=(os.stat(caminho).st_mtime_ns + 1_000_000_000,) * 2)
+
+@pytest.fixture
+def csv_path(tmp_path):
+    caminho = str(tmp_path / "fornecedores.csv")
+    _gravar_csv(caminho, [(10, "11.222.333/0001-81"), (20, "123.456.789-09")])
+    return caminho
+
+def test_lookup_com_e_sem_formatacao(csv_path, tmp_path):
+    indice = CNPJIndex(csv_path, str(tmp_path / "cnpj.idx"))
+    assert indice.lookup("11222333000181") == 10
+    assert indice.lookup("123.456.789-09") == 20
+    assert indice.lookup("99.999.999/0001-99") is None
+    assert indice.lookup_many(["11.222.333/0001-81", "123"]) == {"11.222.333/0001-81": 10, "123": None}
+
+@pytest.mark.parametrize("conteudo", [None, "", CABECALHO, "outra;coluna\n1;2\n"])
+def test_recarga_sem_registros_mantem_o_indice_anterior(csv_path, tmp_path, conteudo):
+    indice = CNPJIndex(csv_path, str(tmp_path / "cnpj.idx"))
+    assert len(indice) == 2
+    if conteudo is None:
+        os.remove(csv_path)
+    else:
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write(conteudo)
+    indice.recarregar()
+    assert len(indice) == 2
+    assert indice.lookup("11222333000181") == 10
+
+def test_recarga_troca_o_indice(csv_path, tmp_path):
+    indice = CNPJIndex(csv_path, str(tmp_path / "cnpj.idx"))
+    assert indice.lookup("11222333000181") == 10
+    _gravar_csv(csv_path, [(30, "11.222.333/0001-81")])
+    indice.recarregar()
+    assert indice.lookup("11222333000181") == 30
+    assert indice.lookup("12345678909") is None
+
+def test_indice_compacto_antigo_e_fechado_depois_dos_leitores(csv_path, tmp_path):
+    compact_path = str(tmp_path / "cnpj.idx")
+    CNPJIndex(csv_path, compact_path).lookup("11222333000181")  # grava o índice compacto
+    indice = CNPJIndex(csv_path, compact_path)
+    assert indice.lookup("11222333000181") == 10
+    antigo = indice._mapping
+    assert type(antigo).__name__ == "_CompactMapping"
+
+    with indice._leitura() as mapping:
+        assert mapping is antigo
+        _gravar_csv(csv_path, [(30, "11.222.333/0001-81")])
+        indice.recarregar()
+        # Leitor em andamento: o mmap continua aberto e o índice antigo segue respondendo
+        assert not antigo.fechado
+        assert mapping.get("11222333000181") == 10
+        assert indice.lookup("11222333000181") == 30
+    assert antigo.fechado
+
+    # Sem leitores, o índice trocado é fechado na própria recarga
+    compacto = CNPJIndex(csv_path, compact_path)
+    compacto.lookup("11222333000181")
+    atual = compacto._mapping
+    _gravar_csv(csv_path, [(40, "11.222.333/0001-81")])
+    compacto.recarregar()
+    assert atual.fechado
+    assert compacto.lookup("11222333000181") == 40
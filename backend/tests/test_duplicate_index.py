@@ -0,0 +1,82 @@
+"""Detecção de boletos repetidos (DuplicateIndex) sobre um SQLite temporário."""
+import threading
+
+from app.processing.duplicate_index import DuplicateIndex, chave_boleto
+
+BARCODE = "34196980000008855406604876475938242194892411"
+LINHA = "34196604897647593824721948924119698000000885540"
+OUTRO = "34196980000001409919141777631706690743915000"
+
+def _indice(tmp_path, recent_size=100):
+    return DuplicateIndex(str(tmp_path / "duplicados.db"), capacity=1000, error_rate=0.001, recent_size=recent_size)
+
+def test_linha_digitavel_e_codigo_de_barras_tem_a_mesma_chave():
+    assert chave_boleto(LINHA) == BARCODE
+    assert chave_boleto("34196.60489 76475.938247 21948.924119 6 98000000885540") == BARCODE
+    assert chave_boleto("123") is None
+
+def test_segunda_ocorrencia_aponta_para_a_primeira(tmp_path):
+    indice = _indice(tmp_path)
+    assert indice.verificar_e_registrar(BARCODE, "hash-a", "a.pdf", "100") is None
+    anterior = indice.verificar_e_registrar(LINHA, "hash-b", "b.pdf", "200")
+    assert anterior["filename"] == "a.pdf"
+    assert anterior["content_hash"] == "hash-a"
+    assert anterior["id_fluxus"] == "100"
+    assert indice.verificar_e_registrar(OUTRO, "hash-c", "c.pdf") is None
+
+def test_persistido_entre_reinicios(tmp_path):
+    assert _indice(tmp_path).verificar_e_registrar(BARCODE, filename="a.pdf") is None
+    assert _indice(tmp_path).verificar_e_registrar(BARCODE, filename="b.pdf")["filename"] == "a.pdf"
+
+def test_processos_com_filtros_carregados_antes_compartilham_o_sqlite(tmp_path):
+    # Dois índices com o Bloom já carregado (vazio) simulam dois processos
+    primeiro, segundo = _indice(tmp_path), _indice(tmp_path)
+    assert primeiro.verificar_e_registrar(OUTRO) is None
+    assert segundo.verificar_e_registrar(OUTRO)["filename"] is None
+
+    assert primeiro.verificar_e_registrar(BARCODE, filename="a.pdf") is None
+    assert segundo.verificar_e_registrar(LINHA, filename="b.pdf")["filename"] == "a.pdf"
+    assert primeiro.verificar_e_registrar(BARCODE, filename="c.pdf")["filename"] == "a.pdf"
+
+def test_fora_do_conjunto_recente_confirma_no_sqlite(tmp_path):
+    indice = _indice(tmp_path, recent_size=1)
+    indice.verificar_e_registrar(BARCODE, filename="a.pdf")
+    indice.verificar_e_registrar(OUTRO, filename="b.pdf")
+    assert BARCODE not in indice._recent
+    assert indice.verificar_e_registrar(BARCODE, filename="c.pdf")["filename"] == "a.pdf"
+
+def test_threads_simultaneas_registram_uma_unica_vez(tmp_path):
+    indice = _indice(tmp_path)
+    barreira = threading.Barrier(8)
+    anteriores = []
+
+    def registrar(numero):
+        barreira.wait()
+        anteriores.append(indice.verificar_e_registrar(BARCODE, filename=f"{numero}.pdf"))
+
+    threads = [threading.Thread(target=registrar, args=(numero,)) for numero in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    novos = [anterior for anterior in anteriores if anterior is None]
+    assert len(novos) == 1
+    assert len({anterior["filename"] for anterior in anteriores if anterior is not None}) == 1
+
+def test_multi_boleto_marca_cada_boleto(tmp_path):
+    indice = _indice(tmp_path)
+    indice.verificar_e_registrar(OUTRO, "hash-a", "a.pdf", "100")
+    result = {
+        "filename": "b.pdf", "content_hash": "hash-b", "barcode": LINHA, "id_fluxus": None,
+        "boletos": [{"page": 1, "barcode": LINHA, "id_fluxus": "200"},
+                    {"page": 2, "barcode": OUTRO, "id_fluxus": "201"}]
+    }
+    indice.marcar_resultado(result)
+
+    primeiro, segundo = result["boletos"]
+    assert primeiro["duplicate"] is False and primeiro["duplicate_of"] is None
+    assert segundo["duplicate"] is True and segundo["duplicate_of"]["filename"] == "a.pdf"
+    assert result["duplicate"] is False
+    # O primeiro boleto ficou registrado com o ID.Fluxus da própria página
+    assert indice.verificar_e_registrar(BARCODE)["id_fluxus"] == "200"
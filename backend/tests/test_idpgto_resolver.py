@@ -0,0 +1,110 @@
+"""Resolução de IDPGTO contra um stub local do ReadView do TOTVS (http.server)."""
+import html
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.processing.idpgto_resolver import IDPGTOResolver
+
+CNPJ_INDICE = "11222333000181"
+CNPJ_TOTVS = "44555666000172"
+CNPJ_AUSENTE = "77888999000100"
+IDPGTO_TOTVS = 987
+
+class _Indice:
+    def lookup(self, cnpj):
+        return 123 if cnpj == CNPJ_INDICE else None
+
+class _StubReadView(BaseHTTPRequestHandler):
+    atraso = 0.0
+    corpos = []
+
+    def do_POST(self):
+        corpo = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+        type(self).corpos.append(corpo)
+        time.sleep(type(self).atraso)
+        linhas = f"<IDPGTO>{IDPGTO_TOTVS}</IDPGTO>" if "44.555.666/0001-72" in html.unescape(corpo) else ""
+        resposta = ("<s:Envelope><s:Body><ReadViewResponse><ReadViewResult>"
+                    f"{html.escape(f'<NewDataSet><Row>{linhas}</Row></NewDataSet>')}"
+                    "</ReadViewResult></ReadViewResponse></s:Body></s:Envelope>").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(resposta)))
+        self.end_headers()
+        self.wfile.write(resposta)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def servidor():
+    _StubReadView.atraso = 0.0
+    _StubReadView.corpos = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StubReadView)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/wsDataServer/IwsDataServer"
+    httpd.shutdown()
+    httpd.server_close()
+
+def _resolver(url, ttl=300.0, negative_ttl=60.0, timeout=5.0):
+    return IDPGTOResolver(_Indice(), url=url, username="u", password="p", dataserver="FinCFODataBR",
+                          filtro="CGCCFO = '{cnpj}'", ttl=ttl, negative_ttl=negative_ttl, timeout=timeout)
+
+def test_indice_cache_e_totvs_em_ordem(servidor):
+    resolver = _resolver(servidor)
+
+    assert resolver.resolver(CNPJ_INDICE) == (123, "indice")
+    assert _StubReadView.corpos == []
+
+    assert resolver.resolver("44.555.666/0001-72") == (IDPGTO_TOTVS, "totvs")
+    assert resolver.resolver(CNPJ_TOTVS) == (IDPGTO_TOTVS, "cache")
+    assert len(_StubReadView.corpos) == 1
+    assert "ReadView" in _StubReadView.corpos[0]
+
+    assert resolver.resolver(CNPJ_AUSENTE) == (None, None)
+    assert resolver.resolver(CNPJ_AUSENTE) == (None, None)
+    assert len(_StubReadView.corpos) == 2
+
+    stats = resolver.estatisticas()
+    assert stats["hits_indice"] == 1
+    assert stats["hits_cache"] == 1
+    assert stats["hits_cache_negativo"] == 1
+    assert stats["consultas_totvs"] == 2
+    assert stats["totvs_encontrados"] == 1
+    assert stats["totvs_nao_encontrados"] == 1
+    assert stats["erros_totvs"] == 0
+
+def test_erro_de_comunicacao_nao_e_cacheado():
+    resolver = _resolver("http://127.0.0.1:9/", timeout=1.0)
+    assert resolver.resolver(CNPJ_TOTVS) == (None, None)
+    assert resolver.resolver(CNPJ_TOTVS) == (None, None)
+    stats = resolver.estatisticas()
+    assert stats["consultas_totvs"] == 2
+    assert stats["erros_totvs"] == 2
+
+@pytest.mark.parametrize("ttl", [300.0, 0.0])
+def test_consulta_unica_por_cnpj(servidor, ttl):
+    # Com TTL 0 nada fica no cache: as threads que aguardam recebem o resultado da própria consulta
+    _StubReadView.atraso = 0.3
+    resolver = _resolver(servidor, ttl=ttl)
+    barreira = threading.Barrier(8)
+    resultados = []
+
+    def consultar():
+        barreira.wait()
+        resultados.append(resolver.resolver(CNPJ_TOTVS))
+
+    threads = [threading.Thread(target=consultar) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert resultados == [(IDPGTO_TOTVS, "totvs")] * 8
+    assert len(_StubReadView.corpos) == 1
+    stats = resolver.estatisticas()
+    assert stats["consultas_totvs"] == 1
+    assert stats["consultas_compartilhadas"] == 7
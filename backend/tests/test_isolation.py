@@ -0,0 +1,121 @@
+"""processar_com_prazo: prazo por documento em processos isolados, com um process_pdf de teste."""
+import os
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from app.core.config import settings
+from app.processing import isolation
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "killpg"), reason="encerramento do grupo de processos exige POSIX")
+
+def _grupo_do_worker():
+    return os.getpid(), os.getpgid(0)
+
+def _processar(pdf_file, filename, *args):
+    """
+    Substituto de process_pdf (roda no processo isolado): "lento*" trava com um subprocesso
+    filho; "paginas*" usa o pool de páginas, como o modo multi-boleto.
+    """
+    if filename.startswith("paginas"):
+        from app.processing.pdf_processor import _get_page_executor
+        worker = _get_page_executor().submit(_grupo_do_worker).result(timeout=60)
+        return {"status": "Processado", "pid": os.getpid(), "grupo": os.getpgid(0), "worker": worker}
+    if filename.startswith("lento"):
+        neto = subprocess.Popen(["sleep", "60"])
+        Path(pdf_file.decode()).write_text(str(neto.pid))
+        time.sleep(60)
+    return {"status": "Processado", "filename": filename, "pid": os.getpid(), "tmp": tempfile.gettempdir()}
+
+def _vivo(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] not in ("Z", "X")
+    except FileNotFoundError:
+        return False
+    except OSError:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        return True
+
+def _diretorios_isolamento(base: Path):
+    return sorted(p.name for p in base.glob("isolamento-*"))
+
+@pytest.fixture
+def pool(monkeypatch, tmp_path):
+    temp = tmp_path / "temp"
+    monkeypatch.setattr(settings, "TEMP_DIR", str(temp))
+    monkeypatch.setattr(settings, "DOCUMENT_TIMEOUT", 2.0)
+    # Lido pelo processo isolado ao importar a configuração
+    monkeypatch.setenv("PROFILING_DIR", str(tmp_path / "perfis"))
+    monkeypatch.setattr(settings, "PROFILING_DIR", str(tmp_path / "perfis"))
+    pool = isolation.PoolIsolamento(_processar)
+    monkeypatch.setattr(isolation, "pool_isolamento", pool)
+    yield temp
+    pool.encerrar()
+
+def test_documento_rapido_reaproveita_o_processo(pool):
+    primeiro = isolation.processar_com_prazo(b"%PDF", "a.pdf")
+    segundo = isolation.processar_com_prazo(b"%PDF", "b.pdf")
+    assert primeiro["status"] == segundo["status"] == "Processado"
+    assert primeiro["pid"] == segundo["pid"] != os.getpid()
+    # Temporários do processo isolado no diretório próprio, dentro de TEMP_DIR
+    assert Path(primeiro["tmp"]).parent == pool
+    assert _diretorios_isolamento(pool) == [Path(primeiro["tmp"]).name]
+
+def test_prazo_estourado_encerra_o_grupo_e_substitui_o_processo(pool, tmp_path):
+    anterior = isolation.processar_com_prazo(b"%PDF", "a.pdf")
+    arquivo_pid = tmp_path / "neto.pid"
+
+    inicio = time.monotonic()
+    result = isolation.processar_com_prazo(str(arquivo_pid).encode(), "lento.pdf")
+    assert time.monotonic() - inicio < 10
+    assert result["status"] == isolation.STATUS_TEMPO_ESGOTADO
+    assert result["filename"] == "lento.pdf"
+    assert "2s" in result["error"]
+
+    # O processo, o subprocesso que ele criou e o diretório temporário não sobram
+    assert not _vivo(anterior["pid"])
+    neto = int(arquivo_pid.read_text())
+    for _ in range(50):
+        if not _vivo(neto):
+            break
+        time.sleep(0.1)
+    assert not _vivo(neto)
+    assert _diretorios_isolamento(pool) == []
+
+    # O documento seguinte roda em um processo novo
+    seguinte = isolation.processar_com_prazo(b"%PDF", "b.pdf")
+    assert seguinte["status"] == "Processado"
+    assert seguinte["pid"] != anterior["pid"]
+    assert _diretorios_isolamento(pool) == [Path(seguinte["tmp"]).name]
+
+def test_pool_de_paginas_fica_no_grupo_do_processo_isolado(pool):
+    result = isolation.processar_com_prazo(b"%PDF", "paginas.pdf")
+    assert result["status"] == "Processado"
+    worker_pid, worker_grupo = result["worker"]
+    # O processo isolado lidera o próprio grupo; os workers de página entram nele e morrem no killpg
+    assert result["grupo"] == result["pid"] == worker_grupo
+    assert worker_pid != result["pid"]
+
+    isolation.pool_isolamento.encerrar()
+    for _ in range(50):
+        if not _vivo(worker_pid):
+            break
+        time.sleep(0.1)
+    assert not _vivo(worker_pid)
+    assert _diretorios_isolamento(pool) == []
+
+def test_documento_perfilado_roda_no_processo_isolado(pool, tmp_path):
+    result = isolation.processar_com_prazo(b"%PDF", "a.pdf", formato_perfil="collapsed")
+    assert result["pid"] != os.getpid()
+    assert (tmp_path / "perfis" / (result["profiling"]["id"] + ".collapsed.txt")).exists()
+
+    # O prazo continua valendo para documentos perfilados
+    result = isolation.processar_com_prazo(str(tmp_path / "neto.pid").encode(), "lento.pdf", formato_perfil="collapsed")
+    assert result["status"] == isolation.STATUS_TEMPO_ESGOTADO
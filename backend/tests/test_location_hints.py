@@ -0,0 +1,49 @@
+"""Dicas de localização: estatísticas lidas do SQLite, somando as tentativas de outros processos."""
+import pytest
+
+from app.core.config import settings
+from app.processing.location_hints import LocationHints, chave_fornecedor
+
+@pytest.fixture(autouse=True)
+def dicas_ativas(monkeypatch):
+    monkeypatch.setattr(settings, "LOCATION_HINTS", True)
+
+def test_chave_fornecedor():
+    assert chave_fornecedor("11.222.333/0001-81") == "11222333000181"
+    assert chave_fornecedor("123", "  Fornecedor   LTDA ") == "nome:fornecedor ltda"
+    assert chave_fornecedor(None, "") is None
+
+def test_estatisticas_somam_tentativas_de_outros_processos(tmp_path):
+    db = str(tmp_path / "dicas.db")
+    api = LocationHints(db)
+    api.marcar_inicio()
+    assert api.estatisticas()["tentativas"] == 0
+    assert api.obter("11222333000181") is None  # cópia em memória carregada antes das dicas existirem
+
+    # Outro processo (isolamento, lote, daemon de pastas) usa a mesma base
+    worker = LocationHints(db)
+    worker.registrar("11222333000181", 2, (0.1, 0.7, 0.9, 0.8), "pyzbar")
+    worker.contabilizar("11222333000181", "pyzbar", True)
+    worker.contabilizar("11222333000181", "pyzbar", False)
+    worker.registrar("99888777000166", 1, None, "texto")
+    worker.contabilizar("99888777000166", "texto", True)
+
+    stats = api.estatisticas()
+    assert stats["fornecedores"] == 2
+    assert (stats["tentativas"], stats["acertos"], stats["taxa_acerto"]) == (3, 2, 0.6667)
+    assert stats["por_origem"] == {"pyzbar": {"tentativas": 2, "acertos": 1}, "texto": {"tentativas": 1, "acertos": 1}}
+    assert (stats["tentativas_acumuladas"], stats["acertos_acumulados"]) == (3, 2)
+
+def test_desde_o_inicio_exclui_tentativas_anteriores(tmp_path):
+    db = str(tmp_path / "dicas.db")
+    anterior = LocationHints(db)
+    anterior.registrar("11222333000181", 1, None, "texto")
+    anterior.contabilizar("11222333000181", "texto", True)
+
+    api = LocationHints(db)
+    api.marcar_inicio()
+    api.contabilizar("11222333000181", "texto", False)
+    stats = api.estatisticas()
+    assert (stats["tentativas"], stats["acertos"]) == (1, 0)
+    assert (stats["tentativas_acumuladas"], stats["acertos_acumulados"]) == (2, 1)
+    assert api.obter("11222333000181") == {"pagina": 1, "bbox": None, "origem": "texto"}
@@ -0,0 +1,138 @@
+"""Classificador de páginas: palavras-chave, texto ilegível, faixas de código de barras e nova análise no multi-boleto."""
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.processing import pdf_processor
+from app.processing.page_classifier import (
+    PAGINA_BOLETO, PAGINA_DANFE, PAGINA_OUTRA, classificar_imagem, classificar_texto, localizar_faixas_codigo_barras
+)
+
+LINHA = "34196604897647593824721948924119698000000885540"
+
+BOLETO = (
+    "Banco Itaú  341-7  Recibo do Pagador  Beneficiário: Fornecedor Ltda  Nosso Número 109/00012345-6  "
+    "Local de pagamento: pagável em qualquer banco até o vencimento  Data de Vencimento 10/12/2025"
+)
+DANFE = (
+    "DANFE  Documento Auxiliar da Nota Fiscal Eletrônica  0 - Entrada 1 - Saída  Chave de acesso "
+    "3525 1200 0000 0000 0000 5500 1000 0012 3410 0000 0000  Natureza da operação: Venda de mercadoria"
+)
+
+@pytest.mark.parametrize("texto, esperado", [
+    (BOLETO, PAGINA_BOLETO),
+    (BOLETO.upper(), PAGINA_BOLETO),
+    (DANFE, PAGINA_DANFE),
+    # DANFE com a ficha de compensação impressa embaixo: empate favorece o boleto
+    ("DANFE Chave de acesso 3525... Ficha de Compensação Linha digitável " + "x" * 20, PAGINA_BOLETO),
+    # Só menções de passagem ao boleto em uma DANFE: continua DANFE
+    (DANFE + " Dados adicionais: pagamento via boleto, beneficiário Fornecedor, cedente Fornecedor", PAGINA_DANFE),
+    ("Contrato de prestação de serviços de manutenção entre as partes abaixo qualificadas", PAGINA_OUTRA),
+    ("Fatura de serviços. Beneficiário: Fornecedor Ltda, CNPJ 12.345.678/0001-90", PAGINA_BOLETO),
+])
+def test_classificar_texto(texto, esperado):
+    assert classificar_texto(texto) == esperado
+
+@pytest.mark.parametrize("texto", [
+    None,
+    "",
+    "   \n  ",
+    "Nosso Número 123",  # curto demais para confiar na camada de texto
+    "(cid:12)(cid:34)(cid:56) (cid:7)(cid:8) Beneficiário " + " ".join("(cid:%d)" % i for i in range(40)),
+])
+def test_texto_vazio_ou_ilegivel_fica_para_a_imagem(texto):
+    assert classificar_texto(texto) is None
+
+DPI = 72
+
+def _pagina(*faixas_y: int, texto_y: int = None) -> np.ndarray:
+    """Página A4 branca a 72 dpi com faixas de barras verticais (13 mm de altura) começando nas linhas `faixas_y`."""
+    pagina = np.full((842, 595), 255, dtype=np.uint8)
+    altura = int(13 / 25.4 * DPI)
+    barras = np.tile(np.repeat(np.array([0, 255], dtype=np.uint8), 2), 75)  # 150 transições por linha
+    for y in faixas_y:
+        pagina[y:y + altura, 100:100 + barras.size] = barras
+    if texto_y is not None:
+        # Ruído com muitas transições por linha, mas que muda de uma linha para a outra (como texto)
+        ruido = np.random.default_rng(0).integers(0, 2, size=(60, 400), dtype=np.uint8) * 255
+        pagina[texto_y:texto_y + 60, 100:500] = ruido
+    return pagina
+
+def test_faixa_de_barras_embaixo_e_boleto():
+    pagina = _pagina(760, texto_y=100)
+    faixas = localizar_faixas_codigo_barras(pagina, DPI)
+    assert len(faixas) == 1 and faixas[0] == pytest.approx((760 + 18) / 842, abs=0.02)
+    assert classificar_imagem(pagina, DPI) == PAGINA_BOLETO
+
+def test_faixa_de_barras_no_topo_e_danfe():
+    pagina = _pagina(60, texto_y=300)
+    assert classificar_imagem(pagina, DPI) == PAGINA_DANFE
+
+def test_sem_barras_e_outra():
+    assert localizar_faixas_codigo_barras(_pagina(texto_y=300), DPI) == []
+    assert classificar_imagem(_pagina(texto_y=300), DPI) == PAGINA_OUTRA
+
+def test_faixa_baixa_demais_nao_conta():
+    pagina = np.full((842, 595), 255, dtype=np.uint8)
+    pagina[700:710, 100:400] = np.tile(np.array([0, 0, 255, 255], dtype=np.uint8), 75)  # ~3,5 mm
+    assert localizar_faixas_codigo_barras(pagina, DPI) == []
+
+def _pdf(*textos: str) -> bytes:
+    """PDF mínimo com uma página por texto, em Helvetica."""
+    paginas = len(textos)
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % (4 + 2 * i) for i in range(paginas)), paginas),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, texto in enumerate(textos):
+        conteudo = f"BT /F1 10 Tf 40 700 Td ({texto}) Tj ET".encode("latin-1")
+        objetos.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 3 0 R >> >> >>" % (5 + 2 * i))
+        objetos.append(b"<< /Length %d >>\nstream\n" % len(conteudo) + conteudo + b"\nendstream")
+    pdf = b"%PDF-1.4\n"
+    posicoes = []
+    for numero, objeto in enumerate(objetos, start=1):
+        posicoes.append(len(pdf))
+        pdf += b"%d 0 obj\n" % numero + objeto + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % posicao for posicao in posicoes)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, xref)
+    return pdf
+
+@pytest.fixture
+def analise_por_imagem(monkeypatch):
+    """
+    Classificação e pyzbar/OCR simulados: `classes` diz a classe de cada página e `codigos`
+    o que a análise por imagem encontra nela; `analisadas` registra as páginas analisadas.
+    """
+    estado = {"classes": {}, "codigos": {}, "analisadas": []}
+    monkeypatch.setattr(pdf_processor, "OCR_AVAILABLE", True)
+    monkeypatch.setattr(settings, "PAGE_CLASSIFIER", True)
+    monkeypatch.setattr(settings, "PAGE_WORKERS", 1)
+    monkeypatch.setattr(pdf_processor, "_classe_pagina", lambda source, numero, texto: estado["classes"][numero])
+
+    def analisar(source, numero, filename, precisa_texto, orcamento):
+        estado["analisadas"].append(numero)
+        return [(codigo, "pyzbar") for codigo in estado["codigos"].get(numero, [])], ""
+
+    monkeypatch.setattr(pdf_processor, "_analisar_pagina_imagem", analisar)
+    return estado
+
+def test_multi_boleto_reanalisa_paginas_dispensadas_se_nada_for_encontrado(analise_por_imagem):
+    analise_por_imagem["classes"] = {1: PAGINA_DANFE, 2: PAGINA_DANFE, 3: PAGINA_OUTRA}
+    analise_por_imagem["codigos"] = {2: [LINHA]}
+    result = pdf_processor.process_pdf(_pdf("Pagina 1", "Pagina 2", "Pagina 3"), "danfe.pdf", multi_boleto=True)
+
+    # Nenhuma página candidata: todas foram dispensadas e depois analisadas na segunda passada
+    assert analise_por_imagem["analisadas"] == [1, 2, 3]
+    assert [(boleto["page"], boleto["barcode"]) for boleto in result["boletos"]] == [(2, LINHA)]
+
+def test_multi_boleto_nao_reanalisa_se_a_candidata_tiver_boleto(analise_por_imagem):
+    analise_por_imagem["classes"] = {1: PAGINA_BOLETO, 2: PAGINA_DANFE}
+    analise_por_imagem["codigos"] = {1: [LINHA], 2: [LINHA]}
+    result = pdf_processor.process_pdf(_pdf("Pagina 1", "Pagina 2"), "boleto.pdf", multi_boleto=True)
+
+    assert analise_por_imagem["analisadas"] == [1]
+    assert [boleto["page"] for boleto in result["boletos"]] == [1]
@@ -0,0 +1,30 @@
+"""Gravação e consulta do ledger de processamentos (ProcessingLedger) sobre um SQLite temporário."""
+import pytest
+
+from app.processing.processing_ledger import ProcessingLedger
+
+BARCODE = "34196980000008855406604876475938242194892411"
+OUTRO = "34196980000001409919141777631706690743915000"
+
+@pytest.fixture
+def ledger(tmp_path):
+    return ProcessingLedger(str(tmp_path / "ledger.db"), flush_interval=0.05)
+
+def test_multi_boleto_grava_uma_linha_por_boleto(ledger):
+    ledger.registrar({
+        "filename": "lote.pdf", "content_hash": "hash-a", "barcode": BARCODE, "cnpj": "11.222.333/0001-81",
+        "status": "Processado", "trace": {"total_ms": 120.0},
+        "boletos": [{"page": 1, "barcode": BARCODE, "valor": "10.00", "id_fluxus": "100"},
+                    {"page": 2, "barcode": OUTRO, "valor": "20.00", "id_fluxus": "101"}]
+    })
+    assert ledger.flush(5)
+
+    registros, _ = ledger.consultar({"content_hash": "hash-a"})
+    por_codigo = {registro["barcode"]: registro for registro in registros}
+    assert set(por_codigo) == {BARCODE, OUTRO}
+    assert por_codigo[OUTRO]["valor"] == "20.00"
+    assert por_codigo[OUTRO]["id_fluxus"] == "101"
+    assert por_codigo[OUTRO]["cnpj"] == "11222333000181"
+    assert ledger.consultar({"barcode": OUTRO})[0][0]["filename"] == "lote.pdf"
+    # A duração do documento conta uma única vez
+    assert len(ledger.consultar(min_duracao_ms=100)[0]) == 1
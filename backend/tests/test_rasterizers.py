@@ -0,0 +1,30 @@
+"""Escolha do rasterizador em RASTERIZER=auto conforme o DOCUMENT_TIMEOUT e os motores instalados."""
+import pytest
+
+from app.core.config import settings
+from app.processing import rasterizers
+
+@pytest.fixture
+def instalados(monkeypatch):
+    monkeypatch.setattr(settings, "RASTERIZER", "auto")
+    def configurar(pdfium: bool, poppler: bool):
+        monkeypatch.setattr(rasterizers, "PDFIUM_AVAILABLE", pdfium)
+        monkeypatch.setattr(rasterizers, "POPPLER_AVAILABLE", poppler)
+        monkeypatch.setattr(rasterizers, "_poppler_instalado", lambda: poppler)
+    return configurar
+
+@pytest.mark.parametrize("timeout, pdfium, poppler, esperado", [
+    (0, True, True, "poppler"),     # threads do executor: poppler em paralelo e interrompível
+    (30, True, True, "pdfium"),     # processo isolado por documento
+    (0, True, False, "pdfium"),     # sem poppler (ex.: Windows)
+    (30, False, True, "poppler"),
+])
+def test_auto(monkeypatch, instalados, timeout, pdfium, poppler, esperado):
+    instalados(pdfium, poppler)
+    monkeypatch.setattr(settings, "DOCUMENT_TIMEOUT", timeout)
+    assert rasterizers.obter_rasterizador().nome == esperado
+
+def test_motor_explicito_nao_instalado(instalados):
+    instalados(pdfium=False, poppler=True)
+    with pytest.raises(rasterizers.ConfigurationError):
+        rasterizers.obter_rasterizador("pdfium")
@@ -0,0 +1,139 @@
+"""Envios idempotentes ao TOTVS: SendLedger e enviar_dados_soap contra um stub local do SaveRecord."""
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.core.config import settings
+from app.processing import soap_service
+from app.processing.send_ledger import SendLedger
+
+BARCODE = "34196980000008855406604876475938242194892411"
+LINHA = "34196.60489 76475.938247 21948.924119 6 98000000885540"
+
+class _StubSaveRecord(BaseHTTPRequestHandler):
+    corpos = []
+    atraso = 0.0
+    falhas = 0
+
+    def do_POST(self):
+        type(self).corpos.append(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8"))
+        time.sleep(type(self).atraso)
+        if type(self).falhas > 0:
+            type(self).falhas -= 1
+            resposta = b"<s:Envelope><s:Body><Message>Erro no servidor</Message></s:Body></s:Envelope>"
+        else:
+            resposta = b"<s:Envelope><s:Body><SaveRecordResponse><SaveRecordResult>4;1</SaveRecordResult></SaveRecordResponse></s:Body></s:Envelope>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(resposta)))
+        self.end_headers()
+        self.wfile.write(resposta)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def ledger(tmp_path):
+    return SendLedger(str(tmp_path / "envios.db"), window_hours=24)
+
+@pytest.fixture
+def totvs(monkeypatch, ledger):
+    _StubSaveRecord.corpos = []
+    _StubSaveRecord.atraso = 0.0
+    _StubSaveRecord.falhas = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StubSaveRecord)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    monkeypatch.setattr(settings, "SOAP_URL", f"http://127.0.0.1:{httpd.server_address[1]}/wsDataServer/IwsDataServer")
+    monkeypatch.setattr(soap_service, "send_ledger", ledger)
+    yield _StubSaveRecord.corpos
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_chave_normaliza_o_codigo(ledger):
+    ledger.registrar(" 100 ", LINHA, 7, "Sucesso!", ["ok"])
+    anterior = ledger.buscar("100", LINHA.replace(".", "").replace(" ", ""), "7")
+    assert anterior["message"] == "Sucesso!"
+    assert anterior["logs"] == ["ok"]
+    assert ledger.buscar("100", LINHA, "8") is None
+    assert ledger.buscar("101", LINHA, "7") is None
+
+def test_envio_fora_da_janela_e_ignorado(ledger):
+    ledger.registrar("100", BARCODE, 7, "Sucesso!", [])
+    antigo = (datetime.now() - timedelta(hours=25)).isoformat(timespec="seconds")
+    with sqlite3.connect(ledger.db_path) as conn:
+        conn.execute("UPDATE envios_realizados SET enviado_em = ?", (antigo,))
+    assert ledger.buscar("100", BARCODE, 7) is None
+
+def test_janela_zero_desativa(tmp_path):
+    ledger = SendLedger(str(tmp_path / "envios.db"), window_hours=0)
+    ledger.registrar("100", BARCODE, 7, "Sucesso!", [])
+    assert ledger.buscar("100", BARCODE, 7) is None
+
+def test_envio_identico_nao_chama_o_totvs_de_novo(totvs):
+    sucesso, mensagem, _ = soap_service.enviar_dados_soap("100", LINHA, idpgto="7")
+    assert sucesso and mensagem == "Sucesso!"
+    assert len(totvs) == 1
+    assert "<IPTE>" in totvs[0] and "<IDPGTO>7</IDPGTO>" in totvs[0]
+
+    sucesso, mensagem, logs = soap_service.enviar_dados_soap("100", LINHA.replace(" ", ""), idpgto="7")
+    assert sucesso and "já enviado em" in mensagem
+    assert any("TOTVS não foi chamado" in linha for linha in logs)
+    assert len(totvs) == 1
+
+    # Outro IDPGTO é outro envio; force ignora o registro
+    assert soap_service.enviar_dados_soap("100", LINHA, idpgto="8")[0]
+    assert soap_service.enviar_dados_soap("100", LINHA, idpgto="7", force=True)[0]
+    assert len(totvs) == 3
+
+def test_envio_rejeitado_localmente_nao_chama_o_totvs(totvs, ledger):
+    sucesso, mensagem, _ = soap_service.enviar_dados_soap("100", "123", idpgto="7")
+    assert not sucesso and "dígitos" in mensagem
+    assert totvs == []
+    assert ledger.buscar("100", "123", 7) is None
+
+def test_reserva_bloqueia_envio_identico_ate_liberar(ledger):
+    assert ledger.reservar("100", LINHA, 7, validade_s=60)
+    assert not ledger.reservar("100", LINHA.replace(" ", ""), "7", validade_s=60)
+    assert ledger.reservar("100", LINHA, 8, validade_s=60)
+    ledger.liberar("100", LINHA, 7)
+    assert ledger.reservar("100", LINHA, 7, validade_s=60)
+
+def test_reserva_expirada_e_descartada(ledger):
+    assert ledger.reservar("100", BARCODE, 7, validade_s=60)
+    antigo = (datetime.now() - timedelta(minutes=5)).isoformat(timespec="seconds")
+    with sqlite3.connect(ledger.db_path) as conn:
+        conn.execute("UPDATE envios_em_andamento SET iniciado_em = ?", (antigo,))
+    assert ledger.reservar("100", BARCODE, 7, validade_s=60)
+
+def _enviar_em_paralelo(n, *args, **kwargs):
+    resultados = [None] * n
+    def enviar(i):
+        resultados[i] = soap_service.enviar_dados_soap(*args, **kwargs)
+    threads = [threading.Thread(target=enviar, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    return resultados
+
+def test_envios_identicos_simultaneos_chamam_o_totvs_uma_vez(totvs):
+    _StubSaveRecord.atraso = 0.5
+    resultados = _enviar_em_paralelo(2, "100", LINHA, idpgto="7")
+    assert len(totvs) == 1
+    assert all(sucesso for sucesso, _, _ in resultados)
+    assert sorted(mensagem == "Sucesso!" for _, mensagem, _ in resultados) == [False, True]
+    assert any("já enviado em" in mensagem for _, mensagem, _ in resultados)
+
+def test_falha_libera_a_reserva_para_o_envio_seguinte(totvs, ledger):
+    _StubSaveRecord.atraso = 0.5
+    _StubSaveRecord.falhas = 1
+    resultados = _enviar_em_paralelo(2, "100", LINHA, idpgto="7")
+    # O primeiro falha; o que estava aguardando envia de novo e registra o sucesso
+    assert len(totvs) == 2
+    assert sorted(sucesso for sucesso, _, _ in resultados) == [False, True]
+    assert ledger.buscar("100", LINHA, 7) is not None
+    assert ledger.reservar("100", LINHA, 7, validade_s=60)
@@ -0,0 +1,111 @@
+"""Fila local de envios ao TOTVS (SendOutbox) sobre um SQLite temporário, com o envio simulado."""
+import threading
+import time
+
+import pytest
+
+from app.processing import send_outbox
+from app.processing.send_outbox import (
+    STATUS_CONCLUIDO, STATUS_ENVIANDO, STATUS_ERRO, STATUS_PENDENTE, SendOutbox
+)
+
+LINHA = "34196604897647593824721948924119698000000885540"
+
+class _EnvioFalso:
+    """Substitui enviar_dados_soap: registra as chamadas e falha para o IDLAN "erro"."""
+    def __init__(self):
+        self.chamadas = []
+        self._lock = threading.Lock()
+
+    def __call__(self, idlan, ipte, idpgto=None, cnpj=None, origem_deteccao=None, force=False, tag=None):
+        with self._lock:
+            self.chamadas.append((idlan, ipte, idpgto, cnpj, origem_deteccao, force, tag))
+        if idlan == "erro":
+            return False, "Erro: recusado", ["recusado"]
+        return True, "Sucesso!", ["ok"]
+
+@pytest.fixture
+def envio(monkeypatch):
+    falso = _EnvioFalso()
+    monkeypatch.setattr(send_outbox, "enviar_dados_soap", falso)
+    return falso
+
+def _outbox(tmp_path):
+    return SendOutbox(str(tmp_path / "outbox.db"), max_concurrency=2, rate_per_second=0, poll_interval=0.05)
+
+def _aguardar(outbox, send_ids, timeout=10):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        envios = [outbox.obter(send_id) for send_id in send_ids]
+        if all(e["status"] in (STATUS_CONCLUIDO, STATUS_ERRO) for e in envios):
+            return envios
+        time.sleep(0.02)
+    raise AssertionError("Envios não concluídos no prazo")
+
+def test_enfileirar_grava_o_envio_pendente(tmp_path):
+    outbox = _outbox(tmp_path)
+    send_id = outbox.enfileirar("100", LINHA, cnpj="11.222.333/0001-81", barcode_source="pyzbar", force=True, tag="IPTE")
+    envio = outbox.obter(send_id)
+    assert envio["status"] == STATUS_PENDENTE
+    assert envio["force"] == 1 and envio["tag"] == "IPTE"
+    assert envio["success"] is None and envio["logs"] == []
+    assert outbox.obter("inexistente") is None
+
+def test_despachante_envia_cada_item_uma_vez(tmp_path, envio):
+    outbox = _outbox(tmp_path)
+    send_ids = [outbox.enfileirar(str(100 + n), LINHA, idpgto="7") for n in range(5)]
+    send_ids.append(outbox.enfileirar("erro", LINHA, idpgto="7"))
+    outbox.iniciar()
+    try:
+        envios = _aguardar(outbox, send_ids)
+    finally:
+        outbox.parar()
+
+    assert [e["status"] for e in envios] == [STATUS_CONCLUIDO] * 5 + [STATUS_ERRO]
+    assert envios[0]["success"] is True and envios[0]["logs"] == ["ok"]
+    assert envios[-1]["success"] is False and envios[-1]["message"] == "Erro: recusado"
+    assert sorted(chamada[0] for chamada in envio.chamadas) == ["100", "101", "102", "103", "104", "erro"]
+
+def test_envio_interrompido_volta_para_a_fila(tmp_path, envio):
+    anterior = _outbox(tmp_path)
+    send_id = anterior.enfileirar("100", LINHA, idpgto="7", tag="IPTE")
+    # O processo caiu depois de reservar o envio e antes de gravar o resultado
+    assert [e["send_id"] for e in anterior._reservar_pendentes(10)] == [send_id]
+    assert anterior.obter(send_id)["status"] == STATUS_ENVIANDO
+
+    outbox = _outbox(tmp_path)
+    outbox.iniciar()
+    try:
+        (resultado,) = _aguardar(outbox, [send_id])
+    finally:
+        outbox.parar()
+    assert resultado["status"] == STATUS_CONCLUIDO
+    assert resultado["tentativas"] == 2
+    assert envio.chamadas == [("100", LINHA, "7", None, None, False, "IPTE")]
+
+def test_reserva_nao_entrega_o_mesmo_envio_a_dois_despachantes(tmp_path):
+    primeiro, segundo = _outbox(tmp_path), _outbox(tmp_path)
+    send_ids = {primeiro.enfileirar(str(n), LINHA, idpgto="7") for n in range(40)}
+    barreira = threading.Barrier(2)
+    reservados = {}
+
+    def reservar(nome, outbox):
+        barreira.wait()
+        ids = []
+        while True:
+            lote = outbox._reservar_pendentes(3)
+            if not lote:
+                break
+            ids.extend(e["send_id"] for e in lote)
+        reservados[nome] = ids
+
+    threads = [threading.Thread(target=reservar, args=(nome, outbox))
+               for nome, outbox in (("primeiro", primeiro), ("segundo", segundo))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    todos = reservados["primeiro"] + reservados["segundo"]
+    assert len(todos) == len(set(todos)) == 40
+    assert set(todos) == send_ids
@@ -0,0 +1,41 @@
+"""Validação local dos envios ao TOTVS (validar_envio_local), sem chamadas de rede."""
+import pytest
+
+from app.processing.soap_service import TAG_CODIGO_BARRAS, TAG_IPTE, validar_envio_local
+
+BARCODE = "34196980000008855406604876475938242194892411"
+LINHA = "34196.60489 76475.938247 21948.924119 6 98000000885540"
+
+@pytest.mark.parametrize("codigo, origem, tag_esperada", [
+    (BARCODE, "pyzbar", TAG_CODIGO_BARRAS),
+    (BARCODE, "texto", TAG_CODIGO_BARRAS),
+    (LINHA, "pyzbar", TAG_IPTE),
+    (LINHA, "ocr", TAG_IPTE),
+])
+def test_tag_vem_do_tamanho_do_codigo(codigo, origem, tag_esperada):
+    erro, tag, idpgto = validar_envio_local(codigo, idpgto="123", origem_deteccao=origem)
+    assert erro is None
+    assert tag == tag_esperada
+    assert idpgto == 123
+
+@pytest.mark.parametrize("codigo, tag", [(BARCODE, "codigobarra"), (LINHA, "IPTE")])
+def test_tag_explicita_compativel(codigo, tag):
+    assert validar_envio_local(codigo, idpgto="123", tag=tag)[0] is None
+
+@pytest.mark.parametrize("codigo, tag", [(BARCODE, "IPTE"), (LINHA, "CODIGOBARRA"), (LINHA, "OUTRA")])
+def test_tag_explicita_incompativel_e_rejeitada(codigo, tag):
+    erro, _, _ = validar_envio_local(codigo, idpgto="123", tag=tag)
+    assert "incompatível" in erro
+
+def test_codigo_invalido_e_rejeitado():
+    assert "dígitos" in validar_envio_local("123", idpgto="1")[0]
+    digito_errado = BARCODE[:4] + ("0" if BARCODE[4] != "0" else "1") + BARCODE[5:]
+    assert "inválido" in validar_envio_local(digito_errado, idpgto="1")[0]
+
+def test_sem_resolver_cnpj_adia_a_busca_do_idpgto():
+    logs = []
+    erro, _, idpgto = validar_envio_local(LINHA, cnpj="11.222.333/0001-81", logs=logs, resolver_cnpj=False)
+    assert erro is None and idpgto is None
+    assert any("resolvido pelo CNPJ" in linha for linha in logs)
+    assert "CNPJ/CPF inválido" in validar_envio_local(LINHA, cnpj="123", resolver_cnpj=False)[0]
+    assert "IDPGTO não disponível" in validar_envio_local(LINHA, resolver_cnpj=False)[0]
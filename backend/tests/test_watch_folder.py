@@ -0,0 +1,108 @@
+"""WatchFolderDaemon com observador por polling: debounce, novas tentativas e destino dos arquivos."""
+import builtins
+import threading
+import time
+
+import pytest
+
+from app.processing import watch_folder
+from app.processing.duplicate_index import DuplicateIndex
+from app.processing.memory_budget import STATUS_ADIADO
+from app.processing.processing_ledger import ProcessingLedger
+
+DEBOUNCE = 0.5
+
+def _esperar(condicao, timeout: float = 15):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if condicao():
+            return True
+        time.sleep(0.05)
+    return False
+
+@pytest.fixture
+def chamadas(monkeypatch, tmp_path):
+    """processar_com_prazo simulado: o status de cada arquivo vem de `respostas` (lista consumida por chamada)."""
+    registro = {"chamadas": [], "respostas": {}}
+
+    def processar(content, filename):
+        registro["chamadas"].append((filename, content, time.monotonic()))
+        respostas = registro["respostas"].get(filename) or ["Processado"]
+        status = respostas.pop(0) if len(respostas) > 1 else respostas[0]
+        return {"filename": filename, "status": status, "error": None if status == "Processado" else f"{status}."}
+
+    monkeypatch.setattr(watch_folder, "processar_com_prazo", processar)
+    monkeypatch.setattr(watch_folder, "processing_ledger", ProcessingLedger(str(tmp_path / "ledger.db"), flush_interval=0.05))
+    monkeypatch.setattr(watch_folder, "duplicate_index", DuplicateIndex(str(tmp_path / "duplicados.db"), 1000, 0.01, 100))
+    return registro
+
+@pytest.fixture
+def pasta(tmp_path, chamadas):
+    pasta = tmp_path / "scanner"
+    pasta.mkdir()
+    daemon = watch_folder.WatchFolderDaemon([str(pasta)], "processados", "erros", str(tmp_path / "resultados.csv"),
+                                            DEBOUNCE, max_workers=2, polling=True)
+    thread = threading.Thread(target=daemon.executar, daemon=True)
+    thread.start()
+    assert _esperar(lambda: daemon._observer is not None)
+    yield pasta
+    daemon._stop.set()
+    thread.join(15)
+
+def test_arquivo_so_e_processado_depois_de_parar_de_crescer(pasta, chamadas):
+    arquivo = pasta / "boleto.pdf"
+    with open(arquivo, "wb") as f:
+        for parte in range(5):
+            f.write(b"%%PDF parte %d\n" % parte)
+            f.flush()
+            ultima_escrita = time.monotonic()
+            time.sleep(DEBOUNCE / 2)
+
+    assert _esperar(lambda: (pasta / "processados" / "boleto.pdf").exists())
+    assert len(chamadas["chamadas"]) == 1
+    filename, content, instante = chamadas["chamadas"][0]
+    assert filename == "boleto.pdf"
+    assert content.count(b"%PDF parte") == 5
+    assert instante - ultima_escrita >= DEBOUNCE
+    assert not arquivo.exists()
+
+def test_resultado_com_erro_vai_para_erros(pasta, chamadas):
+    chamadas["respostas"]["ruim.pdf"] = ["Erro"]
+    (pasta / "ruim.pdf").write_bytes(b"%PDF")
+    (pasta / "notas.txt").write_bytes(b"ignorado")
+
+    assert _esperar(lambda: (pasta / "erros" / "ruim.pdf").exists())
+    assert [filename for filename, _, _ in chamadas["chamadas"]] == ["ruim.pdf"]
+    assert (pasta / "notas.txt").exists()
+
+def test_documento_adiado_e_processado_de_novo(pasta, chamadas):
+    chamadas["respostas"]["grande.pdf"] = [STATUS_ADIADO, "Processado"]
+    (pasta / "grande.pdf").write_bytes(b"%PDF")
+
+    assert _esperar(lambda: (pasta / "processados" / "grande.pdf").exists())
+    assert [filename for filename, _, _ in chamadas["chamadas"]] == ["grande.pdf", "grande.pdf"]
+    # A nova tentativa também espera o debounce
+    assert chamadas["chamadas"][1][2] - chamadas["chamadas"][0][2] >= DEBOUNCE
+
+def test_arquivo_bloqueado_e_lido_depois(monkeypatch, pasta, chamadas):
+    bloqueios = {"restantes": 2}
+
+    def abrir(path, *args, **kwargs):
+        if str(path).endswith("bloqueado.pdf") and bloqueios["restantes"]:
+            bloqueios["restantes"] -= 1
+            raise PermissionError(13, "Arquivo em uso por outro processo", str(path))
+        return builtins.open(path, *args, **kwargs)
+
+    monkeypatch.setattr(watch_folder, "open", abrir, raising=False)
+    (pasta / "bloqueado.pdf").write_bytes(b"%PDF")
+
+    assert _esperar(lambda: (pasta / "processados" / "bloqueado.pdf").exists())
+    assert bloqueios["restantes"] == 0
+    assert len(chamadas["chamadas"]) == 1
+
+def test_nome_repetido_nao_sobrescreve_o_processado(pasta, chamadas):
+    (pasta / "boleto.pdf").write_bytes(b"%PDF 1")
+    assert _esperar(lambda: (pasta / "processados" / "boleto.pdf").exists())
+    (pasta / "boleto.pdf").write_bytes(b"%PDF 2")
+    assert _esperar(lambda: len(list((pasta / "processados").glob("boleto_*.pdf"))) == 1)
+    assert (pasta / "processados" / "boleto.pdf").read_bytes() == b"%PDF 1"